@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+# Pythonのオブジェクトとモジュールの属性のベンチマーク
+# 組み込み型のメソッド、モジュールの関数の呼び出しと、モジュールの定数の読み込みの
+# 一回あたりの実行時間を実行モードごとに比較する（比較のためにテーブルのメソッドの呼び出しも計測する）
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                 '..', 'lagoon')))
+
+import lagoon
+import interpreter
+import syntaxtree
+
+SETUP = '''
+math = import('math')
+items = py.list()
+counts = py.dict()
+text = 'lagoon'
+entity = [move = {dx -> return dx}]
+'''
+
+# 計測する文（{}は一回の計測での回数に置き換える）
+CASES = [
+    ('list', 'times {}:\n    items.append(1)\n;\nitems.clear()\n'),
+    ('dict', 'times {}:\n    counts.get(1, 0)\n;\n'),
+    ('str', 'times {}:\n    text.upper()\n;\n'),
+    ('module func', 'times {}:\n    math.sqrt(2)\n;\n'),
+    ('module const', 'times {}:\n    math.pi\n;\n'),
+    ('table', 'times {}:\n    entity.move(1)\n;\n'),
+]
+
+
+def measure(it, code, runs):
+    program = syntaxtree.lower(lagoon.parse(code))
+    results = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        lagoon.exec_node(program, it)
+        results.append(time.perf_counter() - start)
+    return statistics.median(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='LagoonからのPythonのオブジェクトの属性の参照の速度を計測する')
+    parser.add_argument('--runs', type=int, default=5, help='計測の回数')
+    parser.add_argument('--times', type=int, default=20000, help='一回の計測での回数')
+    parser.add_argument('--modes', nargs='+', default=['tree', 'closure'], help='実行モード')
+    args = parser.parse_args()
+
+    interpreters = {}
+    for mode in args.modes:
+        it = interpreter.LagoonFileInterpreter(os.path.abspath('<bench>'), mode=mode)
+        lagoon.exec_(SETUP, it)
+        interpreters[mode] = it
+
+    print('{:<14}'.format('case') + ''.join('{:>14}'.format(mode + ' (us)') for mode in args.modes))
+    for label, code in CASES:
+        print('{:<14}'.format(label) + ''.join(
+            '{:>14.3f}'.format(measure(interpreters[mode], code.format(args.times), args.runs)
+                               / args.times * 1e6)
+            for mode in args.modes))
+
+
+if __name__ == '__main__':
+    main()
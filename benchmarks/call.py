@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+# 関数呼び出しのベンチマーク
+# 小さな関数を繰り返し呼び出すループの実行時間を、フレームを再利用する現在の呼び出しと、
+# 呼び出しごとに名前空間とインタプリタを作り直す以前の呼び出しとで比較する
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                 '..', 'lagoon')))
+
+import lagoon
+import interpreter
+import syntaxtree
+
+SETUP = '''
+add = {a, b -> a + b}
+inc = {a, b=1 -> a + b}
+noargs = {0}
+entity = [
+    x = 0
+    move = {dx -> @x += dx}
+]
+'''
+
+# 呼び出す式（{}は関数を参照する式に置き換える）
+CASES = [
+    ('positional', 'add', '{}(1, 2)'),
+    ('default', 'inc', '{}(1)'),
+    ('keyword', 'inc', '{}(1, b=2)'),
+    ('no args', 'noargs', '{}()'),
+    ('method', 'entity.move', '{}(1)'),
+]
+
+
+class LegacyFunction(interpreter.LagoonFunction):
+
+    """以前の呼び出しを行う関数"""
+
+    def __init__(self, function):
+        signature = function.signature
+        self.block_node = function.block_node
+        self.arg_names = signature.arg_names
+        self.static_defaults = signature.static_defaults
+        self.dynamic_defaults = signature.dynamic_defaults
+        self.interpreter = function.interpreter
+
+    def __call__(self, *args, **kwargs):
+        arg_namespace = {}
+        arg_namespace.update(self.static_defaults)
+        arg_namespace.update({k: self.interpreter.run(v)
+                              for k, v in self.dynamic_defaults.items()})
+        arg_namespace.update(zip(self.arg_names, args))
+        arg_namespace.update(kwargs)
+        arg_namespace['args'] = args
+        arg_namespace['current'] = kwargs.get('current', None)
+        namespaces = self.interpreter.namespaces + [arg_namespace]
+        frame = interpreter.LagoonInterpreter(namespaces, self.interpreter.mode)
+        result = frame.run(self.block_node)
+        if result is interpreter.EXIT:
+            return frame.exit_value()
+        else:
+            return result
+
+    def call_method(self, current, args, kwargs):
+        # 以前はfunctools.partialでcurrentをキーワード引数として束縛していた
+        return self(*args, current=current, **kwargs)
+
+
+def legacy_copy(it, legacy_it, name):
+    """
+    legacy_itのnameの関数を以前の呼び出しを行う関数に置き換えたテーブルまたは関数を
+    itへ加え、その名前を返す
+    """
+    if '.' not in name:
+        it.valid_namespace['legacy_' + name] = LegacyFunction(legacy_it.valid_namespace[name])
+        return 'legacy_' + name
+    table_name, attr_name = name.split('.')
+    table = legacy_it.valid_namespace[table_name]
+    legacy_table = interpreter.LagoonTable(**vars(table))
+    # テーブルの名前空間にある（currentを束縛する前の）関数を包む
+    setattr(legacy_table, attr_name, LegacyFunction(vars(table)[attr_name]))
+    it.valid_namespace['legacy_' + table_name] = legacy_table
+    return 'legacy_' + name
+
+
+def measure(it, code, runs):
+    program = syntaxtree.lower(lagoon.parse(code))
+    results = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        lagoon.exec_node(program, it)
+        results.append(time.perf_counter() - start)
+    return statistics.median(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Lagoonの関数呼び出しの速度を計測する')
+    parser.add_argument('--runs', type=int, default=5, help='計測の回数')
+    parser.add_argument('--calls', type=int, default=20000, help='一回の計測での呼び出しの回数')
+    parser.add_argument('--modes', nargs='+', default=['tree', 'closure'], help='実行モード')
+    args = parser.parse_args()
+
+    print('{:<8} {:<12} {:>13} {:>13} {:>8}'.format(
+        'mode', 'case', 'legacy (us)', 'frames (us)', 'speedup'))
+    for mode in args.modes:
+        it = interpreter.LagoonFileInterpreter(os.path.abspath('<bench>'), mode=mode)
+        lagoon.exec_(SETUP, it)
+        # 以前の呼び出しは名前で参照するので、名前を解決しない構文木から関数を作る
+        legacy_it = interpreter.LagoonFileInterpreter(os.path.abspath('<bench>'), mode=mode)
+        lagoon.exec_node(syntaxtree.lower(lagoon.parse(SETUP)), legacy_it)
+        for label, name, call in CASES:
+            loop = 'times {}:\n    {}\n;\n'
+            legacy = measure(it, loop.format(args.calls, call.format(legacy_copy(it, legacy_it, name))),
+                             args.runs)
+            frames = measure(it, loop.format(args.calls, call.format(name)), args.runs)
+            print('{:<8} {:<12} {:>13.2f} {:>13.2f} {:>7.1f}x'.format(
+                mode, label, legacy / args.calls * 1e6, frames / args.calls * 1e6, legacy / frames))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+# 内包表記のベンチマーク
+# 大きな列に対するシーケンス・マッピングの内包表記とジェネレータの一回あたりの実行時間を
+# 実行モードごとに比較する（大域の内包表記と、関数の中の内包表記）
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                 '..', 'lagoon')))
+
+import lagoon
+import interpreter
+import resolver
+import syntaxtree
+
+# {}は列の長さに置き換える
+SETUP = '''
+xs = py.list(py.range({}))
+scale = {{n -> return [i * n for i in xs]}}
+pairs = {{-> return [k: v for k, v in py.enumerate(xs)]}}
+'''
+
+# 計測する文
+CASES = [
+    ('list', 'r = [i * 2 for i in xs]'),
+    ('filter', 'r = [i in xs if i mod 2 == 0]'),
+    ('tuple', 'r = t[i + 1 for i in xs]'),
+    ('set', 'r = s[i mod 1000 for i in xs]'),
+    ('dict', 'r = [i: i for i in xs]'),
+    ('generator', 'r = py.sum(g[i for i in xs])'),
+    ('function', 'r = scale(3)'),
+    ('unpack', 'r = pairs()'),
+]
+
+
+def measure(it, code, runs):
+    # ファイルの大域と同じく名前を解決する
+    program = resolver.resolve(syntaxtree.lower(lagoon.parse(code)))
+    results = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        lagoon.exec_node(program, it)
+        results.append(time.perf_counter() - start)
+    return statistics.median(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Lagoonの内包表記の速度を計測する')
+    parser.add_argument('--runs', type=int, default=7, help='計測の回数')
+    parser.add_argument('--size', type=int, default=10 ** 5, help='列の長さ')
+    parser.add_argument('--modes', nargs='+', default=['tree', 'closure', 'stack'], help='実行モード')
+    args = parser.parse_args()
+
+    interpreters = {}
+    for mode in args.modes:
+        it = interpreter.LagoonFileInterpreter(os.path.abspath('<bench>'), mode=mode)
+        lagoon.exec_(SETUP.format(args.size), it)
+        interpreters[mode] = it
+
+    print('{:<12}'.format('case') + ''.join('{:>14}'.format(mode + ' (ms)') for mode in args.modes))
+    for label, code in CASES:
+        print('{:<12}'.format(label) + ''.join(
+            '{:>14.1f}'.format(measure(interpreters[mode], code, args.runs) * 1000)
+            for mode in args.modes))
+
+
+if __name__ == '__main__':
+    main()
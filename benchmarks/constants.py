@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+# 定数の畳み込みのベンチマーク
+# リテラルだけからなる式の一回あたりの評価時間を、畳み込みを無効にした場合（off）と
+# 有効にした場合（on）とで実行モードごとに比較する（リストは畳み込まない比較の対象）
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                 '..', 'lagoon')))
+
+import lagoon
+import interpreter
+import optimizer
+import syntaxtree
+
+# 計測する式
+CASES = [
+    ('float mul', '3.14 * 2'),
+    ('negative', '-1'),
+    ('power', '2 pow 10'),
+    ('concat', "'foo' + 'bar'"),
+    ('nested', '(1 + 2) * (3 + 4) < 100'),
+    ('tuple', 't[1, 2, 3]'),
+    ('frozenset', 'f[1, 2, 3]'),
+    ('list', '[1, 2, 3]'),
+]
+
+# 計測する文（{0}は一回の計測での回数、{1}は式に置き換える）
+LOOP = 'times {0}:\n    x = {1}\n;\n'
+
+
+def measure(it, code, runs, enabled):
+    optimizer.enabled = enabled
+    program = optimizer.optimize(syntaxtree.lower(lagoon.parse(code)))
+    results = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        lagoon.exec_node(program, it)
+        results.append(time.perf_counter() - start)
+    return statistics.median(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Lagoonの定数の畳み込みの効果を計測する')
+    parser.add_argument('--runs', type=int, default=5, help='計測の回数')
+    parser.add_argument('--times', type=int, default=20000, help='一回の計測での回数')
+    parser.add_argument('--modes', nargs='+', default=['tree', 'closure'], help='実行モード')
+    args = parser.parse_args()
+
+    interpreters = {mode: interpreter.LagoonFileInterpreter(os.path.abspath('<bench>'), mode=mode)
+                    for mode in args.modes}
+
+    print('{:<12}'.format('case (us)') + ''.join(
+        '{:>14}'.format('{} {}'.format(mode, setting))
+        for mode in args.modes for setting in ('off', 'on')))
+    for label, expression in CASES:
+        code = LOOP.format(args.times, expression)
+        print('{:<12}'.format(label) + ''.join(
+            '{:>14.3f}'.format(measure(interpreters[mode], code, args.runs, enabled)
+                               / args.times * 1e6)
+            for mode in args.modes for enabled in (False, True)))
+
+
+if __name__ == '__main__':
+    main()
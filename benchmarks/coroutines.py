@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+# 非同期関数のベンチマーク
+# awaitによる切り替え、待ち時間のある非同期関数を順に待つ場合とgatherで並行して待つ場合、
+# ローカルのエコーサーバーへの並行した問い合わせの一回あたりの実行時間を実行モードごとに比較する
+# 各モードの計測は、--asyncと同じくイベントループの上で行う
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                 '..', 'lagoon')))
+
+import lagoon
+import coroutines
+import interpreter
+import resolver
+import syntaxtree
+
+# {delay}は非同期関数napの待ち時間に置き換える
+SETUP = '''
+aio = import("asyncio")
+nap = async {{-> await sleep({delay})}}
+echo = async {{reader, writer ->
+    writer.write(await reader.readline())
+    await writer.drain()
+    writer.close()
+}}
+server = await aio.start_server(echo, "127.0.0.1", 0)
+port = (server.sockets!0).getsockname()!1
+ask = async {{->
+    conn = await aio.open_connection("127.0.0.1", port)
+    (conn!1).write(b"ping\\n")
+    reply = await (conn!0).readline()
+    (conn!1).close()
+    return reply
+}}
+'''
+
+# 計測する文（{count}は回数に置き換える）
+CASES = [
+    ('switch', 'times {count}: await sleep(0) ;'),
+    ('sequential', 'times {count}: await nap() ;'),
+    ('gather', 'r = await gather([nap() for _ in 0..<{count}])'),
+    ('echo', 'r = await gather([ask() for _ in 0..<{count}])'),
+]
+
+
+def measure(it, code, runs):
+    # ファイルの大域と同じく名前を解決する
+    program = resolver.resolve(syntaxtree.lower(lagoon.parse(code)))
+    results = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        lagoon.exec_node(program, it)
+        results.append(time.perf_counter() - start)
+    return statistics.median(results)
+
+
+def run_mode(mode, args):
+    """一つの実行モードの計測（イベントループの上で実行される）"""
+    it = interpreter.LagoonFileInterpreter(os.path.abspath('<bench>'), mode=mode)
+    lagoon.exec_(SETUP.format(delay=args.delay), it)
+    return [measure(it, code.format(count=args.count), args.runs) for _, code in CASES]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Lagoonの非同期関数の速度を計測する')
+    parser.add_argument('--runs', type=int, default=5, help='計測の回数')
+    parser.add_argument('--count', type=int, default=100, help='awaitや問い合わせの回数')
+    parser.add_argument('--delay', type=float, default=0.001, help='非同期関数napの待ち時間（秒）')
+    parser.add_argument('--modes', nargs='+', default=['tree', 'closure', 'stack'], help='実行モード')
+    args = parser.parse_args()
+
+    results = {mode: coroutines.run(run_mode, mode, args) for mode in args.modes}
+
+    print('{:<12}'.format('case') + ''.join('{:>14}'.format(mode + ' (ms)') for mode in args.modes))
+    for index, (label, _) in enumerate(CASES):
+        print('{:<12}'.format(label) + ''.join(
+            '{:>14.1f}'.format(results[mode][index] * 1000) for mode in args.modes))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+# ループのベンチマーク
+# times, for, while文と、continue, break, returnでループを抜ける処理の一周あたりの実行時間を
+# 実行モードごとに比較する（関数の中のループはスロットへ、大域のループは名前空間へ代入する）
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                 '..', 'lagoon')))
+
+import lagoon
+import interpreter
+import syntaxtree
+
+SETUP = '''
+count_times = {n ->
+    total = 0
+    times n:
+        total += 1
+    ;
+    return total
+}
+sum_range = {n ->
+    total = 0
+    for i in 1..n:
+        total += i
+    ;
+    return total
+}
+count_while = {n ->
+    i = 0
+    while n > i:
+        i += 1
+    ;
+    return i
+}
+sum_odd = {n ->
+    total = 0
+    for i in 1..n:
+        if i mod 2 == 0:
+            continue
+        ;
+        total += i
+    ;
+    return total
+}
+nested_break = {n ->
+    total = 0
+    for i in 1..n:
+        for j in 1..3:
+            if j == 2:
+                break
+            ;
+            total += j
+        ;
+    ;
+    return total
+}
+leave_both = {n ->
+    total = 0
+    times n:
+        while true:
+            while true:
+                break 2
+            ;
+        ;
+        total += 1
+    ;
+    return total
+}
+find = {n ->
+    for i in 1..n:
+        if i == n:
+            return i
+        ;
+    ;
+}
+'''
+
+# 計測する式（{}は一回の計測での周回の数に置き換える）
+CASES = [
+    ('times', 'count_times({})'),
+    ('for range', 'sum_range({})'),
+    ('while', 'count_while({})'),
+    ('continue', 'sum_odd({})'),
+    ('break', 'nested_break({})'),
+    ('break 2', 'leave_both({})'),
+    ('return', 'find({})'),
+    ('global for', 'total = 0\nfor i in 1..{}:\n    total += i\n;\n'),
+]
+
+
+def measure(it, code, runs):
+    program = syntaxtree.lower(lagoon.parse(code))
+    results = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        lagoon.exec_node(program, it)
+        results.append(time.perf_counter() - start)
+    return statistics.median(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Lagoonのループの速度を計測する')
+    parser.add_argument('--runs', type=int, default=5, help='計測の回数')
+    parser.add_argument('--iterations', type=int, default=20000, help='一回の計測での周回の数')
+    parser.add_argument('--modes', nargs='+', default=['tree', 'closure', 'stack'], help='実行モード')
+    args = parser.parse_args()
+
+    interpreters = {}
+    for mode in args.modes:
+        it = interpreter.LagoonFileInterpreter(os.path.abspath('<bench>'), mode=mode)
+        lagoon.exec_(SETUP, it)
+        interpreters[mode] = it
+
+    print('{:<12}'.format('case') + ''.join('{:>14}'.format(mode + ' (us)') for mode in args.modes))
+    for label, code in CASES:
+        print('{:<12}'.format(label) + ''.join(
+            '{:>14.3f}'.format(measure(interpreters[mode], code.format(args.iterations), args.runs)
+                               / args.iterations * 1e6)
+            for mode in args.modes))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+# 並列実行のベンチマーク
+# CPUを使う関数を列の要素ごとに呼び出す一回あたりの実行時間を、
+# 逐次のmapと、pmap・parallel forとで実行モードごとに比較する
+# ワーカーの数は環境変数LAGOON_WORKERSで変えられる
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                 '..', 'lagoon')))
+
+import lagoon
+import interpreter
+import parallel
+import resolver
+import syntaxtree
+
+# {0}は要素の数、{1}は要素ごとの反復の回数に置き換える
+SETUP = '''
+xs = py.list(py.range({0}))
+work = {{n ->
+    s = 0
+    for i in py.range({1}):
+        s = s + (i * n) mod 7
+    ;
+    return s
+}}
+'''
+
+# 計測する文
+CASES = [
+    ('map', 'r = py.list(map(work, xs))'),
+    ('pmap', 'r = pmap(work, xs)'),
+    ('parallel', 'parallel for x in xs: work(x) ;'),
+]
+
+
+def measure(it, code, runs):
+    # ファイルの大域と同じく名前を解決する
+    program = resolver.resolve(syntaxtree.lower(lagoon.parse(code)))
+    # プロセスプールの起動を計測に含めない
+    lagoon.exec_node(program, it)
+    results = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        lagoon.exec_node(program, it)
+        results.append(time.perf_counter() - start)
+    return statistics.median(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Lagoonの並列実行の速度を計測する')
+    parser.add_argument('--runs', type=int, default=5, help='計測の回数')
+    parser.add_argument('--size', type=int, default=64, help='要素の数')
+    parser.add_argument('--work', type=int, default=10 ** 4, help='要素ごとの反復の回数')
+    parser.add_argument('--modes', nargs='+', default=['tree', 'closure', 'stack'], help='実行モード')
+    args = parser.parse_args()
+
+    interpreters = {}
+    for mode in args.modes:
+        it = interpreter.LagoonFileInterpreter(os.path.abspath('<bench>'), mode=mode)
+        lagoon.exec_(SETUP.format(args.size, args.work), it)
+        interpreters[mode] = it
+
+    print('workers: {}'.format(parallel.workers))
+    print('{:<12}'.format('case') + ''.join('{:>14}'.format(mode + ' (ms)') for mode in args.modes))
+    for label, code in CASES:
+        print('{:<12}'.format(label) + ''.join(
+            '{:>14.1f}'.format(measure(interpreters[mode], code, args.runs) * 1000)
+            for mode in args.modes))
+
+
+if __name__ == '__main__':
+    main()
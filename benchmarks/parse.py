@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+# 構文解析のベンチマーク
+# 深く入れ子になった式の解析に要する時間を、演算子順位法による解析（現在の文法）と
+# 演算子の段を順序付き選択で書いた以前の文法とで比較する
+# 両者の構文木が一致しなければ終了コード1で終わる
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                 '..', 'lagoon')))
+
+import lagoon
+import parsecache
+
+# 以前の文法の演算子の段
+LADDER = r'''
+_ope3 = pow / _ope2a
+    pow = _ope2a Z* "pow" Z* _ope3
+
+_ope4 = pos / neg / _ope3
+    pos = "+" Z* _ope4
+    neg = "-" Z* _ope4
+
+_ope5 = mul / truediv / mod / _ope4
+    mul = _ope4 Z* "*" Z* _ope5
+    truediv = _ope4 Z* "/" Z* _ope5
+    mod = _ope4 Z* "mod" Z* _ope5
+
+_ope6 = add / sub / _ope5
+    add = _ope5 Z* "+" Z* _ope6
+    sub = _ope5 Z* "-" Z* _ope6
+
+_ope7 = lt / le / eq / ne / ge / gt / _ope6
+    lt = _ope6 Z* "<" Z* _ope7
+    le = _ope6 Z* "<=" Z* _ope7
+    eq = _ope6 Z* "==" Z* _ope7
+    ne = _ope6 Z* "!=" Z* _ope7
+    ge = _ope6 Z* ">=" Z* _ope7
+    gt = _ope6 Z* ">" Z* _ope7
+
+_ope8 = is_ / contains / isa / _ope7
+    is_ = _ope7 Z+ "is" Z+ _ope8
+    contains = _ope7 Z+ "in" Z+ _ope8
+    isa = _ope7 Z+ "isa" Z+ _ope8
+
+_ope9 = not_ / _ope8
+    not_ = "not" Z+ _ope9
+
+_ope10 = and_ / or_ / _ope9
+    and_ = _ope9 Z+ "and" Z+ _ope10
+    or_ = _ope9 Z+ "or" Z+ _ope10
+
+_ope11 = one_if / _ope10
+    one_if = _ope10 Z+ "if" Z+ _ope11 Z+ "else" Z+ _ope11
+
+_ope12 = one_try / _ope11
+    one_try = _ope11 Z+ "except" Z+ _ope12 Z+ "then" Z+ _ope12
+
+_ope = _ope12 / DUMMY
+'''
+
+# 入れ子の深さを受け取ってソースを返す関数
+CASES = [
+    ('parens', lambda depth: 'x = ' + '(' * depth + '1' + ' + 1)' * depth),
+    ('calls', lambda depth: 'x = ' + 'f(' * depth + '1' + ' * 2)' * depth),
+    ('mixed', lambda depth: 'x = ' + '(-a pow 2 + ' * depth + 'b'
+                            + ' if c else d) and e' * depth),
+    ('flat', lambda depth: 'x = ' + ' + '.join('{} * {}'.format(i, i) for i in range(depth * 10))),
+]
+
+
+def measure(grammar, code, runs):
+    results = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        grammar.parse(code)
+        results.append(time.perf_counter() - start)
+    return statistics.median(results)
+
+
+def tree(grammar, code):
+    root_node = grammar.parse(code)
+    lagoon.filter_node(root_node)
+    return parsecache.dump_node(root_node)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Lagoonの構文解析の速度を計測する')
+    parser.add_argument('--runs', type=int, default=5, help='計測の回数')
+    parser.add_argument('--depths', type=int, nargs='+', default=[5, 10, 20, 40],
+                        help='式の入れ子の深さ')
+    args = parser.parse_args()
+
+    from parsimonious.grammar import Grammar
+    # 以前の文法では入れ子一段ごとに再帰が深くなる
+    sys.setrecursionlimit(100000)
+    parsecache.enabled = False
+    grammar = lagoon.load_grammar()
+    ladder_grammar = Grammar(lagoon.grammar_code + LADDER)
+
+    failed = False
+    print('{:<8} {:>6} {:>12} {:>12} {:>8}'.format('case', 'depth', 'ladder (ms)', 'pratt (ms)', 'speedup'))
+    for label, make in CASES:
+        for depth in args.depths:
+            code = make(depth)
+            if tree(grammar, code) != tree(ladder_grammar, code):
+                print('{} {}: parse trees differ'.format(label, depth))
+                failed = True
+                continue
+            ladder = measure(ladder_grammar, code, args.runs)
+            pratt = measure(grammar, code, args.runs)
+            print('{:<8} {:>6} {:>12.2f} {:>12.2f} {:>7.1f}x'.format(
+                label, depth, ladder * 1000, pratt * 1000, ladder / pratt))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
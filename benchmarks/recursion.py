@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+# 再帰のベンチマーク
+# 再帰的なアルゴリズムの実行時間と、再帰の深さの上限とを実行モードごとに比較する
+# （スタックモードでは呼び出しを明示的なスタックで行い、return文の末尾の呼び出しを除去する）
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                 '..', 'lagoon')))
+
+import lagoon
+import exceptions
+import interpreter
+import syntaxtree
+
+SETUP = '''
+fib = {n -> return n if n < 2 else fib(n - 1) + fib(n - 2)}
+ack = {m, n ->
+    if m == 0:
+        return n + 1
+    elseif n == 0:
+        return ack(m - 1, 1)
+    ;
+    return ack(m - 1, ack(m, n - 1))
+}
+tak = {x, y, z -> return z if y >= x else tak(tak(x - 1, y, z), tak(y - 1, z, x), tak(z - 1, x, y))}
+even = {n -> return true if n == 0 else odd(n - 1)}
+odd = {n -> return false if n == 0 else even(n - 1)}
+count = {n, acc -> return acc if n == 0 else count(n - 1, acc + 1)}
+depth = {n -> return 0 if n == 0 else 1 + depth(n - 1)}
+'''
+
+# 計測する式（ツリーモードの再帰の上限より浅い）
+CASES = [
+    ('fib', 'fib(20)'),
+    ('ackermann', 'ack(2, 9)'),
+    ('tak', 'tak(12, 8, 4)'),
+    ('mutual', 'even(60)'),
+    ('tail', 'count(60, 0)'),
+]
+
+# 再帰の深さの上限を調べる式（{}は深さに置き換える）
+DEPTH_CASES = [
+    ('non-tail', 'depth({})'),
+    ('tail', 'count({}, 0)'),
+]
+
+
+def measure(it, code, runs):
+    program = syntaxtree.lower(lagoon.parse(code))
+    results = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        lagoon.exec_node(program, it)
+        results.append(time.perf_counter() - start)
+    return statistics.median(results)
+
+
+def reaches(it, code):
+    """codeを最後まで実行できるか（再帰の深さの上限を超えればFalse）"""
+    try:
+        lagoon.exec_node(syntaxtree.lower(lagoon.parse(code)), it)
+    except exceptions.LagoonInterpreterError:
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Lagoonの再帰の速度と深さの上限を計測する')
+    parser.add_argument('--runs', type=int, default=5, help='計測の回数')
+    parser.add_argument('--modes', nargs='+', default=['tree', 'closure', 'stack'], help='実行モード')
+    parser.add_argument('--depths', type=int, nargs='+', default=[50, 100, 1000, 10000, 100000],
+                        help='試す再帰の深さ')
+    args = parser.parse_args()
+
+    interpreters = {}
+    for mode in args.modes:
+        it = interpreter.LagoonFileInterpreter(os.path.abspath('<bench>'), mode=mode)
+        lagoon.exec_(SETUP, it)
+        interpreters[mode] = it
+
+    print('{:<12}'.format('case') + ''.join('{:>14}'.format(mode + ' (ms)') for mode in args.modes))
+    for label, code in CASES:
+        print('{:<12}'.format(label) + ''.join(
+            '{:>14.1f}'.format(measure(interpreters[mode], code, args.runs) * 1000)
+            for mode in args.modes))
+
+    print()
+    print('{:<12}'.format('max depth') + ''.join('{:>14}'.format(mode) for mode in args.modes))
+    for label, code in DEPTH_CASES:
+        cells = []
+        for mode in args.modes:
+            reached = [depth for depth in args.depths
+                       if reaches(interpreters[mode], code.format(depth))]
+            cells.append('{:>14}'.format(max(reached) if reached else '-'))
+        print('{:<12}'.format(label) + ''.join(cells))
+
+
+if __name__ == '__main__':
+    main()
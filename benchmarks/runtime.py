@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+# 埋め込みのベンチマーク
+# 大域の値を与えて短いコードを実行し結果を受け取る一回あたりの実行時間を、
+# 毎回構文解析してインタプリタを作るexec_と、LagoonRuntimeでコンパイル済みのプログラムを
+# 新しいインタプリタで実行する場合・プールしたインタプリタで実行する場合とで実行モードごとに比較する
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                 '..', 'lagoon')))
+
+import lagoon
+import interpreter
+import runtime
+
+# リクエストごとのフックを想定したコード（大域の名前xs, rateを与える）
+CODE = '''
+total = 0
+for x in xs:
+    total = total + x * rate
+;
+return total
+'''
+
+VARIABLES = {'xs': [1, 2, 3, 4, 5], 'rate': 1.1}
+
+
+def reparse(mode):
+    """毎回構文解析し、新しいインタプリタで実行する"""
+    file_path = os.path.abspath('<bench>')
+
+    def run():
+        it = interpreter.LagoonFileInterpreter(file_path, mode=mode)
+        it.valid_namespace.update(VARIABLES)
+        lagoon.exec_(CODE, it)
+    return run
+
+
+def compiled(mode, pool_size):
+    """コンパイル済みのプログラムを実行する（pool_sizeが0ならば毎回インタプリタを作る）"""
+    rt = runtime.LagoonRuntime(mode, pool_size=pool_size)
+    program = rt.compile(CODE, names=VARIABLES)
+    return lambda: rt.run(program, VARIABLES)
+
+
+# 計測する方法
+CASES = [
+    ('exec_', reparse),
+    ('fresh', lambda mode: compiled(mode, 0)),
+    ('pooled', lambda mode: compiled(mode, 8)),
+]
+
+
+def measure(run, runs, count):
+    run()
+    results = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        for _ in range(count):
+            run()
+        results.append((time.perf_counter() - start) / count)
+    return statistics.median(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Lagoonの埋め込みの実行一回あたりの時間を計測する')
+    parser.add_argument('--runs', type=int, default=5, help='計測の回数')
+    parser.add_argument('--count', type=int, default=1000, help='一回の計測で実行する回数')
+    parser.add_argument('--modes', nargs='+', default=['tree', 'closure', 'stack', 'python'],
+                        help='実行モード')
+    args = parser.parse_args()
+
+    print('{:<12}'.format('case') + ''.join('{:>14}'.format(mode + ' (us)') for mode in args.modes))
+    for label, make in CASES:
+        print('{:<12}'.format(label) + ''.join(
+            '{:>14.1f}'.format(measure(make(mode), args.runs, args.count) * 10 ** 6)
+            for mode in args.modes))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+# 起動時間のベンチマーク
+# 新しいプロセスで import lagoon と空のファイルの実行に要する時間を計測し、
+# import lagoon の中央値が予算を超えれば終了コード1で終わる
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+LAGOON_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                           '..', 'lagoon'))
+
+IMPORT_SCRIPT = '''
+import sys, time
+sys.path.insert(0, {!r})
+start = time.perf_counter()
+import lagoon
+print(time.perf_counter() - start)
+'''.format(LAGOON_DIR)
+
+EXECUTE_SCRIPT = '''
+import sys, time
+sys.path.insert(0, {!r})
+start = time.perf_counter()
+import lagoon
+lagoon.execute(sys.argv[1])
+print(time.perf_counter() - start)
+'''.format(LAGOON_DIR)
+
+
+def measure(script, args, runs):
+    """新しいプロセスでscriptを実行し、出力された秒数の列を返す"""
+    results = []
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, '-c', script] + args)
+        results.append(float(output.decode().split()[-1]))
+    return results
+
+
+def report(label, results):
+    print('{}: median {:.1f} ms, min {:.1f} ms ({} runs)'.format(
+        label, statistics.median(results) * 1000, min(results) * 1000, len(results)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Lagoonの起動時間を計測する')
+    parser.add_argument('--runs', type=int, default=20, help='計測の回数')
+    parser.add_argument('--budget', type=float, default=30.0,
+                        help='import lagoon の中央値の上限 (ms)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        empty_path = os.path.join(directory, 'empty.lgn')
+        with open(empty_path, 'w', encoding='utf8') as f:
+            f.write('none\n')
+
+        # 最初の一回は文法と構文解析のキャッシュを作るので除く
+        measure(EXECUTE_SCRIPT, [empty_path], 1)
+        import_results = measure(IMPORT_SCRIPT, [], args.runs)
+        execute_results = measure(EXECUTE_SCRIPT, [empty_path], args.runs)
+
+    report('import lagoon', import_results)
+    report('execute empty file', execute_results)
+    if statistics.median(import_results) * 1000 > args.budget:
+        print('over budget ({:.1f} ms)'.format(args.budget))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+# 文字列リテラルのベンチマーク
+# 式展開（i"...#{}..."）やマクロを含む文字列リテラルの一回あたりの評価時間を実行モードごとに比較する
+# （式展開の式は最初の評価で構文木に変換し、以降は構文解析しない）
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                 '..', 'lagoon')))
+
+import lagoon
+import interpreter
+import syntaxtree
+
+SETUP = '''
+x = 3
+y = 'lagoon'
+describe = {n -> return i"n = #{n}"}
+'''
+
+# 計測する文（{}は一回の計測での回数に置き換える）
+CASES = [
+    ('plain', "times {}:\n    'x = 3'\n;\n"),
+    ('dedent', 'times {}:\n    ad"""\n        x = 3\n          y\n        """\n;\n'),
+    ('interp 1', 'times {}:\n    i"x = #{{x}}"\n;\n'),
+    ('interp 3', 'times {}:\n    i"#{{x}}, #{{y}}, #{{x * 2}}"\n;\n'),
+    ('interp func', 'times {}:\n    describe(1)\n;\n'),
+]
+
+
+def measure(it, code, runs):
+    program = syntaxtree.lower(lagoon.parse(code))
+    results = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        lagoon.exec_node(program, it)
+        results.append(time.perf_counter() - start)
+    return statistics.median(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Lagoonの文字列リテラルの評価の速度を計測する')
+    parser.add_argument('--runs', type=int, default=5, help='計測の回数')
+    parser.add_argument('--times', type=int, default=5000, help='一回の計測での回数')
+    parser.add_argument('--modes', nargs='+', default=['tree', 'closure'], help='実行モード')
+    args = parser.parse_args()
+
+    interpreters = {}
+    for mode in args.modes:
+        it = interpreter.LagoonFileInterpreter(os.path.abspath('<bench>'), mode=mode)
+        lagoon.exec_(SETUP, it)
+        interpreters[mode] = it
+
+    print('{:<12}'.format('case') + ''.join('{:>14}'.format(mode + ' (us)') for mode in args.modes))
+    for label, code in CASES:
+        print('{:<12}'.format(label) + ''.join(
+            '{:>14.3f}'.format(measure(interpreters[mode], code.format(args.times), args.runs)
+                               / args.times * 1e6)
+            for mode in args.modes))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+
+# ベンチマークの一覧の実行
+# 起動（新しいプロセスでのimport lagoonと空のファイルの実行）、sample/*.lgnと大きな合成ファイルの
+# 構文解析（文法とfilter_node）と構文木の変換、実行モードごとの関数呼び出し・テーブルとmetatableの
+# 参照・ループ・内包表記・式展開の時間をまとめて計測し、結果をJSONで書き出す
+# --baselineに以前の結果のJSONを与えると、中央値が--thresholdの割合を超えて遅くなった計測を
+# 報告して終了コード1で終わる
+
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.normpath(os.path.join(BENCHMARKS_DIR, '..', 'lagoon')))
+
+import lagoon
+import interpreter
+import optimizer
+import parsecache
+import resolver
+import syntaxtree
+
+import startup
+
+SAMPLE_DIR = os.path.normpath(os.path.join(BENCHMARKS_DIR, '..', 'sample'))
+
+# 合成ファイルの一単位（{0}は単位の番号に置き換える）
+SYNTHETIC_UNIT = '''
+point{0} = [x = {0}, y = {0} * 2, norm = {{-> return @x * @x + @y * @y}}]
+scale{0} = {{values, k ~= 2 ->
+    result = []
+    for v in values:
+        if v mod 2 == 0 and v > {0}:
+            result.append(v * k)
+        else:
+            result.append(-v)
+        ;
+    ;
+    return [r + 1 for r in result if r != 0]
+}}
+label{0} = i"point #{{point{0}.x}}: #{{scale{0}([1, 2, 3])}}"
+'''
+
+SETUP = '''
+add = {a, b -> return a + b}
+Base = [
+    describe = {-> return @name}
+]
+Entity = [
+    metatable = Base
+    name = 'entity'
+]
+entity = [metatable = Entity, x = 1]
+xs = py.list(py.range(100))
+x = 3
+y = 'lagoon'
+'''
+
+# 計測する文（{}は一回の計測での回数に置き換える）
+CASES = [
+    ('call', 'times {}:\n    add(1, 2)\n;\n'),
+    ('field', 'times {}:\n    entity.x\n;\n'),
+    ('inherited', 'times {}:\n    entity.describe()\n;\n'),
+    ('write', 'times {}:\n    entity.x = 1\n;\n'),
+    ('while', 'i = 0\nwhile i < {}:\n    i = i + 1\n;\n'),
+    ('for', 'for i in py.range({}):\n    i\n;\n'),
+    ('comprehension', 'times {}:\n    [v * 2 for v in xs if v mod 3 == 0]\n;\n'),
+    ('interpolation', 'times {}:\n    i"#{{x}}, #{{y}}, #{{x * 2}}"\n;\n'),
+]
+
+
+def median_of(function, runs):
+    """functionの所要時間（秒）の中央値と最小値"""
+    results = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        results.append(time.perf_counter() - start)
+    return {'median': statistics.median(results), 'min': min(results), 'runs': runs}
+
+
+def bench_startup(args):
+    with tempfile.TemporaryDirectory() as directory:
+        empty_path = os.path.join(directory, 'empty.lgn')
+        with open(empty_path, 'w', encoding='utf8') as f:
+            f.write('none\n')
+        # 最初の一回は文法と構文解析のキャッシュを作るので除く
+        startup.measure(startup.EXECUTE_SCRIPT, [empty_path], 1)
+        for label, script, script_args in [('import', startup.IMPORT_SCRIPT, []),
+                                           ('execute', startup.EXECUTE_SCRIPT, [empty_path])]:
+            results = startup.measure(script, script_args, args.startup_runs)
+            yield 'startup/' + label, {'median': statistics.median(results), 'min': min(results),
+                                       'runs': args.startup_runs}
+
+
+def lower(root_node):
+    """lower_fileと同じく、構文木へ変換して定数を畳み込み、名前を解決する"""
+    program = optimizer.optimize(syntaxtree.lower(root_node))
+    return resolver.resolve(program, interpreter.builtin_names())
+
+
+def bench_parse(args):
+    sources = []
+    for path in sorted(glob.glob(os.path.join(SAMPLE_DIR, '*.lgn'))):
+        with open(path, 'r', encoding='utf8') as f:
+            sources.append((os.path.basename(path), f.read()))
+    for units in args.synthetic:
+        sources.append(('synthetic-{}'.format(units),
+                        ''.join(SYNTHETIC_UNIT.format(index) for index in range(units))))
+    for label, code in sources:
+        yield 'parse/' + label, median_of(lambda: lagoon.parse(code), args.runs)
+        if label.startswith('synthetic'):
+            root_node = lagoon.parse(code)
+            yield 'lower/' + label, median_of(lambda: lower(root_node), args.runs)
+
+
+def bench_exec(args):
+    for mode in args.modes:
+        it = interpreter.LagoonFileInterpreter(os.path.abspath('<bench>'), mode=mode)
+        lagoon.exec_(SETUP, it)
+        for label, code in CASES:
+            # ファイルの大域と同じく名前を解決する
+            program = resolver.resolve(syntaxtree.lower(lagoon.parse(code.format(args.times))))
+            result = median_of(lambda: lagoon.exec_node(program, it), args.runs)
+            # 一回あたりの時間にする
+            result['median'] /= args.times
+            result['min'] /= args.times
+            yield 'exec/{}/{}'.format(mode, label), result
+
+
+GROUPS = {
+    'startup': bench_startup,
+    'parse': bench_parse,
+    'exec': bench_exec,
+}
+
+
+def compare(results, baseline, threshold):
+    """baselineより中央値がthresholdの割合を超えて遅くなった計測の名前の列を返す"""
+    regressions = []
+    print('{:<32}'.format('benchmark') + '{:>14}{:>14}{:>10}'.format('baseline (us)', 'current (us)', 'change'))
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        ratio = result['median'] / previous['median']
+        flag = ''
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print('{:<32}'.format(name) + '{:>14.2f}{:>14.2f}{:>+9.1f}%{}'.format(
+            previous['median'] * 10 ** 6, result['median'] * 10 ** 6, (ratio - 1) * 100, flag))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Lagoonのベンチマークをまとめて実行する')
+    parser.add_argument('--groups', nargs='+', default=list(GROUPS), choices=list(GROUPS),
+                        help='実行する計測の種類')
+    parser.add_argument('--runs', type=int, default=5, help='計測の回数')
+    parser.add_argument('--startup-runs', type=int, default=10, help='起動の計測の回数')
+    parser.add_argument('--times', type=int, default=2000, help='実行の計測一回での回数')
+    parser.add_argument('--synthetic', type=int, nargs='+', default=[20, 100],
+                        help='合成ファイルの単位の数')
+    parser.add_argument('--modes', nargs='+', default=['tree', 'closure', 'stack'], help='実行モード')
+    parser.add_argument('--output', help='結果を書き出すJSONファイル')
+    parser.add_argument('--baseline', help='比較する以前の結果のJSONファイル')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='遅くなったと報告する中央値の増加の割合')
+    args = parser.parse_args()
+
+    # 構文解析の計測にキャッシュを用いない
+    parsecache.enabled = False
+    results = {}
+    for group in args.groups:
+        for name, result in GROUPS[group](args):
+            results[name] = result
+            print('{:<32}'.format(name) + '{:>14.2f} us'.format(result['median'] * 10 ** 6))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf8') as f:
+            json.dump({
+                'created': datetime.datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf8') as f:
+            baseline = json.load(f)['results']
+        print()
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print('{} regression(s) over {:.0f}%'.format(len(regressions), args.threshold * 100))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+# テーブルのベンチマーク
+# metatableから継承したメソッドの呼び出し、キーワード引数や束縛したメソッドでの呼び出し、
+# get_, set_の関数を通した読み書き、通常の属性への代入、テーブルの生成の一回あたりの実行時間を
+# 実行モードごとに比較する
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                 '..', 'lagoon')))
+
+import lagoon
+import interpreter
+import syntaxtree
+
+SETUP = '''
+Base = [
+    describe = {-> return @name}
+]
+Entity = [
+    metatable = Base
+    name = 'entity'
+    move = {dx -> @x += dx}
+    set_hp = {value -> return max(value, 0)}
+]
+Entity.new = {x ->
+    return [
+        metatable = Entity
+        x = x
+        hp = 10
+        get_position = {-> return @x}
+    ]
+}
+entity = Entity.new(0)
+'''
+
+# 計測する文（{}は一回の計測での回数に置き換える）
+CASES = [
+    ('method', 'times {}:\n    entity.move(1)\n;\n'),
+    ('inherited', 'times {}:\n    entity.describe()\n;\n'),
+    ('keyword', 'times {}:\n    entity.move(dx = 1)\n;\n'),
+    ('bound', 'move = entity.move\ntimes {}:\n    move(1)\n;\n'),
+    ('field', 'times {}:\n    entity.name\n;\n'),
+    ('getter', 'times {}:\n    entity.position\n;\n'),
+    ('setter', 'times {}:\n    entity.hp = 5\n;\n'),
+    ('write', 'times {}:\n    entity.x = 1\n;\n'),
+    ('new', 'times {}:\n    Entity.new(1)\n;\n'),
+]
+
+
+def measure(it, code, runs):
+    program = syntaxtree.lower(lagoon.parse(code))
+    results = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        lagoon.exec_node(program, it)
+        results.append(time.perf_counter() - start)
+    return statistics.median(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Lagoonのテーブルの属性の読み書きの速度を計測する')
+    parser.add_argument('--runs', type=int, default=5, help='計測の回数')
+    parser.add_argument('--times', type=int, default=20000, help='一回の計測での回数')
+    parser.add_argument('--modes', nargs='+', default=['tree', 'closure'], help='実行モード')
+    args = parser.parse_args()
+
+    interpreters = {}
+    for mode in args.modes:
+        it = interpreter.LagoonFileInterpreter(os.path.abspath('<bench>'), mode=mode)
+        lagoon.exec_(SETUP, it)
+        interpreters[mode] = it
+
+    print('{:<12}'.format('case') + ''.join('{:>14}'.format(mode + ' (us)') for mode in args.modes))
+    for label, code in CASES:
+        print('{:<12}'.format(label) + ''.join(
+            '{:>14.3f}'.format(measure(interpreters[mode], code.format(args.times), args.runs)
+                               / args.times * 1e6)
+            for mode in args.modes))
+
+
+if __name__ == '__main__':
+    main()
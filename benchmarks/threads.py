@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+# スレッドプールのベンチマーク
+# 待ち時間のある関数（入出力の代わりにtime.sleepで待つ）と、CPUを使う関数を列の要素ごとに呼び出す
+# 一回あたりの実行時間を、逐次のmapとthreadpool_mapとで実行モードごとに比較する
+# スレッドの数は環境変数LAGOON_THREADSで変えられる
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                 '..', 'lagoon')))
+
+import lagoon
+import interpreter
+import resolver
+import syntaxtree
+
+# {0}は要素の数、{1}は待ち時間（秒）、{2}は要素ごとの反復の回数に置き換える
+SETUP = '''
+time = import("time")
+xs = py.list(py.range({0}))
+wait = {{n ->
+    time.sleep({1})
+    return n
+}}
+work = {{n ->
+    s = 0
+    for i in py.range({2}):
+        s = s + (i * n) mod 7
+    ;
+    return s
+}}
+'''
+
+# 計測する文
+CASES = [
+    ('wait map', 'r = py.list(map(wait, xs))'),
+    ('wait pool', 'r = threadpool_map(wait, xs)'),
+    ('work map', 'r = py.list(map(work, xs))'),
+    ('work pool', 'r = threadpool_map(work, xs)'),
+]
+
+
+def measure(it, code, runs):
+    # ファイルの大域と同じく名前を解決する
+    program = resolver.resolve(syntaxtree.lower(lagoon.parse(code)))
+    # スレッドプールの起動を計測に含めない
+    lagoon.exec_node(program, it)
+    results = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        lagoon.exec_node(program, it)
+        results.append(time.perf_counter() - start)
+    return statistics.median(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Lagoonのスレッドプールの速度を計測する')
+    parser.add_argument('--runs', type=int, default=5, help='計測の回数')
+    parser.add_argument('--size', type=int, default=32, help='要素の数')
+    parser.add_argument('--delay', type=float, default=0.005, help='関数waitの待ち時間（秒）')
+    parser.add_argument('--work', type=int, default=2000, help='関数workの要素ごとの反復の回数')
+    parser.add_argument('--modes', nargs='+', default=['tree', 'closure', 'stack'], help='実行モード')
+    args = parser.parse_args()
+
+    interpreters = {}
+    for mode in args.modes:
+        it = interpreter.LagoonFileInterpreter(os.path.abspath('<bench>'), mode=mode)
+        lagoon.exec_(SETUP.format(args.size, args.delay, args.work), it)
+        interpreters[mode] = it
+
+    print('threads: {}'.format(os.environ.get('LAGOON_THREADS', 'default')))
+    print('{:<12}'.format('case') + ''.join('{:>14}'.format(mode + ' (ms)') for mode in args.modes))
+    for label, code in CASES:
+        print('{:<12}'.format(label) + ''.join(
+            '{:>14.1f}'.format(measure(interpreters[mode], code, args.runs) * 1000)
+            for mode in args.modes))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+# 構文木のメモリのベンチマーク
+# ファイルごとに、構文解析したparsimoniousのノードの木と、実行時の構文木（syntaxtree）とが
+# 確保するメモリをtracemallocで計測して比較する
+
+import argparse
+import glob
+import os
+import sys
+import tracemalloc
+
+ROOT_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'lagoon'))
+
+import lagoon
+import monkeypatch  # noqa: F401  （find などのノードのメソッド）
+import syntaxtree
+
+
+def count_nodes(node):
+    return 1 + sum(count_nodes(child) for child in node)
+
+
+def measure(func):
+    """funcの返り値が保持するメモリ（バイト数）と返り値を返す"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = func()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Lagoonの構文木のメモリを計測する')
+    parser.add_argument('files', nargs='*', help='計測するファイル（既定はsample/*.lgn）')
+    args = parser.parse_args()
+
+    files = args.files or sorted(glob.glob(os.path.join(ROOT_DIR, 'sample', '*.lgn')))
+    # 文法の構築をメモリの計測に含めない
+    lagoon.load_grammar()
+
+    print('{:<20} {:>8} {:>12} {:>8} {:>12} {:>7}'.format(
+        'file', 'nodes', 'parse (KiB)', 'lowered', 'lower (KiB)', 'ratio'))
+    for file_path in files:
+        with open(file_path, 'r', encoding='utf8') as f:
+            code = f.read()
+        parse_size, root_node = measure(lambda: lagoon.parse(code))
+        lower_size, program = measure(lambda: syntaxtree.lower(root_node))
+        print('{:<20} {:>8} {:>12.1f} {:>8} {:>12.1f} {:>6.1f}x'.format(
+            os.path.basename(file_path), count_nodes(root_node), parse_size / 1024,
+            sum(1 for _ in syntaxtree.walk(program)), lower_size / 1024,
+            parse_size / lower_size))
+
+
+if __name__ == '__main__':
+    main()
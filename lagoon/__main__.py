@@ -1,7 +1,97 @@
 # -*- coding: utf-8 -*-
 
-import lagoon
-import sys
+import argparse
 import os.path
+import sys
+import time
+
+parser = argparse.ArgumentParser(prog='lagoon')
+parser.add_argument('file', nargs='?', help='実行するLagoonファイル（省略すると対話環境を開始する）')
+parser.add_argument('--mode', choices=['tree', 'closure', 'stack', 'python'], default='tree',
+                    help='tree: ノードを直接辿る, closure: ノードをクロージャにコンパイルして実行する, '
+                         'stack: 関数の呼び出しを明示的なスタックで行う（再帰の深さに制限が無い）, '
+                         'python: Pythonのコードオブジェクトにコンパイルして実行する')
+parser.add_argument('--async', dest='async_', action='store_true',
+                    help='プログラムをasyncioのイベントループの上で実行する（大域でもawait式を使える）')
+parser.add_argument('--compile', action='store_true',
+                    help='実行せずに、Pythonに変換したソースと.pycを__pycache__に書き出す')
+parser.add_argument('--no-cache', action='store_true',
+                    help='構文解析結果のキャッシュ(__lgncache__)を用いない')
+parser.add_argument('--no-optimize', action='store_true',
+                    help='定数の畳み込みを行わずに実行する（デバッグ用）')
+parser.add_argument('--timings', action='store_true',
+                    help='起動・構文解析・実行の所要時間を標準エラー出力に表示する')
+parser.add_argument('--cache-stats', action='store_true',
+                    help='クロージャモードのメソッドの呼び出しごとのインラインキャッシュのヒット数・ミス数と'
+                         '記録した型を標準エラー出力に表示する')
+parser.add_argument('--coverage', action='store_true',
+                    help='実行されなかった文を標準エラー出力に報告する')
+parser.add_argument('--profile-grammar', action='store_true',
+                    help='実行せずに、ファイルを構文解析したときの文法の規則ごとの試行・成功・失敗の回数と時間、'
+                         '後戻りで読み直した文字数を標準エラー出力に報告する')
+parser.add_argument('--profile-sort', choices=['time', 'self', 'attempts', 'failures', 'rescanned'],
+                    default='time', help='--profile-grammarの報告を並べ替えるキー')
+parser.add_argument('--debug', action='store_true',
+                    help='ソースコードと構文木をdebug.logに出力する')
+args = parser.parse_args()
+
+# 文法の構築を含む起動時間を計測するため、ここで読み込む
+start = time.perf_counter()
+import lagoon  # noqa
+import parsecache  # noqa
+lagoon.timings.append(('startup', time.perf_counter() - start))
+
+if args.no_cache:
+    parsecache.enabled = False
+if args.no_optimize:
+    import optimizer
+    optimizer.enabled = False
+if args.debug:
+    lagoon.enable_debug_log()
+if args.cache_stats:
+    import interpreter  # noqa（compilerはinterpreterの後に読み込む）
+    import compiler
+    compiler.record_cache_stats()
+if args.coverage:
+    import lgncoverage
+    coverage = lgncoverage.Coverage()
+    coverage.start()
+
+if args.file is None:
+    if args.compile:
+        parser.error('--compileにはファイルを指定してください')
+    if args.profile_grammar:
+        parser.error('--profile-grammarにはファイルを指定してください')
+    if args.mode == 'python':
+        parser.error('対話環境では--mode pythonを使用できません')
 
-lagoon.execute(os.path.abspath(sys.argv[1]))
+try:
+    if args.file is None:
+        import repl
+        main, main_args = repl.LagoonRepl(mode=args.mode).run, ()
+    elif args.compile:
+        import transpiler
+        main, main_args = transpiler.compile_file, (os.path.abspath(args.file),)
+    elif args.profile_grammar:
+        import parseprofile
+        main, main_args = parseprofile.profile_file, (os.path.abspath(args.file), args.profile_sort)
+    else:
+        main, main_args = lagoon.execute, (os.path.abspath(args.file), args.mode)
+    if args.async_ and not args.compile and not args.profile_grammar:
+        import coroutines
+        coroutines.run(main, *main_args)
+    else:
+        main(*main_args)
+finally:
+    if args.coverage:
+        coverage.stop()
+        coverage.report(file=sys.stderr)
+    if args.timings:
+        for label, seconds in lagoon.timings:
+            print('{}: {:.1f} ms'.format(label, seconds * 1000), file=sys.stderr)
+    if args.cache_stats:
+        for stat in compiler.cache_stats():
+            print('line {}, column {}: .{} hits {} misses {} uncached {} (cached: {}; uncached: {})'.format(
+                stat.location.line, stat.location.column, stat.name, stat.hits, stat.misses,
+                stat.uncached, ', '.join(stat.cached_types) or '-',
+                ', '.join(stat.uncached_types) or '-'), file=sys.stderr)
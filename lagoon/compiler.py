@@ -0,0 +1,1287 @@
+# -*- coding: utf-8 -*-
+
+import coroutines
+import exceptions
+import interpreter
+import parallel
+import resolver
+import syntaxtree
+
+import collections
+import operator
+import types
+
+
+# キーワード引数の無いメソッドの呼び出しに渡す辞書（書き込まれない）
+no_kwargs = {}
+
+# 属性を変更できない型のフラグ（Py_TPFLAGS_IMMUTABLETYPE）
+IMMUTABLE_TYPE = 1 << 8
+
+# InlineCacheに記録されていない型の記述子
+UNKNOWN = object()
+
+# 統計を集計するインラインキャッシュの列（record_cache_statsの後に生成したもの）
+inline_caches = None
+
+CacheStats = collections.namedtuple(
+    'CacheStats', ['location', 'name', 'hits', 'misses', 'uncached',
+                   'cached_types', 'uncached_types'])
+
+
+class InlineCache(object):
+
+    """
+    メソッドの呼び出し（属性の参照に続く呼び出し）ごとの、組み込み型のメソッドの多相インラインキャッシュ
+    受け手の型ごとに、属性を変更できない組み込み型のメソッドならばその記述子を、
+    それ以外（テーブル、モジュール、Pythonのクラスなど）はNoneを記録する
+    記述子があれば束縛されたメソッドを作らずに呼び出す。型は高々MAX_TYPESまで記録する
+    モジュールなどの属性は変更を検査する必要があり、検査はgetattrより速くならないのでキャッシュしない
+    hitsは記述子で呼び出した回数、missesは受け手の型が記録されていなかった回数、
+    uncachedは記述子を用いずに属性を参照して呼び出した回数（record_cache_statsの後だけ数える）
+    """
+
+    __slots__ = ('name', 'node', 'methods', 'hits', 'misses', 'uncached')
+
+    MAX_TYPES = 4
+
+    def __init__(self, name, node):
+        self.name = name
+        self.node = node
+        self.methods = {}
+        self.hits = 0
+        self.misses = 0
+        self.uncached = 0
+        if inline_caches is not None:
+            inline_caches.append(self)
+
+    def getattr(self, obj, name):
+        """記述子を用いない呼び出しの属性の参照（回数を数える）"""
+        self.uncached += 1
+        return getattr(obj, name)
+
+    def learn(self, obj):
+        """受け手objの型に対する記述子（無ければNone）を記録して返す"""
+        self.misses += 1
+        type_ = type(obj)
+        if len(self.methods) >= self.MAX_TYPES:
+            return None
+        method = None
+        if (not type_.__dictoffset__
+                and all(klass.__flags__ & IMMUTABLE_TYPE for klass in type_.__mro__)):
+            for klass in type_.__mro__:
+                attribute = vars(klass).get(self.name)
+                if attribute is not None:
+                    # 属性の参照を独自に行う型（superなど）は、参照の結果が一致しない
+                    if (type(attribute) is types.MethodDescriptorType
+                            and getattr(obj, self.name, None) == attribute.__get__(obj, type_)):
+                        method = attribute
+                    break
+        self.methods[type_] = method
+        return method
+
+
+def record_cache_stats():
+    """以降にコンパイルするメソッドの呼び出しのインラインキャッシュを、統計のために保持する"""
+    global inline_caches
+    if inline_caches is None:
+        inline_caches = []
+
+
+def cache_stats():
+    """record_cache_statsの後のインラインキャッシュごとの統計を、参照の多い順に返す"""
+    stats = [CacheStats(interpreter.location(None, cache.node.src, cache.node.pos),
+                        cache.name, cache.hits, cache.misses, cache.uncached,
+                        tuple(type_.__name__ for type_, method in cache.methods.items() if method),
+                        tuple(type_.__name__ for type_, method in cache.methods.items()
+                              if not method))
+             for cache in inline_caches or () if cache.misses]
+    stats.sort(key=lambda stat: stat.hits + stat.misses + stat.uncached, reverse=True)
+    return stats
+
+
+def closure(node):
+    """
+    ノードに対応するクロージャを返す（初回の呼び出しでのみコンパイルする）
+    コンパイル結果はProgram, Expression, Blockのノードに保存する
+    """
+    try:
+        return node.closure
+    except AttributeError:
+        closure_ = LagoonCompiler().compile(node)
+        try:
+            node.closure = closure_
+        except AttributeError:
+            # 保存する場所の無いノード（対話環境で直接実行する文など）
+            pass
+        return closure_
+
+
+def traced_closure(node):
+    """トレースのフックがある間に用いるclosure"""
+    try:
+        return node.traced_closure
+    except AttributeError:
+        closure_ = TracingCompiler().compile(node)
+        try:
+            node.traced_closure = closure_
+        except AttributeError:
+            pass
+        return closure_
+
+
+def constant(node, func):
+    """
+    定数となるノードの値をコンパイル時に一度だけ求める
+    計算に失敗した場合は実行時に改めて計算し、エラーの発生位置を変えない
+    """
+    try:
+        value = func()
+    except Exception:
+        def deferred(it):
+            it.last_node = node
+            return func()
+        return deferred
+
+    def const(it):
+        it.last_node = node
+        return value
+    return const
+
+
+class LagoonCompiler(object):
+
+    """
+    構文木をクロージャの木へ変換するコンパイラ
+    各クロージャはインタプリタを引数に取り、子のクロージャを束縛している
+    エラー位置の報告のため、ツリーモードと同じ位置をlast_nodeに記録する
+    （最初に子のクロージャを呼び出すクロージャでは、子の記録で上書きされるので省略する）
+    """
+
+    def compile(self, node):
+        """ノードのコンパイル"""
+        compile_ = getattr(self, 'compile_{}'.format(node.kind))
+        return compile_(node)
+
+    # general:
+
+    def compile_program(self, node):
+        block = self.compile(node.body) if node.body is not None else None
+
+        def program(it):
+            try:
+                if block:
+                    block(it)
+            except (exceptions.LagoonInterpreterError, exceptions.LagoonLoadError):
+                raise
+            except:
+                raise it.located_error()
+        return program
+
+    def compile_expression(self, node):
+        return self.compile(node.body)
+
+    def compile_block(self, node):
+        EXIT = interpreter.EXIT
+        children = tuple(self.compile(child) for child in node.stats)
+        if len(children) == 1:
+            return children[0]
+        if not resolver.exits(node):
+            # ブロックを抜ける文が無ければ、文ごとに結果を調べない
+            init, last = children[:-1], children[-1]
+
+            def block_through(it):
+                for child in init:
+                    child(it)
+                return last(it)
+            return block_through
+
+        def block(it):
+            for child in children:
+                result = child(it)
+                if result is EXIT:
+                    return EXIT
+            return result
+        return block
+
+    def compile_comm(self, node):
+        def comm(it):
+            it.last_node = node
+        return comm
+
+    # operator:
+
+    def compile_await(self, node):
+        value = self.compile(node.value)
+
+        def await_(it):
+            return coroutines.await_(value(it))
+        return await_
+
+    def compile_range(self, node):
+        start = self.compile(node.start) if node.start is not None else None
+        stop = self.compile(node.stop)
+        offset = 1 if node.closed else 0
+
+        def range_(it):
+            return range(start(it) if start else 0, stop(it) + offset)
+        return range_
+
+    def chain_ops(self, ops):
+        """チェーンの操作を (種類, 値) の組の列にする"""
+        elems = []
+        for op in ops:
+            if isinstance(op, syntaxtree.Call):
+                elems.append(('call', self.call_args(op.args)))
+            elif isinstance(op, syntaxtree.Attr):
+                elems.append(('attr', op.name))
+            elif isinstance(op, syntaxtree.Index):
+                elems.append(('key', op.slot))
+            elif isinstance(op, syntaxtree.ConstIndex):
+                elems.append(('index', op.value))
+            else:
+                assert False
+        return elems
+
+    def call_args(self, arg_nodes):
+        """呼び出しの引数を (引数のノード, キーワード, 値のクロージャ) の組にする"""
+        return tuple((arg_node, arg_node.name, self.compile(arg_node.value))
+                     for arg_node in arg_nodes)
+
+    def evaluate_args(self, it, args):
+        """呼び出しの引数の評価"""
+        args_ = []
+        kwargs = {}
+        for arg_node, key, value in args:
+            if key is None:
+                args_.append(value(it))
+            else:
+                kwargs_value = value(it)
+                it.last_node = arg_node
+                kwargs[key] = kwargs_value
+        return args_, kwargs
+
+    def reference(self, name, record_node, binding=None):
+        """名前を参照するクロージャ（record_nodeがあれば参照の前に記録する）"""
+        lookup = self.lookup(name, binding)
+        if record_node is None:
+            return lookup
+
+        def recorded_ref(it):
+            it.last_node = record_node
+            return lookup(it)
+        return recorded_ref
+
+    def lookup(self, name, binding):
+        """
+        名前の値を求めるクロージャ
+        bindingがあればスロットと大域・ビルトインの名前空間を直接参照し、無ければ名前空間を順に探す
+        """
+        LagoonNameError = exceptions.LagoonNameError
+        UNBOUND = interpreter.UNBOUND
+        message = '{} is currently not defined'.format(name)
+
+        if binding is None:
+            def ref(it):
+                try:
+                    return it.valid_namespace[name]
+                except KeyError:
+                    raise LagoonNameError(message)
+            return ref
+
+        def global_ref(it):
+            try:
+                return it.globals[name]
+            except KeyError:
+                pass
+            try:
+                return it.builtins[name]
+            except KeyError:
+                raise LagoonNameError(message)
+
+        candidates = binding.candidates
+        globally = binding.globally
+        if not candidates:
+            return global_ref
+        elif candidates == ((0, candidates[0][1]),):
+            slot = candidates[0][1]
+            if not globally:
+                def local_ref(it):
+                    return it.slots[slot]
+                return local_ref
+
+            def local_or_global_ref(it):
+                value = it.slots[slot]
+                if value is UNBOUND:
+                    return global_ref(it)
+                return value
+            return local_or_global_ref
+        elif candidates == ((1, candidates[0][1]),) and not globally:
+            slot = candidates[0][1]
+
+            def outer_ref(it):
+                return it.outer.slots[slot]
+            return outer_ref
+
+        def slot_ref(it):
+            for depth, slot in candidates:
+                frame = it
+                for _ in range(depth):
+                    frame = frame.outer
+                value = frame.slots[slot]
+                if value is not UNBOUND:
+                    return value
+            if globally:
+                return global_ref(it)
+            raise LagoonNameError(message)
+        return slot_ref
+
+    def head(self, node, record_node, binding):
+        """チェーンの先頭のクロージャ"""
+        if isinstance(node, str):
+            return self.reference(node, record_node, binding)
+        return self.compile(node)
+
+    def chain(self, node):
+        """キーの先行評価を含まないチェーンのクロージャを生成"""
+        LagoonCallable = interpreter.LagoonCallable
+        LagoonMethod = interpreter.LagoonMethod
+        # 参照が先頭にある場合、チェーン（または最後の属性名）を記録する
+        func = self.head(node.head, node.record, node.binding)
+
+        ops = self.chain_ops(node.ops)
+        for i, (kind, value) in enumerate(ops):
+            if kind == 'call':
+                if i and ops[i - 1][0] == 'attr':
+                    # 属性の参照と合わせて呼び出す
+                    continue
+                func = self.chain_call(func, value)
+            elif kind == 'attr':
+                if i + 1 < len(ops) and ops[i + 1][0] == 'call':
+                    func = self.chain_method_call(func, value, ops[i + 1][1], node.ops[i])
+                    continue
+
+                def attr(it, prev=func, name=value):
+                    result = prev(it)
+                    new_result = getattr(result, name)
+                    if isinstance(new_result, LagoonCallable):
+                        new_result = LagoonMethod(new_result, result)
+                    return new_result
+                func = attr
+            elif kind == 'index':
+                def index(it, prev=func, key=value):
+                    return prev(it)[key]
+                func = index
+            else:
+                assert False
+        return func
+
+    def chain_call(self, prev, args):
+        if any(key is not None for _, key, _ in args):
+            evaluate_args = self.evaluate_args
+
+            def call_with_keywords(it):
+                func = prev(it)
+                args_, kwargs = evaluate_args(it, args)
+                return func(*args_, **kwargs)
+            return call_with_keywords
+
+        values = tuple(value for _, _, value in args)
+        if len(values) == 0:
+            def call0(it):
+                return prev(it)()
+            return call0
+        elif len(values) == 1:
+            value0, = values
+
+            def call1(it):
+                return prev(it)(value0(it))
+            return call1
+        elif len(values) == 2:
+            value0, value1 = values
+
+            def call2(it):
+                return prev(it)(value0(it), value1(it))
+            return call2
+
+        def call(it):
+            func = prev(it)
+            return func(*[value(it) for value in values])
+        return call
+
+    def chain_method_call(self, prev, name, args, node):
+        """
+        属性の参照に続く呼び出しのクロージャを生成
+        LagoonCallableはLagoonMethodを作らずに、テーブルをcurrentとして呼び出す
+        組み込み型のメソッドは、受け手の型ごとのInlineCacheの記述子で直接呼び出す
+        """
+        LagoonCallable = interpreter.LagoonCallable
+        cache = InlineCache(name, node)
+        methods = cache.methods
+        # 統計を記録している間だけ、記述子を用いない呼び出しを数える
+        getattr_ = getattr if inline_caches is None else cache.getattr
+        if any(key is not None for _, key, _ in args):
+            evaluate_args = self.evaluate_args
+
+            def method_call_with_keywords(it):
+                obj = prev(it)
+                method = methods.get(type(obj), UNKNOWN)
+                if method is UNKNOWN:
+                    method = cache.learn(obj)
+                elif method is not None:
+                    cache.hits += 1
+                if method is not None:
+                    args_, kwargs = evaluate_args(it, args)
+                    return method(obj, *args_, **kwargs)
+                func = getattr_(obj, name)
+                args_, kwargs = evaluate_args(it, args)
+                if isinstance(func, LagoonCallable):
+                    return func.call_method(obj, tuple(args_), kwargs)
+                return func(*args_, **kwargs)
+            return method_call_with_keywords
+
+        values = tuple(value for _, _, value in args)
+        if len(values) == 0:
+            def method_call0(it):
+                obj = prev(it)
+                method = methods.get(type(obj), UNKNOWN)
+                if method is UNKNOWN:
+                    method = cache.learn(obj)
+                elif method is not None:
+                    cache.hits += 1
+                if method is not None:
+                    return method(obj)
+                func = getattr_(obj, name)
+                if isinstance(func, LagoonCallable):
+                    return func.call_method(obj, (), no_kwargs)
+                return func()
+            return method_call0
+        elif len(values) == 1:
+            value0, = values
+
+            def method_call1(it):
+                obj = prev(it)
+                method = methods.get(type(obj), UNKNOWN)
+                if method is UNKNOWN:
+                    method = cache.learn(obj)
+                elif method is not None:
+                    cache.hits += 1
+                if method is not None:
+                    return method(obj, value0(it))
+                func = getattr_(obj, name)
+                if isinstance(func, LagoonCallable):
+                    return func.call_method(obj, (value0(it),), no_kwargs)
+                return func(value0(it))
+            return method_call1
+        elif len(values) == 2:
+            value0, value1 = values
+
+            def method_call2(it):
+                obj = prev(it)
+                method = methods.get(type(obj), UNKNOWN)
+                if method is UNKNOWN:
+                    method = cache.learn(obj)
+                elif method is not None:
+                    cache.hits += 1
+                if method is not None:
+                    return method(obj, value0(it), value1(it))
+                func = getattr_(obj, name)
+                if isinstance(func, LagoonCallable):
+                    return func.call_method(obj, (value0(it), value1(it)), no_kwargs)
+                return func(value0(it), value1(it))
+            return method_call2
+
+        def method_call(it):
+            obj = prev(it)
+            method = methods.get(type(obj), UNKNOWN)
+            if method is UNKNOWN:
+                method = cache.learn(obj)
+            elif method is not None:
+                cache.hits += 1
+            if method is not None:
+                return method(obj, *[value(it) for value in values])
+            func = getattr_(obj, name)
+            args_ = tuple([value(it) for value in values])
+            if isinstance(func, LagoonCallable):
+                return func.call_method(obj, args_, no_kwargs)
+            return func(*args_)
+        return method_call
+
+    def keyed_chain(self, node):
+        """
+        先に評価したキーの値を引数に取るチェーンのクロージャを生成
+        ツリーモードと同じく、キーの評価がチェーンの評価に先行する場合に用いる
+        """
+        LagoonCallable = interpreter.LagoonCallable
+        LagoonMethod = interpreter.LagoonMethod
+        evaluate_args = self.evaluate_args
+        head = self.head(node.head, None, node.binding)
+        ops = tuple(self.chain_ops(node.ops))
+
+        def keyed_chain(it, key_values):
+            result = head(it)
+            for kind, value in ops:
+                if kind == 'call':
+                    args, kwargs = evaluate_args(it, value)
+                    result = result(*args, **kwargs)
+                elif kind == 'attr':
+                    new_result = getattr(result, value)
+                    if isinstance(new_result, LagoonCallable):
+                        new_result = LagoonMethod(new_result, result)
+                    result = new_result
+                elif kind == 'index':
+                    result = result[value]
+                elif kind == 'key':
+                    result = result[key_values[value]]
+                else:
+                    assert False
+            return result
+        return keyed_chain
+
+    def compile_chain(self, node):
+        if not node.keys:
+            return self.chain(node)
+
+        keys = tuple(self.compile(key) for key in node.keys)
+        record_node = node.record
+        body = self.keyed_chain(node)
+
+        def chain_with_keys(it):
+            key_values = [key(it) for key in keys]
+            if record_node is not None:
+                it.last_node = record_node
+            return body(it, key_values)
+        return chain_with_keys
+
+    def binary(self, node, func):
+        left = self.compile(node.left)
+        right = self.compile(node.right)
+
+        def binary(it):
+            return func(left(it), right(it))
+        return binary
+
+    def unary(self, node, func):
+        operand = self.compile(node.operand)
+
+        def unary(it):
+            return func(operand(it))
+        return unary
+
+    def compile_pow(self, node):
+        return self.binary(node, operator.pow)
+
+    def compile_pos(self, node):
+        return self.unary(node, operator.pos)
+
+    def compile_neg(self, node):
+        return self.unary(node, operator.neg)
+
+    def compile_mul(self, node):
+        return self.binary(node, operator.mul)
+
+    def compile_truediv(self, node):
+        return self.binary(node, operator.truediv)
+
+    def compile_mod(self, node):
+        return self.binary(node, operator.mod)
+
+    def compile_add(self, node):
+        return self.binary(node, operator.add)
+
+    def compile_sub(self, node):
+        return self.binary(node, operator.sub)
+
+    def compile_lt(self, node):
+        return self.binary(node, operator.lt)
+
+    def compile_le(self, node):
+        return self.binary(node, operator.le)
+
+    def compile_eq(self, node):
+        return self.binary(node, operator.eq)
+
+    def compile_ne(self, node):
+        return self.binary(node, operator.ne)
+
+    def compile_ge(self, node):
+        return self.binary(node, operator.ge)
+
+    def compile_gt(self, node):
+        return self.binary(node, operator.gt)
+
+    def compile_is_(self, node):
+        return self.binary(node, operator.is_)
+
+    def compile_contains(self, node):
+        left = self.compile(node.left)
+        right = self.compile(node.right)
+
+        def contains(it):
+            return left(it) in right(it)
+        return contains
+
+    def compile_not_(self, node):
+        return self.unary(node, operator.not_)
+
+    def compile_and_(self, node):
+        left = self.compile(node.left)
+        right = self.compile(node.right)
+
+        def and_(it):
+            return left(it) and right(it)
+        return and_
+
+    def compile_or_(self, node):
+        left = self.compile(node.left)
+        right = self.compile(node.right)
+
+        def or_(it):
+            return left(it) or right(it)
+        return or_
+
+    def compile_isa(self, node):
+        return self.binary(node, isinstance)
+
+    def compile_one_if(self, node):
+        true = self.compile(node.body)
+        condition = self.compile(node.test)
+        false = self.compile(node.orelse)
+
+        def one_if(it):
+            return true(it) if condition(it) else false(it)
+        return one_if
+
+    def compile_one_try(self, node):
+        body = self.compile(node.body)
+        exception = self.compile(node.exception)
+        alternative = self.compile(node.alternative)
+
+        def one_try(it):
+            try:
+                return body(it)
+            except exception(it):
+                return alternative(it)
+        return one_try
+
+    # statement:
+
+    def compile_assign(self, node):
+        right = self.compile(node.value)
+
+        if node.op is None and self.assign_name(node.targets):
+            # 単一の名前への代入
+            name = self.assign_name(node.targets)
+            slot = node.targets.targets[0].slot
+            if slot is not None:
+                def assign_slot(it):
+                    it.slots[slot] = right(it)
+                return assign_slot
+
+            def assign_name(it):
+                it.namespaces[-1][name] = right(it)
+            return assign_name
+
+        left = self.compile(node.targets)
+        if node.op is None:
+            def assign(it):
+                return it.assign(assignment=left(it), value=right(it))
+            return assign
+
+        left_value = self.compile(node.current)
+        combine = {
+            'add': operator.iadd,
+            'sub': operator.isub,
+            'mul': operator.imul,
+            'div': operator.itruediv,
+        }[node.op]
+        LagoonOtherError = exceptions.LagoonOtherError
+
+        def combined_assign(it):
+            assignment = left(it)
+            value = right(it)
+            if isinstance(assignment, list):
+                raise LagoonOtherError(
+                    'combined assign operator cannot used for multiple assignment')
+            value = combine(value, left_value(it))
+            return it.assign(assignment=assignment, value=value)
+        return combined_assign
+
+    def assign_name(self, targets_node):
+        """代入先が単一の名前ならばその名前を返す"""
+        targets = targets_node.targets
+        if len(targets) == 1 and isinstance(targets[0], syntaxtree.NameTarget):
+            return targets[0].name
+        return None
+
+    def compile_assign_left(self, node):
+        NameAssign = interpreter.NameAssign
+        LocalAssign = interpreter.LocalAssign
+        AttrAssign = interpreter.AttrAssign
+        IndexAssign = interpreter.IndexAssign
+        targets = []
+        for target in node.targets:
+            if isinstance(target, syntaxtree.NameTarget):
+                if target.slot is not None:
+                    targets.append((LocalAssign, None, (), None, 'ref', target.slot))
+                else:
+                    targets.append((NameAssign, None, (), None, 'ref', target.name))
+                continue
+            obj = target.obj
+            keys = tuple(self.compile(key) for key in obj.keys)
+            if isinstance(target, syntaxtree.AttrTarget):
+                assign_type, kind, value = AttrAssign, 'attr', target.name
+            elif isinstance(target.index, syntaxtree.Index):
+                assign_type, kind, value = IndexAssign, 'key', target.index.slot
+            else:
+                assign_type, kind, value = IndexAssign, 'index', target.index.value
+            targets.append((assign_type, self.keyed_chain(obj), keys, obj.record, kind, value))
+        targets = tuple(targets)
+
+        def assign_left(it):
+            it.last_node = node
+            assigns = []
+            for assign_type, init, keys, last_node, kind, value in targets:
+                if init is None:
+                    assigns.append(assign_type(value))
+                    continue
+                key_values = [key(it) for key in keys]
+                if last_node is not None:
+                    it.last_node = last_node
+                obj = init(it, key_values)
+                if kind == 'key':
+                    value = key_values[value]
+                assigns.append(assign_type(obj, value))
+            return assigns[0] if len(assigns) < 2 else assigns
+        return assign_left
+
+    def compile_assign_right(self, node):
+        AssignTuple = interpreter.AssignTuple
+        values = tuple(self.compile(n) for n in node.values)
+
+        def assign_right(it):
+            return AssignTuple(value(it) for value in values)
+        return assign_right
+
+    def compile_if(self, node):
+        pairs = tuple((self.compile(condition_node) if condition_node else None,
+                       self.compile(block_node))
+                      for condition_node, block_node in node.branches)
+
+        def if_(it):
+            for condition, block in pairs:
+                if condition is None or condition(it):
+                    return block(it)
+        return if_
+
+    def compile_while(self, node):
+        EXIT = interpreter.EXIT
+        condition = self.compile(node.condition)
+        block = self.compile(node.body)
+        if not resolver.exits(node.body):
+            def while_through(it):
+                while condition(it):
+                    block(it)
+            return while_through
+
+        def while_(it):
+            while condition(it):
+                if block(it) is EXIT and it.exiting:
+                    return it.exit_loop()
+        return while_
+
+    def compile_for(self, node):
+        EXIT = interpreter.EXIT
+        container = self.compile(node.iter)
+        block = self.compile(node.body)
+        exits = resolver.exits(node.body)
+
+        # 代入先が単一の名前ならば、スロットか名前空間をループの前に一度だけ求める
+        name = self.assign_name(node.targets)
+        slot = node.targets.targets[0].slot if name else None
+        if slot is not None and not exits:
+            def for_slot_through(it):
+                slots = it.slots
+                for value in container(it):
+                    slots[slot] = value
+                    block(it)
+            return for_slot_through
+        elif slot is not None:
+            def for_slot(it):
+                slots = it.slots
+                for value in container(it):
+                    slots[slot] = value
+                    if block(it) is EXIT and it.exiting:
+                        return it.exit_loop()
+            return for_slot
+        elif name and not exits:
+            def for_name_through(it):
+                namespace = it.namespaces[-1]
+                for value in container(it):
+                    namespace[name] = value
+                    block(it)
+            return for_name_through
+        elif name:
+            def for_name(it):
+                namespace = it.namespaces[-1]
+                for value in container(it):
+                    namespace[name] = value
+                    if block(it) is EXIT and it.exiting:
+                        return it.exit_loop()
+            return for_name
+
+        assign = self.compile(node.targets)
+
+        def for_(it):
+            for value in container(it):
+                it.assign(assign(it), value=value)
+                if block(it) is EXIT and it.exiting:
+                    return it.exit_loop()
+        return for_
+
+    def compile_parallel_for(self, node):
+        container = self.compile(node.iter)
+
+        def parallel_for(it):
+            items = container(it)
+            it.last_node = node
+            parallel.run_loop(interpreter.ParallelLoop(node, it), items)
+        return parallel_for
+
+    def compile_times(self, node):
+        EXIT = interpreter.EXIT
+        LagoonTypeError = exceptions.LagoonTypeError
+        times_ = self.compile(node.count)
+        block = self.compile(node.body)
+
+        def count(it):
+            count_ = times_(it)
+            if not isinstance(count_, int):
+                raise LagoonTypeError('Number of times to repeat must be int')
+            return range(count_)
+
+        if not resolver.exits(node.body):
+            def times_through(it):
+                for _ in count(it):
+                    block(it)
+            return times_through
+
+        def times(it):
+            for _ in count(it):
+                if block(it) is EXIT and it.exiting:
+                    return it.exit_loop()
+        return times
+
+    def compile_continue(self, node):
+        EXIT = interpreter.EXIT
+
+        def continue_(it):
+            it.last_node = node
+            it.exiting = 0
+            return EXIT
+        return continue_
+
+    def compile_break(self, node):
+        EXIT = interpreter.EXIT
+        LagoonTypeError = exceptions.LagoonTypeError
+        if node.depth is None:
+            def break_(it):
+                it.last_node = node
+                it.exiting = 1
+                return EXIT
+            return break_
+
+        depth_ = self.compile(node.depth)
+
+        def break_depth(it):
+            depth = depth_(it)
+            if not isinstance(depth, int):
+                raise LagoonTypeError('Depth must be int')
+            if depth < 1:
+                return None
+            it.exiting = depth
+            return EXIT
+        return break_depth
+
+    def compile_return(self, node):
+        EXIT = interpreter.EXIT
+        RETURN_DEPTH = interpreter.RETURN_DEPTH
+        if node.value is None:
+            def return_none(it):
+                it.last_node = node
+                it.returned = None
+                it.exiting = RETURN_DEPTH
+                return EXIT
+            return return_none
+
+        result = self.compile(node.value)
+
+        def return_(it):
+            it.returned = result(it)
+            it.exiting = RETURN_DEPTH
+            return EXIT
+        return return_
+
+    def compile_try(self, node):
+        block = self.compile(node.body)
+        handlers = tuple((self.compile(handler.exception) if handler.exception else None,
+                          handler.name, handler.slot,
+                          self.compile(handler.body))
+                         for handler in node.handlers)
+
+        def try_(it):
+            try:
+                return block(it)
+            except Exception as e:
+                for exception_, name_node, slot, handler in handlers:
+                    exception = exception_(it) if exception_ else None
+                    if name_node:
+                        it.last_node = name_node
+                    if not exception or (exception and isinstance(e, exception)):
+                        if slot is not None:
+                            it.slots[slot] = e
+                        elif name_node:
+                            it.valid_namespace[name_node.name] = e
+                        return handler(it)
+                else:
+                    raise e
+        return try_
+
+    def compile_raise(self, node):
+        if node.value is None:
+            def reraise(it):
+                it.last_node = node
+                raise
+            return reraise
+
+        result = self.compile(node.value)
+
+        def raise_(it):
+            raise result(it)
+        return raise_
+
+    def compile_assert(self, node):
+        if node.value is None:
+            def assert_false(it):
+                it.last_node = node
+                raise AssertionError
+            return assert_false
+
+        result = self.compile(node.value)
+
+        def assert_(it):
+            if not result(it):
+                raise AssertionError
+        return assert_
+
+    # expression:
+
+    def compile_number(self, node):
+        return constant(node, lambda: node.value)
+
+    def compile_constant(self, node):
+        return constant(node.last, lambda: node.value)
+
+    def compile_string(self, node):
+        apply_macros = interpreter.apply_macros
+        string_body = interpreter.string_body
+        body_node = node.body
+        macros = node.macros
+
+        try:
+            template = interpreter.StringTemplate(string_body(node), macros)
+        except Exception:
+            # 式展開の構文エラーなどはツリーモードと同じく評価のたびに送出させる
+            pass
+        else:
+            if template.parts is None:
+                value = template.value
+
+                def string(it):
+                    it.last_node = node
+                    return value
+                return string
+
+            parts = template.parts
+
+            def interpolated_string(it):
+                it.last_node = node
+                return apply_macros(''.join([part if type(part) is str else str(it.run(part))
+                                             for part in parts]), macros)
+            return interpolated_string
+
+        interpolation_re = interpreter.LagoonInterpreter.interpolation_re
+
+        def evaluated_string(it):
+            it.last_node = body_node
+            string = string_body(node)
+            it.last_node = node
+            if 'i' in macros:
+                string = interpolation_re.sub(lambda m: str(it.eval_(m.group(1))), string)
+            return apply_macros(string, macros)
+        return evaluated_string
+
+    def compile_empty(self, node):
+        def empty(it):
+            it.last_node = node
+            return iter(())
+        return empty
+
+    def gen_element(self, node):
+        """内包表記の要素を求める関数（内包表記のインタプリタと代入した値を引数に取る）"""
+        elems = tuple(self.compile(n) for n in interpreter.gen_elements(node))
+        if not elems:
+            def item_element(frame, item):
+                return item
+            return item_element
+        elif len(elems) == 1:
+            element = elems[0]
+
+            def sequence_element(frame, item):
+                return element(frame)
+            return sequence_element
+        key, value = elems
+
+        def mapping_element(frame, item):
+            return (key(frame), value(frame))
+        return mapping_element
+
+    def common_compile_gen(self, node):
+        """内包表記の要素を順に求めるジェネレータ（g[...]、LagoonInterpreter.common_visit_genと同じ）"""
+        element = self.gen_element(node)
+        assign_ = self.compile(node.targets)
+        container_ = self.compile(node.iter)
+        condition = self.compile(node.condition) if node.condition else None
+        scope = node.scope
+
+        def gen(it):
+            container = container_(it)
+            last_node = it.last_node
+            frame = it.comprehension_frame(scope)
+            try:
+                assign = assign_(frame)
+            except Exception:
+                it.last_node = frame.last_node
+                raise
+            frame.last_node = last_node
+
+            def gen():
+                for item in container:
+                    try:
+                        frame.assign(assign, value=item)
+                        if condition and not condition(frame):
+                            continue
+                        value = element(frame, item)
+                    finally:
+                        it.last_node = frame.last_node
+                    yield value
+
+            return gen()
+        return gen
+
+    def collect_gen(self, node):
+        """内包表記の要素のリストを求めるクロージャ（LagoonInterpreter.collect_genと同じ）"""
+        container_ = self.compile(node.iter)
+        condition = self.compile(node.condition) if node.condition else None
+        scope = node.scope
+
+        targets = node.targets.targets
+        slots_ = tuple(t.slot for t in targets) if all(
+            isinstance(t, syntaxtree.NameTarget) and t.slot is not None for t in targets) else None
+        if slots_ is not None and len(slots_) == 1:
+            # 代入先のスロットをPythonの内包表記の代入先にする
+            slot, = slots_
+            elems = tuple(self.compile(n) for n in interpreter.gen_elements(node))
+
+            def collect_slot(it):
+                container = container_(it)
+                last_node = it.last_node
+                frame = it.comprehension_frame(scope)
+                frame.last_node = last_node
+                slots = frame.slots
+                try:
+                    if len(elems) == 1:
+                        element, = elems
+                        if condition is None:
+                            return [element(frame) for slots[slot] in container]
+                        return [element(frame) for slots[slot] in container if condition(frame)]
+                    elif elems:
+                        key, value = elems
+                        return [(key(frame), value(frame)) for slots[slot] in container
+                                if condition is None or condition(frame)]
+                    return [slots[slot] for slots[slot] in container
+                            if condition is None or condition(frame)]
+                finally:
+                    it.last_node = frame.last_node
+                    if frame.captured:
+                        it.captured = True
+            return collect_slot
+
+        element = self.gen_element(node)
+        assign_ = self.compile(node.targets)
+
+        def collect(it):
+            container = container_(it)
+            last_node = it.last_node
+            frame = it.comprehension_frame(scope)
+            try:
+                assign = assign_(frame)
+                frame.last_node = last_node
+                slots = frame.slots if slots_ is not None else None
+                values = []
+                for item in container:
+                    if slots is not None and type(item) is tuple and len(item) == len(slots_):
+                        # 要素の数が合うタプルは、各スロットに直接代入する
+                        for slot, value in zip(slots_, item):
+                            slots[slot] = value
+                    else:
+                        frame.assign(assign, value=item)
+                    if condition is None or condition(frame):
+                        values.append(element(frame, item))
+                return values
+            finally:
+                it.last_node = frame.last_node
+                if frame.captured:
+                    it.captured = True
+        return collect
+
+    def compile_sequence_gen(self, node):
+        return self.common_compile_gen(node)
+
+    def compile_sequence_items(self, node):
+        items = tuple(self.compile(c) for c in node.values)
+
+        def sequence_items(it):
+            it.last_node = node
+            return (item(it) for item in items)
+        return sequence_items
+
+    def container(self, node, struct):
+        if isinstance(node.items, (syntaxtree.SequenceGen, syntaxtree.MappingGen)):
+            # 内包表記はジェネレータを介さずにリストを求める
+            collect = self.collect_gen(node.items)
+            if struct is list:
+                return collect
+
+            def collection(it):
+                return struct(collect(it))
+            return collection
+        items = self.compile(node.items)
+
+        def container(it):
+            return struct(items(it))
+        return container
+
+    def compile_list(self, node):
+        return self.container(node, list)
+
+    def compile_tuple(self, node):
+        return self.container(node, tuple)
+
+    def compile_set(self, node):
+        return self.container(node, set)
+
+    def compile_frozenset(self, node):
+        return self.container(node, frozenset)
+
+    def compile_generator(self, node):
+        items = self.compile(node.items)
+
+        def generator(it):
+            it.captured = True
+            return items(it)
+        return generator
+
+    def compile_mapping_gen(self, node):
+        return self.common_compile_gen(node)
+
+    def compile_mapping_items(self, node):
+        items = tuple((self.compile(key), self.compile(value)) for key, value in node.items)
+
+        def mapping_items(it):
+            it.last_node = node
+            return ((key(it), value(it)) for key, value in items)
+        return mapping_items
+
+    def compile_table(self, node):
+        LagoonTable = interpreter.LagoonTable
+        items = tuple((name, self.compile(value)) for name, value in node.items)
+
+        def table(it):
+            if not items:
+                it.last_node = node
+            return LagoonTable(**{name: value(it) for name, value in items})
+        return table
+
+    def compile_dict(self, node):
+        return self.container(node, dict)
+
+    def compile_ordereddict(self, node):
+        return self.container(node, collections.OrderedDict)
+
+    def compile_callable(self, node):
+        LagoonFunction = interpreter.LagoonFunction
+        LagoonAsyncFunction = interpreter.LagoonAsyncFunction
+        coroutine = node.coroutine
+        arg_names = []
+        static_defaults = []
+        dynamic_defaults = {}
+        for param in node.params:
+            arg_names.append(param.name)
+            if param.default is None:
+                pass
+            elif param.dynamic:
+                dynamic_defaults[param.name] = param.default
+            else:
+                static_defaults.append((param.name, self.compile(param.default)))
+        # 引数名と静的なデフォルト値のうち、最後に記録されるノード
+        last_node = node.record
+        block_node = node.body
+        scope = node.scope
+
+        def callable_(it):
+            static_defaults_ = {}
+            for arg_name, value in static_defaults:
+                static_defaults_[arg_name] = value(it)
+            if last_node is not None:
+                it.last_node = last_node
+            it.captured = True
+            # Callableの種類が増えた場合はここで振り分ける
+            Callable = LagoonAsyncFunction if coroutine else LagoonFunction
+            return Callable(block_node, arg_names,
+                            static_defaults_, dynamic_defaults, it, scope)
+        return callable_
+
+    # characters
+
+    def compile_ref_name(self, node):
+        return self.reference(node.name, node, node.binding)
+
+
+class TracingCompiler(LagoonCompiler):
+
+    """
+    トレースのフックがある間に用いるコンパイラ
+    ブロックの要素ごとにline, exceptionイベントを発生させる
+    """
+
+    def compile_block(self, node):
+        EXIT = interpreter.EXIT
+        trace = interpreter.trace
+        children = tuple((not isinstance(child_node, syntaxtree.Comment), child_node,
+                          self.compile(child_node))
+                         for child_node in node.stats)
+
+        def block(it):
+            for traced, child_node, child in children:
+                if traced:
+                    trace('line', it.node_location(child_node), None)
+                try:
+                    result = child(it)
+                except Exception as error:
+                    trace('exception', it.node_location(child_node), error)
+                    raise
+                if result is EXIT:
+                    return EXIT
+            return result
+        return block
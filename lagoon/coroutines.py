@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+# 非同期関数の実行
+# 非同期関数（async {...}）を呼び出すとPythonのコルーチンを返す
+# 本体は通常stackevalのステップにし、コルーチンの中でジェネレータとして実行する（stackeval.drive_async）
+# ここでは本体をジェネレータにできない場合の、本体をコルーチンごとのスレッドで実行する方法を実装する
+#   - Pythonモードの本体（Pythonの関数に変換される）
+#   - ステップにならない位置（リテラルや内包表記、文字列の式展開の中など）にawait式を含む本体
+#   - --asyncのプログラム全体（lagoon.executeなどを一つの本体としてイベントループの上で実行する）
+# 本体のスレッドとイベントループのスレッドは交互に動く（一方が動く間、もう一方は止まっている）
+# 本体のawait式は待つ値をコルーチンへ渡して本体のスレッドを止め、コルーチンが値を待った結果で再開する
+# したがって本体はイベントループの上で（コルーチンの一歩として）実行され、他のコルーチンへはawaitでしか切り替わらない
+# asyncioは読み込みに時間がかかるので、コルーチンを実行するときに読み込む
+
+import exceptions
+
+import inspect
+import threading
+
+# スレッドごとの実行中の本体（Body）
+state = threading.local()
+
+
+class Body(object):
+
+    """
+    非同期関数の本体を実行するスレッド（本体をジェネレータにできない場合に用いる）
+    switchとwaitで、イベントループのスレッドと制御を受け渡す
+    """
+
+    def __init__(self, loop, function, args):
+        self.loop = loop
+        # イベントループのスレッド（本体はこのスレッドと交互に動くので、同じスレッドとみなす）
+        self.loop_thread = threading.get_ident()
+        self.function = function
+        self.args = args
+        self.thread = None
+        # 本体のスレッドが再開を待つ
+        self.resumed = threading.Semaphore(0)
+        # イベントループのスレッドが本体の停止を待つ
+        self.suspended = threading.Semaphore(0)
+        # 本体へ渡す (値, 例外) と、本体から受け取る (種類, 値)
+        self.sent = None
+        self.message = None
+
+    def switch(self, value, error=None):
+        """
+        本体をvalueで再開し（errorがあれば送出させ）、本体が止まるまで待つ
+        本体が止まった理由を ('await', 待つ値), ('return', 返り値), ('raise', 例外) で返す
+        """
+        self.sent = value, error
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        else:
+            self.resumed.release()
+        self.suspended.acquire()
+        return self.message
+
+    def run(self):
+        import asyncio.events
+        # 本体の中でも実行中のイベントループを参照できるようにする（asyncio.create_taskなど）
+        asyncio.events._set_running_loop(self.loop)
+        state.body = self
+        try:
+            self.message = 'return', self.function(*self.args)
+        except BaseException as error:
+            self.message = 'raise', error
+        finally:
+            state.body = None
+            asyncio.events._set_running_loop(None)
+            self.suspended.release()
+
+    def wait(self, awaitable):
+        """本体のスレッドを止め、コルーチンがawaitableを待った結果を返す"""
+        self.message = 'await', awaitable
+        self.suspended.release()
+        self.resumed.acquire()
+        value, error = self.sent
+        if error is not None:
+            raise error
+        return value
+
+
+async def run_body(function, *args):
+    """function(*args)を本体とするコルーチン（本体のawait式の値はここで待つ）"""
+    import asyncio
+    body = Body(asyncio.get_running_loop(), function, args)
+    kind, value = body.switch(None)
+    while kind == 'await':
+        try:
+            result = await value
+        except GeneratorExit:
+            # コルーチンが閉じられた（本体に送出して終わらせてから閉じる）
+            body.switch(None, GeneratorExit())
+            raise
+        except BaseException as error:
+            kind, value = body.switch(None, error)
+        else:
+            kind, value = body.switch(result)
+    if kind == 'raise':
+        raise value
+    return value
+
+
+def await_(value):
+    """
+    await式：実行中の非同期関数の本体のスレッドを止めてvalueを待ち、その結果を返す
+    ジェネレータで実行する本体のawait式はここを通らない（stackeval.driveがコルーチンで待つ）
+    """
+    body = getattr(state, 'body', None)
+    if body is None:
+        raise exceptions.LagoonOtherError('Cannot await outside async function')
+    if not inspect.isawaitable(value):
+        raise exceptions.LagoonTypeError('Value to await must be awaitable')
+    return body.wait(value)
+
+
+def thread_ident():
+    """実行中のスレッドの識別子（非同期関数の本体ではイベントループのスレッドのもの）"""
+    body = getattr(state, 'body', None)
+    if body is None:
+        return threading.get_ident()
+    return body.loop_thread
+
+
+def run(function, *args):
+    """--asyncの実行：イベントループを作り、function(*args)を本体として最後まで実行する"""
+    import asyncio
+    return asyncio.run(run_body(function, *args))
+
+
+# ビルトイン
+
+async def gather(*awaitables, return_exceptions=False):
+    """
+    すべてのawaitableを並行して待ち、結果をリストで返す
+    awaitableでない値を一つだけ与えれば、その要素を待つ（gather([f(x) for x in xs])など）
+    """
+    import asyncio
+    if len(awaitables) == 1 and not inspect.isawaitable(awaitables[0]):
+        awaitables = tuple(awaitables[0])
+    return list(await asyncio.gather(*awaitables, return_exceptions=return_exceptions))
+
+
+async def sleep(seconds, result=None):
+    """seconds秒待ってresultを返す"""
+    import asyncio
+    return await asyncio.sleep(seconds, result)
+
+
+async def wait_for(awaitable, timeout):
+    """awaitableを待つ（timeout秒を過ぎればキャンセルしてTimeoutErrorを送出する）"""
+    import asyncio
+    return await asyncio.wait_for(awaitable, timeout)
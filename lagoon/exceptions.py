@@ -17,5 +17,9 @@ class LagoonTypeError(LagoonError):
     pass
 
 
+class LagoonLoadError(LagoonError):
+    pass
+
+
 class LagoonOtherError(LagoonError):
     pass
@@ -2,21 +2,25 @@
 
 import monkeypatch  # noqa
 import exceptions
+import compiler
+import coroutines
+import parallel
+import resolver
+import stackeval
+import syntaxtree
 
 import importlib
 import collections
+import collections.abc
 import functools
 import argparse
+import bisect
+import itertools
 import re
 
 
-RefChainElem = collections.namedtuple('RefChainElem', 'name')
-NodeChainElem = collections.namedtuple('NodeChainElem', 'node')
-CallChainElem = collections.namedtuple('CallChainElem', 'arg_nodes')
-AttrChainElem = collections.namedtuple('AttrChainElem', 'name')
-IndexChainElem = collections.namedtuple('IndexChainElem', 'key')
-
 NameAssign = collections.namedtuple('NameAssign', 'name')
+LocalAssign = collections.namedtuple('LocalAssign', 'slot')
 AttrAssign = collections.namedtuple('AttrAssign', 'obj, name')
 IndexAssign = collections.namedtuple('IndexAssign', 'obj, index')
 
@@ -26,32 +30,171 @@ class AssignTuple(tuple):
     pass
 
 
-class Continued(object):
+class Exit(object):
+
+    """
+    ブロックを抜ける制御（continue, break, return）を示す唯一の値EXITの型
+    文はEXITを返してブロックを抜け、抜けるループの数と返り値はフレームのexiting, returnedが持つ
+    （continueならば0、break nならばn、returnならばRETURN_DEPTH）
+    """
+
+    __slots__ = ()
+
+    def __repr__(self):
+        return 'EXIT'
+
+
+EXIT = Exit()
+RETURN_DEPTH = float('INF')
+
+
+def apply_macros(string, macros):
+    """文字列への式展開以外のマクロの適用"""
+    if 'a' in macros or 'd' in macros:
+        from textwrap import dedent
+        string = dedent(string)
+    if 'a' in macros or 'l' in macros:
+        string = string.lstrip('\n')
+    if 'a' in macros or 'r' in macros:
+        string = string.rstrip('\n')
+    if '~' in macros:
+        string = re.compile(string)
+    if 'b' in macros:
+        string = string.encode('utf8')
+    return string
+
+
+def gen_elements(node):
+    """内包表記の要素の式の組（要素そのものを生成するならば空）"""
+    if isinstance(node, syntaxtree.SequenceGen):
+        return (node.element,) if node.element else ()
+    return (node.key, node.value) if node.key else ()
+
+
+def string_body(node):
+    """文字列リテラルの本体（二重引用符ならばエスケープを解釈する）"""
+    if node.style in {'dq_heredoc', 'dq_string'}:
+        return node.contents.encode('raw_unicode_escape').decode('unicode_escape')
+    return node.contents
 
-    def __init__(self):
-        pass
 
-    @property
-    def valid(self):
-        return True
+class StringTemplate(object):
 
+    """
+    文字列リテラルの評価の準備（ツリーモードでは最初の評価でStringノードに保存する）
+    式展開があればpartsに文字列と式展開の式（Expression）を持ち、評価のたびに式の値を埋めて
+    マクロを適用する。無ければvalueにマクロを適用した値を持つ
+    """
+
+    __slots__ = ('parts', 'macros', 'value')
+
+    def __init__(self, string, macros):
+        self.macros = macros
+        if 'i' in macros:
+            import lagoon
+            parts = []
+            last = 0
+            for match in LagoonInterpreter.interpolation_re.finditer(string):
+                if match.start() > last:
+                    parts.append(string[last:match.start()])
+                parts.append(lagoon.lower_expression(match.group(1)))
+                last = match.end()
+            if last < len(string):
+                parts.append(string[last:])
+            self.parts = tuple(parts)
+            self.value = None
+        else:
+            self.parts = None
+            self.value = apply_macros(string, macros)
 
-class Broken(Continued):
+    def evaluate(self, it):
+        """itの名前空間で式展開した文字列"""
+        if self.parts is None:
+            return self.value
+        return apply_macros(''.join([part if type(part) is str else str(it.run(part))
+                                     for part in self.parts]), self.macros)
 
-    def __init__(self, depth):
-        super().__init__()
-        self.depth = depth
 
-    @property
-    def valid(self):
-        return self.depth > 0
+# 継承元のテーブルの名前が増減するたびに改める、属性の探索のキャッシュの世代
+table_generation = 0
+# 世代の番号（複数のスレッドが同時に改めても同じ番号にならない）
+generations = itertools.count(1)
 
+# テーブル以外の継承元（その都度getattrで探す）
+FOREIGN = object()
 
-class Returned(Broken):
 
-    def __init__(self, result):
-        super().__init__(float('INF'))
-        self.result = result
+class TableShape(object):
+
+    """
+    LagoonTableの形
+    gettersはget_に続く名前から関数への辞書、metatableは継承元（無ければNone）
+    prototypeは他のテーブルの継承元になったか
+    inheritedは継承した属性の場所、settersは代入する名前から (set_の関数の場所, 形を変える名前か) への
+    キャッシュである（場所はfind_attributeを参照）
+    形はget_, set_で始まる名前とmetatableへの代入・削除で作り直し、
+    継承元のテーブルの名前の増減はtable_generationを改めて全てのキャッシュを無効にする
+    """
+
+    __slots__ = ('getters', 'metatable', 'prototype', 'inherited', 'setters', 'generation')
+
+    def __init__(self, namespace, prototype=False):
+        self.getters = {name[4:]: value for name, value in namespace.items()
+                        if name.startswith('get_')}
+        self.metatable = namespace.get('metatable')
+        if isinstance(self.metatable, LagoonTable):
+            self.metatable.__shape__.prototype = True
+        self.prototype = prototype
+        self.flush()
+
+    def flush(self):
+        # 先に世代を読む（キャッシュを作り直す間に世代が改められれば、次の参照で再び作り直す）
+        generation = table_generation
+        self.inherited = {}
+        self.setters = {}
+        self.generation = generation
+
+
+def find_attribute(table, name):
+    """
+    tableの属性nameを、通常の属性・get_の関数・metatableの順に探す
+    見つかれば場所 (テーブル, get_の関数またはNone) を、
+    テーブル以外の継承元に至れば (継承元, FOREIGN) を、無ければNoneを返す
+    """
+    while True:
+        if name in table.__dict__:
+            return table, None
+        shape = table.__shape__
+        if name in shape.getters:
+            return table, shape.getters[name]
+        table = shape.metatable
+        if table is None:
+            return None
+        if not isinstance(table, LagoonTable):
+            return table, FOREIGN
+
+
+def attribute_value(place, name):
+    """find_attributeが返した場所にある属性nameの値"""
+    owner, getter = place
+    if getter is None:
+        return owner.__dict__[name]
+    elif getter is FOREIGN:
+        return getattr(owner, name)
+    return getter(current=owner)
+
+
+def reshape_table(table, hook, added):
+    """
+    tableの名前の代入・削除の後に形を作り直し、継承元ならばキャッシュの世代を改める
+    hookは形を変える名前か、addedは名前が増減したか
+    """
+    global table_generation
+    shape = table.__shape__
+    if hook:
+        object.__setattr__(table, '__shape__', TableShape(table.__dict__, shape.prototype))
+    if shape.prototype and (hook or added):
+        table_generation = next(generations)
 
 
 class LagoonTable(argparse.Namespace):
@@ -62,28 +205,65 @@ class LagoonTable(argparse.Namespace):
     AttributeErrorのとき要素metatableがあればそちらを読みに行く
     他のLagoonTableに追加されたとき、それを親として記憶する
     （すでに親が存在する場合は上書きする）
+    get_, set_の関数とmetatableは形（TableShape）に記録し、探索の結果をキャッシュする
     """
 
+    __slots__ = ('__shape__',)
+
+    def __new__(cls, *args, **kwargs):
+        table = super().__new__(cls)
+        object.__setattr__(table, '__shape__', TableShape({}))
+        return table
+
+    def __getstate__(self):
+        return self.__dict__
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        object.__setattr__(self, '__shape__', TableShape(self.__dict__))
+
     def __getattr__(self, name):
-        try:
-            getter = object.__getattribute__(self, 'get_{}'.format(name))
-            return getter(current=self)
-        except AttributeError:
-            try:
-                metatable = object.__getattribute__(self, 'metatable')
-                return getattr(metatable, name)
-            except AttributeError:
-                raise
+        shape = self.__shape__
+        if shape.generation != table_generation:
+            shape.flush()
+        # 探索の間に他のスレッドが作り直したキャッシュへは書き込まない
+        inherited = shape.inherited
+        place = inherited.get(name)
+        if place is None:
+            place = find_attribute(self, name)
+            if place is None:
+                raise AttributeError(
+                    "'LagoonTable' object has no attribute '{}'".format(name))
+            if place[1] is not FOREIGN:
+                inherited[name] = place
+        return attribute_value(place, name)
 
     def __setattr__(self, name, value):
         if isinstance(value, LagoonTable):
             if name != 'parent':
                 setattr(value, 'parent', self)
-        try:
-            setter = getattr(self, 'set_{}'.format(name))
-            object.__setattr__(self, name, setter(value, current=self))
-        except AttributeError:
-            object.__setattr__(self, name, value)
+        shape = self.__shape__
+        if shape.generation != table_generation:
+            shape.flush()
+        setters = shape.setters
+        entry = setters.get(name)
+        if entry is None:
+            place = find_attribute(self, 'set_{}'.format(name))
+            entry = (place, name.startswith(('get_', 'set_')) or name == 'metatable')
+            if place is None or place[1] is not FOREIGN:
+                setters[name] = entry
+        place, hook = entry
+        if place is not None:
+            if place[1] is FOREIGN:
+                setter = getattr(place[0], 'set_{}'.format(name), None)
+            else:
+                setter = attribute_value(place, 'set_{}'.format(name))
+            if setter is not None:
+                value = setter(value, current=self)
+        added = name not in self.__dict__
+        object.__setattr__(self, name, value)
+        if hook or (added and shape.prototype):
+            reshape_table(self, hook, added)
 
     def __delattr__(self, name):
         value = getattr(self, name)
@@ -91,10 +271,266 @@ class LagoonTable(argparse.Namespace):
             if name != 'parent':
                 delattr(value, 'parent')
         object.__delattr__(self, name)
+        reshape_table(self, name.startswith(('get_', 'set_')) or name == 'metatable', True)
+
+
+class LagoonModule(object):
+
+    """
+    Lagoonファイルのモジュール
+    属性はファイルの名前空間をそのまま参照する（コピーしない）
+    """
+
+    def __init__(self, namespace, mtime):
+        self.__update__(namespace, mtime)
+
+    def __update__(self, namespace, mtime):
+        object.__setattr__(self, '__namespace__', namespace)
+        object.__setattr__(self, '__mtime__', mtime)
+
+    def __getattr__(self, name):
+        try:
+            return self.__namespace__[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        self.__namespace__[name] = value
+
+    def __delattr__(self, name):
+        try:
+            del self.__namespace__[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __dir__(self):
+        # ビルトインを除いた、ファイルで定義された名前
+        return list(self.__namespace__.maps[0])
+
+    def __repr__(self):
+        return '<LagoonModule {!r}>'.format(self.__namespace__['__lagoonfile__'])
+
+    def __reduce__(self):
+        # 別のプロセスではファイルを読み込み直す
+        return parallel.load_module, (self.__namespace__['__lagoonfile__'],
+                                      self.__namespace__['__interpreter__'].mode)
+
+
+# トレース:
+
+# 実行を監視するフック（settraceで設定する）
+trace_hook = None
+# 最後にexceptionイベントを発生させた例外（伝播の途中で繰り返し報告しない）
+traced_exception = None
+# フックがある間だけ差し替える実装 [(クラスまたはモジュール, 名前, 通常の実装, トレースする実装)]
+traced_methods = []
+
+Location = collections.namedtuple('Location', 'file, line, column')
+
+
+def settrace(hook):
+    """
+    実行を監視するフックを設定する（Noneで解除する）
+    フックは hook(event, location, arg) の形で呼び出される
+        'line': ブロックの要素を実行する前（argはNone）
+        'call': Lagoonの関数を呼び出したとき（argは関数）
+        'return': 関数から戻るとき（argは返り値）
+        'exception': 例外が発生したとき（argは例外）
+    locationはLagoonソースの位置 Location(ファイル, 行, 列) である
+    フックが無い間は通常の実装を用いるので、実行速度は変わらない
+    """
+    global trace_hook
+    trace_hook = hook
+    for owner, name, plain, traced in traced_methods:
+        setattr(owner, name, plain if hook is None else traced)
+
+
+def gettrace():
+    """設定されているフックを返す"""
+    return trace_hook
+
+
+def register_traced(owner, name, traced):
+    """フックがある間、owner.nameをtracedに差し替える"""
+    traced_methods.append((owner, name, vars(owner)[name], traced))
+    if trace_hook is not None:
+        setattr(owner, name, traced)
+
+
+def trace(event, location, arg):
+    """フックの呼び出し"""
+    global traced_exception
+    if event == 'exception':
+        if arg is traced_exception:
+            return
+        traced_exception = arg
+    trace_hook(event, location, arg)
+
+
+@functools.lru_cache(maxsize=32)
+def line_starts(text):
+    """各行の開始位置の列"""
+    return [0] + [match.end() for match in re.finditer('\n', text)]
+
+
+def location(file_path, text, pos):
+    """textのposの位置"""
+    starts = line_starts(text)
+    lineno = bisect.bisect_right(starts, pos)
+    return Location(file_path, lineno, pos - starts[lineno - 1])
+
+
+def traced_call(call):
+    """call, returnイベントを発生させる__call__（またはcall_method）を返す"""
+    def __call__(self, *args, **kwargs):
+        location_ = self.location()
+        trace('call', location_, self)
+        result = call(self, *args, **kwargs)
+        trace('return', location_, result)
+        return result
+    return __call__
 
 
 class LagoonCallable(object):
-    pass
+
+    """
+    Lagoonの呼び出し可能なオブジェクト
+    テーブルの属性として参照すると、テーブルをcurrentに束縛したLagoonMethodになる
+    """
+
+    __slots__ = ()
+
+    def call_method(self, current, args, kwargs):
+        """currentを束縛して呼び出す（キーワード引数のcurrentが優先される）"""
+        return self(*args, **{'current': current, **kwargs})
+
+
+class LagoonMethod(object):
+
+    """
+    currentを束縛したLagoonCallable（functools.partialの代わり）
+    LagoonCallableではないので、他のテーブルの属性にしても束縛し直されない
+    """
+
+    __slots__ = ('function', 'current')
+
+    def __init__(self, function, current):
+        self.function = function
+        self.current = current
+
+    def __call__(self, *args, **kwargs):
+        return self.function.call_method(self.current, args, kwargs)
+
+    def __repr__(self):
+        return '<bound {!r} of {!r}>'.format(self.function, self.current)
+
+
+class Signature(object):
+
+    """
+    関数の引数の並びとデフォルト値
+    呼び出しの引数を検査して、関数のローカルな名前空間に束縛する
+    名前付き引数を持たない関数は、任意の数の位置引数を%0, %1, ...で受け取る
+    """
+
+    def __init__(self, arg_names, static_defaults, dynamic_defaults, scope=None):
+        self.arg_names = tuple(arg_names)
+        self.static_defaults = static_defaults
+        self.dynamic_defaults = dynamic_defaults
+        self.arity = len(self.arg_names)
+        # currentは予約されたキーワード引数
+        self.keywords = frozenset(self.arg_names) | {'current'}
+        # 名前を解決した関数のローカル変数のスロット（resolver.Scope）
+        self.scope = scope
+        if scope is not None:
+            self.unbound = (UNBOUND,) * (len(scope.names) - scope.bound)
+
+    def bind(self, args, kwargs, evaluate, current=None):
+        """
+        引数を束縛した名前空間を返す
+        evaluateは~=のデフォルト値を評価する関数で、引数が省略されたときだけ呼び出す
+        currentはキーワード引数のcurrentが無いときの値
+        """
+        arg_names = self.arg_names
+        arity = self.arity
+        count = len(args)
+        if count == arity and not kwargs:
+            # すべての引数を位置引数で受け取る場合
+            arg_namespace = dict(zip(arg_names, args))
+            arg_namespace['args'] = args
+            arg_namespace['current'] = current
+            return arg_namespace
+        if count > arity and arg_names:
+            raise exceptions.LagoonTypeError(
+                'Takes {} positional arguments but {} were given'.format(arity, count))
+        arg_namespace = dict(zip(arg_names, args))
+        if kwargs:
+            keywords = self.keywords
+            for name, value in kwargs.items():
+                if name not in keywords:
+                    raise exceptions.LagoonTypeError(
+                        'Unexpected keyword argument {}'.format(name))
+                if name in arg_namespace and name != 'current':
+                    raise exceptions.LagoonTypeError(
+                        'Multiple values for argument {}'.format(name))
+                arg_namespace[name] = value
+        if count < arity:
+            for name in arg_names[count:]:
+                if name in arg_namespace:
+                    continue
+                if name in self.static_defaults:
+                    arg_namespace[name] = self.static_defaults[name]
+                elif name in self.dynamic_defaults:
+                    arg_namespace[name] = evaluate(self.dynamic_defaults[name])
+                else:
+                    raise exceptions.LagoonTypeError('Missing argument {}'.format(name))
+        arg_namespace['args'] = args
+        arg_namespace['current'] = kwargs.get('current', current)
+        return arg_namespace
+
+    def bind_slots(self, args, kwargs, evaluate, current=None):
+        """引数を束縛したローカル変数のスロットの列を返す"""
+        scope = self.scope
+        if (len(args) == self.arity and scope.plain
+                and (not kwargs or (len(kwargs) == 1 and 'current' in kwargs))):
+            # すべての引数を位置引数で受け取る場合（メソッドとしての呼び出しを含む）
+            return [*args, args, kwargs.get('current', current) if kwargs else current,
+                    *self.unbound]
+        if not scope.plain:
+            # 引数の名前が重複する場合など
+            arg_namespace = self.bind(args, kwargs, evaluate, current)
+            return [arg_namespace.get(name, UNBOUND) for name in scope.names]
+        arg_names = self.arg_names
+        arity = self.arity
+        count = len(args)
+        if count > arity and arg_names:
+            raise exceptions.LagoonTypeError(
+                'Takes {} positional arguments but {} were given'.format(arity, count))
+        values = list(args[:arity])
+        if count < arity:
+            values.extend((UNBOUND,) * (arity - count))
+        for name, value in kwargs.items():
+            if name == 'current':
+                continue
+            slot = scope.slots.get(name)
+            if slot is None or slot >= arity:
+                raise exceptions.LagoonTypeError('Unexpected keyword argument {}'.format(name))
+            if slot < count:
+                raise exceptions.LagoonTypeError('Multiple values for argument {}'.format(name))
+            values[slot] = value
+        for slot in range(count, arity):
+            if values[slot] is UNBOUND:
+                name = arg_names[slot]
+                if name in self.static_defaults:
+                    values[slot] = self.static_defaults[name]
+                elif name in self.dynamic_defaults:
+                    values[slot] = evaluate(self.dynamic_defaults[name])
+                else:
+                    raise exceptions.LagoonTypeError('Missing argument {}'.format(name))
+        values.append(args)
+        values.append(kwargs.get('current', current))
+        values.extend(self.unbound)
+        return values
 
 
 class LagoonFunction(LagoonCallable):
@@ -102,31 +538,215 @@ class LagoonFunction(LagoonCallable):
     """
     Lagoonの関数
     名前空間を保持する（レキシカルスコープ）
+    呼び出しごとのインタプリタ（フレーム）は、内側の関数やジェネレータに
+    捕捉されなかったものを次の呼び出しで再利用する
+    scopeがあれば（名前を解決した関数ならば）ローカル変数をスロットの列に持つLagoonFrameで、
+    無ければ辞書の名前空間を持つLagoonInterpreterで実行する
     """
 
     def __init__(self, block_node, arg_names,
-                 static_defaults, dynamic_defaults, interpreter):
+                 static_defaults, dynamic_defaults, interpreter, scope=None):
         self.block_node = block_node
-        self.arg_names = arg_names
-        self.static_defaults = static_defaults
-        self.dynamic_defaults = dynamic_defaults
+        self.signature = Signature(arg_names, static_defaults, dynamic_defaults, scope)
         self.interpreter = interpreter
+        self.frames = []
 
     def __call__(self, *args, **kwargs):
-        arg_namespace = {}
-        arg_namespace.update(self.static_defaults)
-        arg_namespace.update({k: self.interpreter.run(v)
-                              for k, v in self.dynamic_defaults.items()})
-        arg_namespace.update(zip(self.arg_names, args))
-        arg_namespace.update(kwargs)
-        arg_namespace['args'] = args
-        arg_namespace['current'] = kwargs.get('current', None)
-        namespaces = self.interpreter.namespaces + [arg_namespace]
-        result = LagoonInterpreter(namespaces).run(self.block_node)
-        if isinstance(result, Returned):
-            return result.result
+        frame = self.acquire(args, kwargs)
+        try:
+            result = frame.run(self.block_node)
+            if result is EXIT:
+                result = frame.exit_value()
+        finally:
+            self.release(frame)
+        return result
+
+    def call_method(self, current, args, kwargs):
+        """メソッドとしての呼び出し（LagoonMethodを作らずにcurrentを渡す）"""
+        frame = self.acquire(args, kwargs, current)
+        try:
+            result = frame.run(self.block_node)
+            if result is EXIT:
+                result = frame.exit_value()
+        finally:
+            self.release(frame)
+        return result
+
+    def acquire(self, args, kwargs, current=None):
+        """引数を束縛したフレームを返す（スタックモードでは呼び出しごとにstackevalが用いる）"""
+        signature = self.signature
+        if signature.scope is None:
+            local_values = signature.bind(args, kwargs, self.interpreter.evaluate_default, current)
+        else:
+            local_values = signature.bind_slots(args, kwargs, self.interpreter.evaluate_default,
+                                                current)
+        frames = self.frames
+        frame = None
+        if frames:
+            try:
+                frame = frames.pop()
+            except IndexError:
+                # 他のスレッドが先に取り出した
+                pass
+        if frame is not None:
+            frame.enter(local_values)
+        elif signature.scope is None:
+            frame = LagoonInterpreter(self.interpreter.namespaces + [local_values],
+                                      self.interpreter.mode)
         else:
-            return result
+            frame = LagoonFrame(signature.scope, self.interpreter, local_values)
+        return frame
+
+    def release(self, frame):
+        """呼び出しを終えたフレームを、捕捉されていなければ再利用まで待たせる"""
+        if not frame.captured:
+            frame.leave()
+            self.frames.append(frame)
+
+    def location(self):
+        """関数の本体の位置"""
+        return self.interpreter.node_location(self.block_node)
+
+    def __getstate__(self):
+        """
+        別のプロセスへ送る状態（本体の構文木、引数、定義したインタプリタと、参照する大域の値）
+        再利用を待つフレームは送らない
+        """
+        names = resolver.referenced_names(self.block_node)
+        for default in self.signature.dynamic_defaults.values():
+            default_names = resolver.referenced_names(default)
+            names = None if names is None or default_names is None else names | default_names
+        return (self.block_node, self.signature, self.interpreter,
+                capture_globals(self.interpreter.builtins['__interpreter__'], names))
+
+    def __setstate__(self, state):
+        self.block_node, self.signature, self.interpreter, captured = state
+        self.frames = []
+        restore_globals(captured)
+
+    def __copy__(self):
+        # Pythonの関数と同じく、複製しても同じ関数とする
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+class LagoonAsyncFunction(LagoonFunction):
+
+    """
+    Lagoonの非同期関数
+    呼び出すと引数を束縛し、本体を実行するコルーチンを返す
+    本体はstackevalのステップにしてコルーチンの中で実行し、await式でコルーチンを止める
+    ステップにならないawait式を含む本体だけは、coroutines.run_bodyのスレッドで実行する
+    """
+
+    def __call__(self, *args, **kwargs):
+        return self.start(self.acquire(args, kwargs))
+
+    def call_method(self, current, args, kwargs):
+        return self.start(self.acquire(args, kwargs, current))
+
+    def start(self, frame):
+        """引数を束縛したフレームで本体を実行するコルーチン"""
+        body_step, threaded = stackeval.async_body(self.block_node)
+        if threaded:
+            return coroutines.run_body(self.run_frame, frame)
+        return self.run_steps(body_step, frame)
+
+    async def run_steps(self, body_step, frame):
+        """本体のステップ（呼び出しもawait式も無ければNone）をイベントループの上で実行する"""
+        try:
+            if body_step is None:
+                result = frame.run(self.block_node)
+            else:
+                result = await stackeval.drive_async(body_step(frame))
+            if result is EXIT:
+                result = frame.exit_value()
+        finally:
+            self.release(frame)
+        return result
+
+    def run_frame(self, frame):
+        """引数を束縛したフレームで本体を（本体のスレッドで）実行する"""
+        try:
+            result = frame.run(self.block_node)
+            if result is EXIT:
+                result = frame.exit_value()
+        finally:
+            self.release(frame)
+        return result
+
+
+class ParallelLoop(object):
+
+    """
+    parallel for文の本体を、反復する値ごとに呼び出すオブジェクト
+    本体は内包表記と同じく代入先の名前を持つスコープで実行し、LagoonFunctionと同じく別のプロセスへ送る
+    """
+
+    def __init__(self, node, interpreter):
+        self.node = node
+        self.interpreter = interpreter
+
+    def __call__(self, item):
+        node = self.node
+        frame = self.interpreter.comprehension_frame(node.scope)
+        frame.assign(frame.run(node.targets), value=item)
+        if frame.run(node.body) is EXIT and frame.exiting:
+            raise exceptions.LagoonOtherError('Cannot break or return from parallel for')
+
+    def __getstate__(self):
+        return (self.node, self.interpreter,
+                capture_globals(self.interpreter.builtins['__interpreter__'],
+                                resolver.referenced_names(self.node)))
+
+    def __setstate__(self, state):
+        self.node, self.interpreter, captured = state
+        restore_globals(captured)
+
+
+def capture_globals(root, names):
+    """
+    関数を別のプロセスへ送るときに持っていく大域の値
+    rootは関数を定義したファイルのインタプリタ、namesは参照する名前（Noneならばすべての大域の名前）
+    """
+    namespace = root.globals
+    if names is None:
+        values = dict(namespace)
+    else:
+        values = {name: namespace[name] for name in names if name in namespace}
+    globalvars = root.builtins['globalvars'] if names is None or 'globalvars' in names else None
+    return root, values, globalvars
+
+
+def restore_globals(captured):
+    """capture_globalsで持ってきた値を、送られた先のファイルのインタプリタの名前空間へ戻す"""
+    root, values, globalvars = captured
+    root.globals.update(values)
+    if globalvars is not None:
+        root.builtins['globalvars'] = globalvars
+
+
+# 再利用を待つフレームの名前空間（書き込まれない）
+released_namespace = {}
+
+
+class Unbound(object):
+
+    """代入される前のローカル変数のスロットの値UNBOUNDの型（別のプロセスへ送っても同じ値になる）"""
+
+    __slots__ = ()
+
+    def __reduce__(self):
+        return 'UNBOUND'
+
+    def __repr__(self):
+        return 'UNBOUND'
+
+
+# 代入される前のローカル変数のスロットの値
+UNBOUND = Unbound()
 
 
 class AbstractInterpreter(object):
@@ -138,23 +758,84 @@ class AbstractInterpreter(object):
     def run(self, node):
         """ノードの実行"""
         # nodeに対する自クラスのvisitメソッドを呼び出す
-        visit = getattr(self, 'visit_{}'.format(node.expr_name))
-        return visit(node)
+        return getattr(self, node.visitor)(node)
 
 
 class LagoonInterpreter(AbstractInterpreter):
 
     """
     Lagoonのインタプリタ
+    modeが'tree'ならばノードを直接辿り、'closure'ならばノードを
+    コンパイルしたクロージャを実行し、'stack'ならばLagoonの関数の呼び出しを
+    明示的なスタックで行う（stackevalを参照）
     """
 
-    def __init__(self, namespaces):
+    # 外側の関数のフレーム（LagoonFrameを参照）
+    outer = None
+    # ブロックを抜ける制御の状態（Exitを参照）
+    exiting = 0
+    returned = None
+
+    def __init__(self, namespaces, mode='tree'):
         self.namespaces = namespaces
         self.valid_namespace = collections.ChainMap(*reversed(self.namespaces))
+        self.mode = mode
+        # 名前を解決した大域の名前の参照先
+        self.globals = namespaces[-1]
+        self.builtins = collections.ChainMap(*reversed(namespaces[:-1]))
+        # 関数やジェネレータに捕捉されたか（捕捉されたフレームは再利用しない）
+        self.captured = False
+
+    def __getstate__(self):
+        """
+        別のプロセスへ送る状態（ビルトインと大域の名前空間は、送られた先のファイルのインタプリタのものにする）
+        """
+        return self.builtins['__interpreter__'], self.mode, self.namespaces[2:]
+
+    def __setstate__(self, state):
+        root, mode, local_namespaces = state
+        self.__init__(root.namespaces[:2] + local_namespaces, mode)
+
+    def enter(self, arg_namespace):
+        """再利用するフレームのローカルな名前空間を差し替える"""
+        self.namespaces[-1] = arg_namespace
+        self.valid_namespace.maps[0] = arg_namespace
+
+    def leave(self):
+        """フレームを再利用まで待たせる（返り値以外のローカルな値を保持し続けないよう空にする）"""
+        self.enter(released_namespace)
+
+    def exit_loop(self):
+        """ループの本体がcontinue以外で抜けたときのループの結果（抜けるループの数を一つ減らす）"""
+        self.exiting -= 1
+        return EXIT if self.exiting else None
+
+    def exit_value(self):
+        """関数の本体がEXITを返したときの返り値（returnで抜けたのでなければNone）"""
+        returned, self.returned = self.returned, None
+        return returned if self.exiting == RETURN_DEPTH else None
 
     def run(self, node):
-        self.last_node = node
-        return super().run(node)
+        if self.mode == 'tree':
+            self.last_node = node
+            return getattr(self, node.visitor)(node)
+        elif self.mode == 'closure':
+            return compiler.closure(node)(self)
+        return stackeval.evaluate(node, self)
+
+    def evaluate_default(self, node):
+        """呼び出す関数の~=のデフォルト値を、関数を定義したこのインタプリタで評価する"""
+        return self.run(node)
+
+    def located_error(self):
+        """最後に実行したノードの位置を示すエラーを生成"""
+        location_ = location(None, self.last_node.src, self.last_node.pos)
+        return exceptions.LagoonInterpreterError(
+            'error at line {0}, column {1}'.format(location_.line, location_.column))
+
+    def node_location(self, node):
+        """ノードの位置"""
+        return location(self.valid_namespace.get('__lagoonfile__'), node.src, node.pos)
 
     def importall(self, module_name):
         module = importlib.import_module(module_name)
@@ -168,10 +849,20 @@ class LagoonInterpreter(AbstractInterpreter):
 
     def load_(self, filepath):
         import lagoon
+        return lagoon.load(self.module_path(filepath), mode=self.mode)
+
+    def reload_(self, module):
+        import lagoon
+        if isinstance(module, LagoonModule):
+            file_path = module.__lagoonfile__
+        else:
+            file_path = self.module_path(module)
+        return lagoon.load(file_path, mode=self.mode, reload=True)
+
+    def module_path(self, filepath):
+        """実行中のファイルからの相対パスを解決"""
         from os.path import join, normpath, dirname
-        namespace = lagoon.execute(
-            normpath(join(dirname(self.valid_namespace['__lagoonfile__']), filepath)))
-        return argparse.Namespace(**namespace)
+        return normpath(join(dirname(self.valid_namespace['__lagoonfile__']), filepath))
 
     def exec_(self, code):
         import lagoon
@@ -185,210 +876,193 @@ class LagoonInterpreter(AbstractInterpreter):
 
     def visit_program(self, node):
         try:
-            block_node = node.find('block')
-            if block_node:
-                self.run(block_node)
-        except exceptions.LagoonInterpreterError:
+            if node.body is not None:
+                self.run(node.body)
+        except (exceptions.LagoonInterpreterError, exceptions.LagoonLoadError):
+            # 位置を示したエラーと、読み込みの循環（except LagoonLoadErrorで捕捉できるように）はそのまま送出
             raise
         except:
-            code = self.last_node.full_text[:self.last_node.start]
-            lineno = code.count('\n') + 1
-            colno = len(re.match(r'[^\n]*', code[::-1]).group(0))
-            raise exceptions.LagoonInterpreterError(
-                'error at line {0}, column {1}'.format(lineno, colno))
+            raise self.located_error()
+
+    def visit_expression(self, node):
+        return self.run(node.body)
 
     def visit_block(self, node):
-        for child_node in node:
+        for child_node in node.stats:
             result = self.run(child_node)
-            if isinstance(result, Continued) and result.valid:
-                return result
+            if result is EXIT:
+                return EXIT
+        return result
+
+    def traced_visit_block(self, node):
+        """line, exceptionイベントを発生させるvisit_block"""
+        for child_node in node.stats:
+            if not isinstance(child_node, syntaxtree.Comment):
+                trace('line', self.node_location(child_node), None)
+            try:
+                result = self.run(child_node)
+            except Exception as error:
+                trace('exception', self.node_location(child_node), error)
+                raise
+            if result is EXIT:
+                return EXIT
         return result
 
     def visit_comm(self, node):
         pass
 
-    def visit_stat(self, node):
-        return self.run(node[0])
-
-    def visit_exp(self, node):
-        return self.run(node[0])
-
     # operator:
 
-    def visit_range(self, node, is_slice=False):
-        start_node = node.find('range_start')
-        stop_node = node.find('range_stop')
-        start = self.run(start_node[0]) if start_node else 0
-        stop = self.run(stop_node[0])
-        range_ope_node = node.find('range_ope')
-        range_ope_name = range_ope_node[0].expr_name
-        func = slice if is_slice else range
-        if range_ope_name == 'range_ope_opened':
-            return func(start, stop)
-        elif range_ope_name == 'range_ope_closed':
-            return func(start, stop + 1)
-        else:
-            assert False
+    def visit_await(self, node):
+        return coroutines.await_(self.run(node.value))
 
-    def chain(self, chain_elems):
-        chain_elems = iter(chain_elems)
-        chain_elem = next(chain_elems)
-        if isinstance(chain_elem, RefChainElem):
-            result = self.reference(chain_elem.name)
-        elif isinstance(chain_elem, NodeChainElem):
-            result = self.run(chain_elem.node)
+    def visit_range(self, node):
+        start = self.run(node.start) if node.start is not None else 0
+        stop = self.run(node.stop)
+        if node.closed:
+            return range(start, stop + 1)
         else:
-            assert False
+            return range(start, stop)
 
-        for chain_elem in chain_elems:
-            if isinstance(chain_elem, CallChainElem):
-                args = []
-                kwargs = {}
-                for arg_node in chain_elem.arg_nodes:
-                    key_node = arg_node.find('name')
-                    value_node = arg_node.find('exp')
-                    if key_node:
-                        kwargs[self.run(key_node)] = self.run(value_node)
-                    else:
-                        args.append(self.run(value_node))
-                result = result(*args, **kwargs)
-            elif isinstance(chain_elem, AttrChainElem):
-                new_result = getattr(result, chain_elem.name)
+    def chain(self, node, key_values):
+        """チェーンの評価（インデックスのキーは先に評価したkey_valuesを用いる）"""
+        head = node.head
+        if isinstance(head, str):
+            result = self.reference(head, node.binding)
+        else:
+            result = self.run(head)
+
+        # 属性として参照したLagoonCallableのテーブル（次が呼び出しならLagoonMethodを作らない）
+        owner = UNBOUND
+        for op in node.ops:
+            if isinstance(op, syntaxtree.Call):
+                args, kwargs = self.call_args(op.args)
+                if owner is UNBOUND:
+                    result = result(*args, **kwargs)
+                else:
+                    result = result.call_method(owner, tuple(args), kwargs)
+                    owner = UNBOUND
+                continue
+            if owner is not UNBOUND:
+                result = LagoonMethod(result, owner)
+                owner = UNBOUND
+            if isinstance(op, syntaxtree.Attr):
+                new_result = getattr(result, op.name)
                 if isinstance(new_result, LagoonCallable):
-                    new_result = functools.partial(new_result, current=result)
+                    owner = result
                 result = new_result
-            elif isinstance(chain_elem, IndexChainElem):
-                result = result[chain_elem.key]
+            elif isinstance(op, syntaxtree.Index):
+                result = result[key_values[op.slot]]
+            elif isinstance(op, syntaxtree.ConstIndex):
+                result = result[op.value]
             else:
                 assert False
+        if owner is not UNBOUND:
+            result = LagoonMethod(result, owner)
         return result
 
-    def chain_elems(self, node):
-        chain_elems = []
-        for child in node.children:
-            if child.expr_name == 'call_paren':
-                chain_elems.append(CallChainElem(child.findall('call_paren_arg')))
-            elif child.expr_name == 'attr_dot':
-                chain_elems.append(AttrChainElem(self.run(child[0])))
-            elif child.expr_name == 'index_ope':
-                chain_elems.append(IndexChainElem(self.run(child[0])))
+    def chain_keys(self, node):
+        """インデックスのキーを評価し、キーの後に記録される位置を記録する"""
+        key_values = [self.run(key) for key in node.keys]
+        if node.record is not None:
+            self.last_node = node.record
+        return key_values
+
+    def call_args(self, arg_nodes):
+        args = []
+        kwargs = {}
+        for arg_node in arg_nodes:
+            if arg_node.name is None:
+                args.append(self.run(arg_node.value))
             else:
-                if child.expr_name in {'symbolattr_name', 'symbolindex_name'}:
-                    chain_elems.extend(self.run(child))
-                elif child.expr_name == 'ref_name':
-                    chain_elems.append(RefChainElem(child.text))
-                else:
-                    chain_elems.append(NodeChainElem(child))
-        return chain_elems
+                value = self.run(arg_node.value)
+                self.last_node = arg_node
+                kwargs[arg_node.name] = value
+        return args, kwargs
 
     def visit_chain(self, node):
-        return self.chain(self.chain_elems(node))
-
-    def common_symbol_name(self, node, access_type):
-        assert access_type in {'attr', 'index'}
-        chain_elems = []
-        children = iter(node.children)
-        child = next(children)
-        chain_elems.append(RefChainElem(self.run(child)))
-        for child in children:
-            if access_type == 'attr':
-                chain_elems.append(AttrChainElem(self.run(child)))
-            elif access_type == 'index':
-                chain_elems.append(IndexChainElem(self.run(child)))
-        return chain_elems
-
-    def visit_symbolattr_name(self, node):
-        return self.common_symbol_name(node, 'attr')
-
-    def visit_symbolindex_name(self, node):
-        return self.common_symbol_name(node, 'index')
-
-    def visit_symbolattr(self, node):
-        symbols = {'$': 'globalvars', '@': 'current', '^': 'parent'}
-        return symbols[node.text]
-
-    def visit_symbolindex(self, node):
-        symbols = {'%': 'args'}
-        return symbols[node.text]
+        return self.chain(node, self.chain_keys(node))
 
     def visit_pow(self, node):
-        return self.run(node[0]) ** self.run(node[1])
+        return self.run(node.left) ** self.run(node.right)
 
     def visit_pos(self, node):
-        return +self.run(node[0])
+        return +self.run(node.operand)
 
     def visit_neg(self, node):
-        return -self.run(node[0])
+        return -self.run(node.operand)
 
     def visit_mul(self, node):
-        return self.run(node[0]) * self.run(node[1])
+        return self.run(node.left) * self.run(node.right)
 
     def visit_truediv(self, node):
-        return self.run(node[0]) / self.run(node[1])
+        return self.run(node.left) / self.run(node.right)
 
     def visit_mod(self, node):
-        return self.run(node[0]) % self.run(node[1])
+        return self.run(node.left) % self.run(node.right)
 
     def visit_add(self, node):
-        return self.run(node[0]) + self.run(node[1])
+        return self.run(node.left) + self.run(node.right)
 
     def visit_sub(self, node):
-        return self.run(node[0]) - self.run(node[1])
+        return self.run(node.left) - self.run(node.right)
 
     def visit_lt(self, node):
-        return self.run(node[0]) < self.run(node[1])
+        return self.run(node.left) < self.run(node.right)
 
     def visit_le(self, node):
-        return self.run(node[0]) <= self.run(node[1])
+        return self.run(node.left) <= self.run(node.right)
 
     def visit_eq(self, node):
-        return self.run(node[0]) == self.run(node[1])
+        return self.run(node.left) == self.run(node.right)
 
     def visit_ne(self, node):
-        return self.run(node[0]) != self.run(node[1])
+        return self.run(node.left) != self.run(node.right)
 
     def visit_ge(self, node):
-        return self.run(node[0]) >= self.run(node[1])
+        return self.run(node.left) >= self.run(node.right)
 
     def visit_gt(self, node):
-        return self.run(node[0]) > self.run(node[1])
+        return self.run(node.left) > self.run(node.right)
 
     def visit_is_(self, node):
-        return self.run(node[0]) is self.run(node[1])
+        return self.run(node.left) is self.run(node.right)
 
     def visit_contains(self, node):
-        return self.run(node[0]) in self.run(node[1])
+        return self.run(node.left) in self.run(node.right)
 
     def visit_not_(self, node):
-        return not self.run(node[0])
+        return not self.run(node.operand)
 
     def visit_and_(self, node):
-        return self.run(node[0]) and self.run(node[1])
+        return self.run(node.left) and self.run(node.right)
 
     def visit_or_(self, node):
-        return self.run(node[0]) or self.run(node[1])
+        return self.run(node.left) or self.run(node.right)
 
     def visit_isa(self, node):
-        return isinstance(self.run(node[0]), self.run(node[1]))
+        return isinstance(self.run(node.left), self.run(node.right))
 
     def visit_one_if(self, node):
-        return self.run(node[0]) if self.run(node[1]) else self.run(node[2])
+        return self.run(node.body) if self.run(node.test) else self.run(node.orelse)
 
     def visit_one_try(self, node):
         try:
-            return self.run(node[0])
-        except self.run(node[1]):
-            return self.run(node[2])
+            return self.run(node.body)
+        except self.run(node.exception):
+            return self.run(node.alternative)
 
     # statement:
 
     def assign(self, assignment, value):
-        if isinstance(assignment, NameAssign):
+        if isinstance(assignment, LocalAssign):
+            self.slots[assignment.slot] = value
+        elif isinstance(assignment, NameAssign):
             self.valid_namespace[assignment.name] = value
         elif isinstance(assignment, AttrAssign):
             setattr(assignment.obj, assignment.name, value)
         elif isinstance(assignment, IndexAssign):
-            assignment.obj[assignment.key] = value
+            assignment.obj[assignment.index] = value
         elif isinstance(assignment, (list, tuple)):
             try:
                 is_valid = len(assignment) == len(value)
@@ -405,149 +1079,142 @@ class LagoonInterpreter(AbstractInterpreter):
             assert False
 
     def visit_assign(self, node):
-        left_node = node.find('assign_left')
-        right_node = node.find('assign_right')
-        left = self.run(left_node)
-        right = self.run(right_node)
-        ope_name = node.find('assign_ope')[0].expr_name
-        if ope_name != 'assign_ope_':
+        left = self.run(node.targets)
+        right = self.run(node.value)
+        if node.op is not None:
             if isinstance(left, list):
                 raise exceptions.LagoonOtherError(
                     'combined assign operator cannot used for multiple assignment')
             else:
-                left_value = self.run(left_node[0])
-                if ope_name == 'assign_ope_add':
+                left_value = self.run(node.current)
+                if node.op == 'add':
                     right += left_value
-                elif ope_name == 'assign_ope_sub':
+                elif node.op == 'sub':
                     right -= left_value
-                elif ope_name == 'assign_ope_mul':
+                elif node.op == 'mul':
                     right *= left_value
-                elif ope_name == 'assign_ope_div':
+                elif node.op == 'div':
                     right /= left_value
         return self.assign(assignment=left, value=right)
 
     def visit_assign_left(self, node):
-        chain_nodes = node.findall('chain')
         assigns = []
-        for chain_node in chain_nodes:
-            chain_elems = self.chain_elems(chain_node)
-            init = chain_elems[0:-1]
-            tail = chain_elems[-1]
-            if init:
-                if isinstance(tail, AttrChainElem):
-                    assigns.append(AttrAssign(self.chain(init), tail.name))
-                elif isinstance(tail, IndexChainElem):
-                    assigns.append(IndexAssign(self.chain(init), tail.key))
+        for target in node.targets:
+            if isinstance(target, syntaxtree.NameTarget):
+                if target.slot is not None:
+                    assigns.append(LocalAssign(target.slot))
                 else:
-                    assert False
+                    assigns.append(NameAssign(target.name))
+                continue
+            key_values = self.chain_keys(target.obj)
+            obj = self.chain(target.obj, key_values)
+            if isinstance(target, syntaxtree.AttrTarget):
+                assigns.append(AttrAssign(obj, target.name))
+            elif isinstance(target.index, syntaxtree.Index):
+                assigns.append(IndexAssign(obj, key_values[target.index.slot]))
             else:
-                if isinstance(tail, RefChainElem):
-                    assigns.append(NameAssign(tail.name))
-                else:
-                    assert False
+                assigns.append(IndexAssign(obj, target.index.value))
         return assigns[0] if len(assigns) < 2 else assigns
 
     def visit_assign_right(self, node):
-        value_nodes = node.findall('exp')
-        values = AssignTuple(self.run(n) for n in value_nodes)
-        return values[0] if len(values) < 2 else values
+        return AssignTuple(self.run(n) for n in node.values)
 
     def visit_if(self, node):
-        pairs = [(n.find('exp'), n.find('block'))
-                 for n in node.findall({'if_if', 'if_elseif', 'if_else'})]
-        for condition_node, block_node in pairs:
+        for condition_node, block_node in node.branches:
             if condition_node is None or self.run(condition_node):
                 return self.run(block_node)
 
     def visit_while(self, node):
-        condition_node = node.find('exp')
-        block_node = node.find('block')
-        while self.run(condition_node):
-            result = self.run(block_node)
-            if isinstance(result, Broken) and result.valid:
-                result.depth -= 1
-                return result
+        while self.run(node.condition):
+            if self.run(node.body) is EXIT and self.exiting:
+                return self.exit_loop()
 
     def visit_for(self, node):
-        assign_node = node.find('assign_left')
-        container_node = node.find('exp')
-        block_node = node.find('block')
-        for value in self.run(container_node):
-            self.assign(self.run(assign_node), value=value)
-            result = self.run(block_node)
-            if isinstance(result, Broken) and result.valid:
-                result.depth -= 1
-                return result
+        targets = node.targets.targets
+        if all(isinstance(target, syntaxtree.NameTarget) for target in targets):
+            # 名前への代入先は一度だけ求める
+            assignment = self.run(node.targets)
+            if isinstance(assignment, LocalAssign):
+                return self.for_slot(node, assignment.slot)
+            for value in self.run(node.iter):
+                self.last_node = node.targets
+                self.assign(assignment, value=value)
+                if self.run(node.body) is EXIT and self.exiting:
+                    return self.exit_loop()
+            return
+        for value in self.run(node.iter):
+            self.assign(self.run(node.targets), value=value)
+            if self.run(node.body) is EXIT and self.exiting:
+                return self.exit_loop()
+
+    def for_slot(self, node, slot):
+        """ローカル変数一つへ代入するfor文"""
+        slots = self.slots
+        for value in self.run(node.iter):
+            slots[slot] = value
+            if self.run(node.body) is EXIT and self.exiting:
+                return self.exit_loop()
+
+    def visit_parallel_for(self, node):
+        container = self.run(node.iter)
+        self.last_node = node
+        parallel.run_loop(ParallelLoop(node, self), container)
 
     def visit_times(self, node):
-        times_node = node.find('exp')
-        block_node = node.find('block')
-        times = self.run(times_node)
+        times = self.run(node.count)
         if not isinstance(times, int):
             raise exceptions.LagoonTypeError('Number of times to repeat must be int')
+        body = node.body
         for _ in range(times):
-            result = self.run(block_node)
-            if isinstance(result, Broken) and result.valid:
-                result.depth -= 1
-                return result
+            if self.run(body) is EXIT and self.exiting:
+                return self.exit_loop()
 
     def visit_continue(self, node):
-        return Continued()
+        self.exiting = 0
+        return EXIT
 
     def visit_break(self, node):
-        depth_node = node.find('exp')
-        if depth_node:
-            depth = self.run(depth_node)
+        if node.depth is not None:
+            depth = self.run(node.depth)
             if not isinstance(depth, int):
                 raise exceptions.LagoonTypeError('Depth must be int')
-            return Broken(depth)
+            if depth < 1:
+                return None
+            self.exiting = depth
         else:
-            return Broken(1)
+            self.exiting = 1
+        return EXIT
 
     def visit_return(self, node):
-        result_node = node.find('exp')
-        if result_node:
-            result = self.run(result_node)
-            return Returned(result)
-        else:
-            return Returned(None)
+        self.returned = self.run(node.value) if node.value is not None else None
+        self.exiting = RETURN_DEPTH
+        return EXIT
 
     def visit_try(self, node):
-        try_node = node.find('try_try')
-        except_nodes = node.findall('try_except')
         try:
-            block_node = try_node.find('block')
-            assert block_node
-            return self.run(block_node)
+            return self.run(node.body)
         except Exception as e:
-            for except_node in except_nodes:
-                exception_node = except_node.find('exp')
-                exception = self.run(exception_node) if exception_node else None
-                name_node = except_node.find('name')
-                name = self.run(name_node) if name_node else None
-                block_node = except_node.find('block')
-                assert block_node
+            for handler in node.handlers:
+                exception = self.run(handler.exception) if handler.exception else None
+                name = self.run(handler.name) if handler.name else None
                 if not exception or (exception and isinstance(e, exception)):
-                    if name:
+                    if handler.slot is not None:
+                        self.assign(LocalAssign(handler.slot), value=e)
+                    elif name:
                         self.assign(NameAssign(name), value=e)
-                    return self.run(block_node)
-                    break
+                    return self.run(handler.body)
             else:
                 raise e
 
     def visit_raise(self, node):
-        result_node = node.find('exp')
-        if result_node:
-            result = self.run(result_node)
-            raise result
+        if node.value is not None:
+            raise self.run(node.value)
         else:
             raise
 
     def visit_assert(self, node):
-        result_node = node.find('exp')
-        if result_node:
-            result = self.run(result_node)
-            if not result:
+        if node.value is not None:
+            if not self.run(node.value):
                 raise AssertionError
         else:
             raise AssertionError
@@ -555,189 +1222,213 @@ class LagoonInterpreter(AbstractInterpreter):
     # expression:
 
     def visit_number(self, node):
-        if '.' in node.text:
-            return float(node.text)
-        else:
-            return int(node.text)
+        return node.value
+
+    def visit_constant(self, node):
+        self.last_node = node.last
+        return node.value
 
     # Re for visit_string
     interpolation_pattern = r'#\{([^\}]*)\}'
     interpolation_re = re.compile(interpolation_pattern)
 
     def visit_string(self, node):
-        # 式展開
-
-        def interpolation(string):
-            return self.interpolation_re.sub(lambda m: str(self.eval_(m.group(1))), string)
-
-        string = self.run(node.find('string_body')[0])
-        macros = self.run(node.find('string_macros'))
-        if 'i' in macros:
-            string = interpolation(string)
-        if 'a' in macros or 'd' in macros:
-            from textwrap import dedent
-            string = dedent(string)
-        if 'a' in macros or 'l' in macros:
-            string = string.lstrip('\n')
-        if 'a' in macros or 'r' in macros:
-            string = string.rstrip('\n')
-        if '~' in macros:
-            string = re.compile(string)
-        if 'b' in macros:
-            string = string.encode('utf8')
-        return string
-
-    def visit_string_macros(self, node):
-        return node.text
-
-    def visit_sq_heredoc(self, node):
-        return node.find('sq_heredoc_contents').text
-
-    def visit_dq_heredoc(self, node):
-        return (node.find('dq_heredoc_contents').text
-                .encode('raw_unicode_escape').decode('unicode_escape'))
-
-    def visit_sq_string(self, node):
-        return node.find('sq_string_contents').text
-
-    def visit_dq_string(self, node):
-        return (node.find('dq_string_contents').text
-                .encode('raw_unicode_escape').decode('unicode_escape'))
-
-    def visit_heredoc(self, node):
-        return node.find('heredoc_contents').text
-
-    def visit_sequence(self, node):
-        return self.run(node[0]) if len(node) else iter(())
-
-    def common_visit_gen(self, node, struct_type):
-        assert struct_type in {'sequence', 'mapping'}
-        for_node = node.find('{}_gen_for'.format(struct_type))
-        if struct_type == 'sequence':
-            elem_node = for_node.find('exp') if for_node else None
-        elif struct_type == 'mapping':
-            key_node = for_node.find('exp', 0) if for_node else None
-            value_node = for_node.find('exp', 1) if for_node else None
-        in_node = node.find('{}_gen_in'.format(struct_type))
-        assign_node = in_node.find('assign_left')
-        assign = self.run(assign_node)
-        container_node = in_node.find('exp')
-        container = self.run(container_node)
-
-        if_node = node.find('{}_gen_if'.format(struct_type))
-        condition_node = if_node.find('exp') if if_node else None
+        template = getattr(node, 'template', None)
+        if template is None:
+            self.last_node = node.body
+            string = string_body(node)
+            self.last_node = node
+            # 式展開の構文解析やマクロの適用に失敗すれば保存せず、評価のたびに送出する
+            template = node.template = StringTemplate(string, node.macros)
+        else:
+            self.last_node = node
+        return template.evaluate(self)
+
+    def visit_empty(self, node):
+        return iter(())
+
+    def comprehension_frame(self, scope):
+        """内包表記を実行するインタプリタ（scopeが無ければ辞書の名前空間を持つ）"""
+        if scope is None:
+            return LagoonInterpreter(self.namespaces + [{}], self.mode)
+        return LagoonFrame(scope, self, [UNBOUND] * len(scope.names))
+
+    def common_visit_gen(self, node, elem_nodes):
+        """
+        内包表記の要素を順に求めるジェネレータ（g[...]）
+        反復する値はこのインタプリタで、代入先・条件・要素は内包表記のスコープで評価する
+        エラーの位置は内包表記の外のインタプリタが報告するので、評価した位置を書き戻す
+        """
+        container = self.run(node.iter)
+        last_node = self.last_node
+        frame = self.comprehension_frame(node.scope)
+        try:
+            assign = frame.run(node.targets)
+        except Exception:
+            self.last_node = frame.last_node
+            raise
+        frame.last_node = last_node
+        condition_node = node.condition
 
         def gen():
             for item in container:
-                self.assign(assign, value=item)
-                if not condition_node or self.run(condition_node):
-                    if for_node:
-                        if struct_type == 'sequence':
-                            yield self.run(elem_node)
-                        elif struct_type == 'mapping':
-                            yield (self.run(key_node), self.run(value_node))
+                try:
+                    frame.assign(assign, value=item)
+                    if condition_node and not frame.run(condition_node):
+                        continue
+                    if len(elem_nodes) == 1:
+                        value = frame.run(elem_nodes[0])
+                    elif len(elem_nodes) == 2:
+                        value = (frame.run(elem_nodes[0]), frame.run(elem_nodes[1]))
                     else:
-                        yield item
+                        value = item
+                finally:
+                    self.last_node = frame.last_node
+                yield value
 
         return gen()
 
+    def collect_gen(self, node, elem_nodes):
+        """内包表記の要素のリスト（common_visit_genと同じ順に評価し、ジェネレータを介さずに求める）"""
+        container = self.run(node.iter)
+        last_node = self.last_node
+        frame = self.comprehension_frame(node.scope)
+        run = frame.run
+        condition_node = node.condition
+        try:
+            assign = run(node.targets)
+            frame.last_node = last_node
+            if isinstance(assign, LocalAssign) and len(elem_nodes) == 1 and not condition_node:
+                # 代入先のスロットを内包表記の代入先にする
+                slots = frame.slots
+                slot = assign.slot
+                element = elem_nodes[0]
+                return [run(element) for slots[slot] in container]
+            values = []
+            for item in container:
+                if isinstance(assign, LocalAssign):
+                    frame.slots[assign.slot] = item
+                else:
+                    frame.assign(assign, value=item)
+                if not condition_node or run(condition_node):
+                    if len(elem_nodes) == 1:
+                        values.append(run(elem_nodes[0]))
+                    elif len(elem_nodes) == 2:
+                        values.append((run(elem_nodes[0]), run(elem_nodes[1])))
+                    else:
+                        values.append(item)
+            return values
+        finally:
+            self.last_node = frame.last_node
+            # 要素の関数が内包表記のスコープを捕捉すれば、その外側のこのフレームも捕捉される
+            if frame.captured:
+                self.captured = True
+
+    def collection(self, node, struct):
+        """シーケンス・マッピングをstructの値にする（内包表記はcollect_genで求める）"""
+        items = node.items
+        if isinstance(items, (syntaxtree.SequenceGen, syntaxtree.MappingGen)):
+            values = self.collect_gen(items, gen_elements(items))
+            return values if struct is list else struct(values)
+        return struct(self.run(items))
+
     def visit_sequence_gen(self, node):
-        return self.common_visit_gen(node, 'sequence')
+        return self.common_visit_gen(node, gen_elements(node))
 
     def visit_sequence_items(self, node):
-        return (self.run(c) for c in node.findall('exp'))
+        return (self.run(c) for c in node.values)
 
     def visit_list(self, node):
-        return list(self.run(node[0]))
+        return self.collection(node, list)
 
     def visit_tuple(self, node):
-        return tuple(self.run(node[0]))
+        return self.collection(node, tuple)
 
     def visit_set(self, node):
-        return set(self.run(node[0]))
+        return self.collection(node, set)
 
     def visit_frozenset(self, node):
-        return frozenset(self.run(node[0]))
+        return self.collection(node, frozenset)
 
     def visit_generator(self, node):
-        return self.run(node[0])
-
-    def visit_mapping(self, node):
-        return self.run(node[0]) if len(node) else iter(())
+        self.captured = True
+        return self.run(node.items)
 
     def visit_mapping_gen(self, node):
-        return self.common_visit_gen(node, 'mapping')
+        return self.common_visit_gen(node, gen_elements(node))
 
     def visit_mapping_items(self, node):
-        mapping_item_nodes = node.findall('mapping_item')
-        return ((self.run(n.find('exp', 0)), self.run(n.find('exp', 1)))
-                for n in mapping_item_nodes)
+        return ((self.run(key), self.run(value)) for key, value in node.items)
 
     def visit_table(self, node):
-        table_item_nodes = node.findall('table_item')
-        pairs = {self.run(n.find('name')): self.run(n.find('exp'))
-                 for n in table_item_nodes}
+        pairs = {name: self.run(value) for name, value in node.items}
         return LagoonTable(**pairs)
 
     def visit_dict(self, node):
-        return dict(self.run(node[0]))
+        return self.collection(node, dict)
 
     def visit_ordereddict(self, node):
-        return collections.OrderedDict(self.run(node[0]))
+        return self.collection(node, collections.OrderedDict)
 
     def visit_callable(self, node):
-        callable_arg_nodes = node.findall('callable_arg')
-        arg_tuples = [tuple(n.find(e) for e in ('name', 'callable_arg_ope', 'exp'))
-                      for n in callable_arg_nodes]
         arg_names = []
         static_defaults = {}
         dynamic_defaults = {}
-        for name_node, arg_ope_node, value_node in arg_tuples:
-            arg_name = self.run(name_node)
-            arg_names.append(arg_name)
-            if arg_ope_node:
-                arg_ope_name = arg_ope_node[0].expr_name
-                if arg_ope_name == 'callable_arg_ope_static':
-                    static_defaults[arg_name] = self.run(value_node)
-                elif arg_ope_name == "callable_arg_ope_dynamic":
-                    dynamic_defaults[arg_name] = value_node
-                else:
-                    assert False
-        block_node = node.find('block')
+        for param in node.params:
+            arg_names.append(param.name)
+            if param.default is None:
+                pass
+            elif param.dynamic:
+                dynamic_defaults[param.name] = param.default
+            else:
+                static_defaults[param.name] = self.run(param.default)
+        if node.record is not None:
+            self.last_node = node.record
+        self.captured = True
         # Callableの種類が増えた場合はここで振り分ける
-        Callable = LagoonFunction
-        return Callable(block_node, arg_names,
-                        static_defaults, dynamic_defaults, self)
-
-    def visit_numbered_arg(self, node):
-        try:
-            return self.valid_namespace['args'][self.run(node.find('number'))]
-        except KeyError:
-            raise exceptions.LagoonOtherError(
-                'Numbered argument symbol must be within block')
-        except IndexError:
-            raise exceptions.LagoonTypeError(
-                'Numbered argument not satisfied')
+        Callable = LagoonAsyncFunction if node.coroutine else LagoonFunction
+        return Callable(node.body, arg_names,
+                        static_defaults, dynamic_defaults, self, node.scope)
 
     # characters
 
-    def reference(self, name):
-        try:
-            return self.valid_namespace[name]
-        except KeyError:
-            raise exceptions.LagoonNameError(
-                '{} is currently not defined'.format(name))
+    def reference(self, name, binding=None):
+        """名前の参照（bindingはresolverによる解決、無ければ名前空間を順に探す）"""
+        if binding is None:
+            try:
+                return self.valid_namespace[name]
+            except KeyError:
+                raise exceptions.LagoonNameError(
+                    '{} is currently not defined'.format(name))
+        for depth, slot in binding.candidates:
+            frame = self
+            for _ in range(depth):
+                frame = frame.outer
+            value = frame.slots[slot]
+            if value is not UNBOUND:
+                return value
+        if binding.globally:
+            try:
+                return self.globals[name]
+            except KeyError:
+                pass
+            try:
+                return self.builtins[name]
+            except KeyError:
+                pass
+        raise exceptions.LagoonNameError(
+            '{} is currently not defined'.format(name))
 
     def visit_ref_name(self, node):
-        return self.reference(node.text)
+        return self.reference(node.name, node.binding)
 
     def visit_name(self, node):
-        return node.text
+        return node.name
 
 
 class LagoonFileInterpreter(LagoonInterpreter):
 
-    def __init__(self, file_path):
+    def __init__(self, file_path, mode='tree'):
         # 準備
         import builtins
         import operator
@@ -754,6 +1445,7 @@ class LagoonFileInterpreter(LagoonInterpreter):
             'importall': self.importall,
             'load': self.load_,
             'loadall': self.loadall,
+            'reload': self.reload_,
             'exec': self.exec_,
             'eval': self.eval_,
 
@@ -770,6 +1462,7 @@ class LagoonFileInterpreter(LagoonInterpreter):
             'filter': filter,
             'Float': float,
             'FrozenSet': frozenset,
+            'gather': coroutines.gather,
             'getattr': getattr,
             'hasattr': hasattr,
             'hash': hash,
@@ -784,6 +1477,7 @@ class LagoonFileInterpreter(LagoonInterpreter):
             'min': min,
             'next': next,
             'open': open,
+            'pmap': parallel.pmap,
             'print': print,
             'range': range,
             'reversed': reversed,
@@ -791,11 +1485,14 @@ class LagoonFileInterpreter(LagoonInterpreter):
             'Set': set,
             'setattr': setattr,
             'slice': slice,
+            'sleep': coroutines.sleep,
             'sorted': sorted,
             'Str': str,
             'sum': sum,
+            'threadpool_map': parallel.threadpool_map,
             'Tuple': tuple,
             'type': type,
+            'wait_for': coroutines.wait_for,
             'zip': zip,
 
             'true': True,
@@ -809,4 +1506,152 @@ class LagoonFileInterpreter(LagoonInterpreter):
             'globalvars': argparse.Namespace(),
         }
 
-        super().__init__(namespaces=[self.builtin_namespace, {}])
+        super().__init__(namespaces=[self.builtin_namespace, {}], mode=mode)
+        self.builtins = self.builtin_namespace
+        # 大域の実行位置を書き込むスレッド（作ったスレッド）
+        self.thread = coroutines.thread_ident()
+
+    def __reduce__(self):
+        # 別のプロセスでは同じファイルのインタプリタを作り直す（大域の値は関数が持っていく）
+        return parallel.worker_interpreter, (self.builtin_namespace['__lagoonfile__'], self.mode)
+
+    def reset(self, namespace):
+        """
+        インタプリタを使い回すための初期化（runtime.LagoonRuntimeを参照）
+        大域の名前空間をnamespaceに差し替え、実行の状態を捨て、実行中のスレッドを大域の実行位置を書き込むスレッドにする
+        """
+        self.enter(namespace)
+        self.globals = namespace
+        self.builtin_namespace['globalvars'] = argparse.Namespace()
+        self.exiting = 0
+        self.returned = None
+        self.thread = coroutines.thread_ident()
+
+    def view(self):
+        """
+        実行中のスレッドがこのファイルの大域で実行するインタプリタ
+        作ったスレッドでは自身を、他のスレッドでは名前空間を共有し、実行位置だけを別に持つインタプリタを返す
+        """
+        if coroutines.thread_ident() == self.thread:
+            return self
+        return LagoonInterpreter(self.namespaces, self.mode)
+
+    def evaluate_default(self, node):
+        return self.view().run(node)
+
+    def exec_(self, code):
+        import lagoon
+        return lagoon.exec_(code, self.view())
+
+    def eval_(self, code):
+        import lagoon
+        return lagoon.eval_(code, self.view())
+
+
+class LagoonFrame(LagoonInterpreter):
+
+    """
+    名前を解決した関数・内包表記の呼び出しのインタプリタ
+    ローカル変数はスロットの列slotsに持ち、outerは関数・内包表記を定義したインタプリタである
+    名前による参照（式展開やevalなど）にはFrameNamespaceを通してスロットを見せる
+    名前空間（namespaces, valid_namespace）は最初に参照したときに作る
+    """
+
+    def __init__(self, scope, outer, slots):
+        self.scope = scope
+        self.outer = outer
+        self.slots = slots
+        self.mode = outer.mode
+        self.globals = outer.globals
+        self.builtins = outer.builtins
+        self.captured = False
+
+    def __getattr__(self, name):
+        if name not in {'local_namespace', 'namespaces', 'valid_namespace'}:
+            raise AttributeError(name)
+        outer = self.outer
+        self.local_namespace = FrameNamespace(self)
+        self.namespaces = outer.namespaces + [self.local_namespace]
+        self.valid_namespace = collections.ChainMap(self.local_namespace,
+                                                    *outer.valid_namespace.maps)
+        return getattr(self, name)
+
+    def __getstate__(self):
+        # 外側のフレームは復元の途中かもしれないので、大域の名前空間はファイルのインタプリタから得る
+        return self.scope, self.outer, self.slots, self.builtins['__interpreter__']
+
+    def __setstate__(self, state):
+        self.scope, self.outer, self.slots, root = state
+        self.mode = root.mode
+        self.globals = root.globals
+        self.builtins = root.builtins
+        self.captured = False
+
+    def enter(self, slots):
+        self.slots = slots
+        local_namespace = self.__dict__.get('local_namespace')
+        if local_namespace is not None and local_namespace.extra:
+            local_namespace.extra = {}
+
+    def leave(self):
+        self.enter(())
+
+
+class FrameNamespace(collections.abc.MutableMapping):
+
+    """
+    LagoonFrameのローカル変数を名前で参照する辞書
+    スコープに無い名前はextraに持つ
+    """
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.extra = {}
+
+    def __getitem__(self, name):
+        slot = self.frame.scope.slots.get(name)
+        if slot is None:
+            return self.extra[name]
+        value = self.frame.slots[slot]
+        if value is UNBOUND:
+            raise KeyError(name)
+        return value
+
+    def __setitem__(self, name, value):
+        slot = self.frame.scope.slots.get(name)
+        if slot is None:
+            self.extra[name] = value
+        else:
+            self.frame.slots[slot] = value
+
+    def __delitem__(self, name):
+        slot = self.frame.scope.slots.get(name)
+        if slot is None:
+            del self.extra[name]
+        elif self.frame.slots[slot] is UNBOUND:
+            raise KeyError(name)
+        else:
+            self.frame.slots[slot] = UNBOUND
+
+    def __iter__(self):
+        for name, value in zip(self.frame.scope.names, self.frame.slots):
+            if value is not UNBOUND:
+                yield name
+        yield from self.extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+@functools.lru_cache(maxsize=None)
+def builtin_names():
+    """ファイルのインタプリタのビルトインの名前"""
+    return frozenset(LagoonFileInterpreter(None).builtin_namespace)
+
+
+register_traced(LagoonInterpreter, 'visit_block', LagoonInterpreter.traced_visit_block)
+register_traced(LagoonFunction, '__call__', traced_call(LagoonFunction.__call__))
+register_traced(LagoonFunction, 'call_method', traced_call(LagoonFunction.call_method))
+register_traced(compiler, 'closure', compiler.traced_closure)
+register_traced(stackeval, 'step', stackeval.traced_step)
+register_traced(stackeval, 'async_body', stackeval.traced_async_body)
@@ -1,20 +1,97 @@
 # -*- coding: utf-8 -*-
 
-import os
-from parsimonious.grammar import Grammar
-import logging
+import parsecache
 
-logging.basicConfig(
-    filename='debug.log',
-    filemode='w',
-    level=logging.DEBUG)
+import os
+import contextlib
+import hashlib
+import threading
+import time
 
-# 文法の読み込み
+# 文法のソース（文法の構築は最初に必要になったときに行う）
 path = os.path.dirname(__file__)
 with open(os.path.join(path, 'grammar'), 'r', encoding='utf8') as f:
     grammar_code = f.read()
-grammar = Grammar(grammar_code)
-grammar_exp = Grammar('exp = _exp / _exp\n' + grammar_code)
+# 演算子の解析はopeparser.pyで行うので、そのソースもハッシュに含める
+with open(os.path.join(path, 'opeparser.py'), 'rb') as f:
+    grammar_hash = hashlib.sha1(grammar_code.encode('utf8') + f.read()).hexdigest()
+# 構築した文法 {開始規則: Grammar}
+grammars = {}
+
+# debug.logへログを出力するか（--debugまたは環境変数LAGOON_DEBUGで有効にする）
+debug = False
+
+
+def enable_debug_log():
+    """debug.logへのログの出力を有効にする"""
+    global debug
+    import logging
+    logging.basicConfig(
+        filename='debug.log',
+        filemode='w',
+        level=logging.DEBUG)
+    debug = True
+
+
+if os.environ.get('LAGOON_DEBUG', ''):
+    enable_debug_log()
+
+
+def log(label, value):
+    if debug:
+        import logging
+        logging.debug('...{}...\n{}'.format(label, value))
+
+
+def load_grammar(rule='program'):
+    """
+    文法を返す
+    ruleが'exp'ならば式のみを受理する文法（evalと式展開に用いる）
+    構築した文法はディスクに保存し、次回以降の起動で再利用する
+    """
+    if rule not in grammars:
+        if rule == 'program':
+            code = grammar_code
+        elif rule == 'exp':
+            code = 'exp = _exp / _exp\n' + grammar_code
+        else:
+            assert False
+        grammars[rule] = parsecache.load_grammar(rule, code, build_grammar)
+    return grammars[rule]
+
+
+def build_grammar(code):
+    from parsimonious.grammar import Grammar
+    import opeparser
+    return Grammar(code, _ope=opeparser.OperatorExpression('_ope'))
+
+
+# 読み込んだLagoonファイルのモジュール {正規化したパス: LagoonModule}
+# （sys.modulesに相当する）
+modules = {}
+# スレッドごとの、実行中のLagoonファイルのパスの列（循環した読み込みの検出に用いる）
+# 別々のスレッドが同じファイルを同時に読み込むのは循環ではないので、スレッドごとに持つ
+load_state = threading.local()
+
+
+def loading():
+    """実行中のスレッドで実行中のLagoonファイルのパスの列"""
+    try:
+        return load_state.loading
+    except AttributeError:
+        load_state.loading = []
+        return load_state.loading
+
+# 各段階の所要時間 (ラベル, 秒) の列（--timingsで表示する）
+timings = []
+
+
+@contextlib.contextmanager
+def timing(label):
+    """所要時間の記録"""
+    start = time.perf_counter()
+    yield
+    timings.append((label, time.perf_counter() - start))
 
 
 def filter_node(node):
@@ -31,32 +108,152 @@ def filter_node(node):
     node.children = new_children
 
 
-def execute(file_path):
-    """Lagoonファイルの実行"""
-    from interpreter import LagoonFileInterpreter
+def parse(code):
+    """Lagoonソースコードの構文解析"""
+    log('code', code)
+    root_node = load_grammar().parse(code)
+    # logging.debug('...raw_tree...\n{}'.format(root_node))
+    filter_node(root_node)
+    return root_node
+
 
+def parse_file(file_path):
+    """
+    Lagoonファイルの読み込みと構文解析
+    キャッシュがあればそれを用い、無ければ構文解析の結果をキャッシュする
+    """
     with open(file_path, 'r', encoding='utf8') as f:
         code = f.read()
 
-    interpreter = LagoonFileInterpreter(file_path)
-    return exec_(code, interpreter)
+    start = time.perf_counter()
+    root_node = parsecache.load(file_path, code, grammar_hash)
+    if root_node is None:
+        root_node = parse(code)
+        parsecache.store(file_path, code, grammar_hash, root_node)
+        state = 'cold'
+    else:
+        state = 'warm'
+    timings.append(('parse {} ({})'.format(os.path.basename(file_path), state),
+                    time.perf_counter() - start))
+    return code, root_node
+
+
+def lower_file(file_path):
+    """
+    Lagoonファイルを構文解析して実行時の構文木に変換し、定数を畳み込んで名前を解決する
+    parsimoniousのノードの木は変換後に捨てる
+    """
+    import interpreter
+    import optimizer
+    import resolver
+    import syntaxtree
+    _, root_node = parse_file(file_path)
+    with timing('lower {}'.format(os.path.basename(file_path))):
+        program = optimizer.optimize(syntaxtree.lower(root_node))
+        return resolver.resolve(program, interpreter.builtin_names())
+
+
+def execute(file_path, mode='tree'):
+    """Lagoonファイルの実行（実行後の名前空間はモジュールとして登録する）"""
+    return run_module(file_path, mode).__namespace__
+
+
+def load(file_path, mode='tree', reload=False):
+    """
+    Lagoonファイルをモジュールとして読み込む
+    読み込み済みでファイルが更新されていなければ、実行せずに同じモジュールを返す
+    """
+    key = module_key(file_path)
+    module = modules.get(key)
+    if module is None or reload or key in loading() or \
+            module.__mtime__ != os.path.getmtime(file_path):
+        module = run_module(file_path, mode)
+    return module
+
+
+def module_key(file_path):
+    """モジュールの登録に用いる正規化したパス"""
+    return os.path.normcase(os.path.realpath(file_path))
+
+
+def run_module(file_path, mode):
+    """
+    Lagoonファイルを実行し、モジュールを登録して返す
+    再実行したときは同じモジュールの名前空間を差し替える
+    """
+    from interpreter import LagoonFileInterpreter, LagoonModule
+    import exceptions
+
+    key = module_key(file_path)
+    running = loading()
+    if key in running:
+        chain = running[running.index(key):] + [key]
+        raise exceptions.LagoonLoadError('Circular load: {}'.format(
+            ' -> '.join(os.path.basename(path) for path in chain)))
+    mtime = os.path.getmtime(file_path)
+
+    interpreter = LagoonFileInterpreter(file_path, mode=mode)
+    running.append(key)
+    try:
+        if mode == 'python':
+            import transpiler
+            code_object = transpiler.load_file(file_path)
+            with timing('run {}'.format(os.path.basename(file_path))):
+                namespace = exec_code(code_object, interpreter)
+        else:
+            program = lower_file(file_path)
+            with timing('run {}'.format(os.path.basename(file_path))):
+                namespace = exec_node(program, interpreter)
+    finally:
+        running.pop()
+
+    module = modules.get(key)
+    if module is None:
+        module = modules[key] = LagoonModule(namespace, mtime)
+    else:
+        module.__update__(namespace, mtime)
+    return module
 
 
 def exec_(code, interpreter):
     """Lagoonソースコードの実行"""
-    logging.debug('...code...\n{}'.format(code))
-    root_node = grammar.parse(code)
-    # logging.debug('...raw_tree...\n{}'.format(root_node))
-    filter_node(root_node)
-    logging.debug('...tree...\n{}'.format(root_node))
-    interpreter.run(root_node)
+    import optimizer
+    import resolver
+    import syntaxtree
+    from interpreter import LagoonFileInterpreter
+    program = optimizer.optimize(syntaxtree.lower(parse(code)))
+    # ファイルの大域で実行する場合だけ名前を解決する（既にある大域の名前は分からない）
+    if isinstance(interpreter, LagoonFileInterpreter):
+        resolver.resolve(program)
+    return exec_node(program, interpreter)
+
+
+def exec_node(program, interpreter):
+    """構文木に変換したLagoonソースコードの実行"""
+    log('tree', program)
+    interpreter.run(program)
     # 名前空間の辞書を返す
     return interpreter.valid_namespace
 
 
+def exec_code(code_object, interpreter):
+    """Pythonのコードオブジェクトにコンパイルされたソースコードの実行"""
+    import transpiler
+    transpiler.run(code_object, interpreter)
+    # 名前空間の辞書を返す
+    return interpreter.valid_namespace
+
+
+def lower_expression(code):
+    """Lagoonの式の構文解析と、構文木（Expression）への変換"""
+    import optimizer
+    import syntaxtree
+    root_node = load_grammar('exp').parse(code)
+    filter_node(root_node)
+    return optimizer.optimize(syntaxtree.lower(root_node))
+
+
 def eval_(code, interpreter):
     """Lagoonソースコードの評価"""
-    root_node = grammar_exp.parse(code)
-    filter_node(root_node)
     # 評価結果を返す
-    return interpreter.run(root_node)
+    return interpreter.run(lower_expression(code))
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+# Lagoonファイルのカバレッジ
+# interpreter.settraceのlineイベントで実行された行を記録し、
+# ブロックの要素（文・式）のうち一度も実行されなかったものを報告する
+
+import collections
+import os
+import sys
+
+import interpreter
+import lagoon
+
+
+def statement_lines(file_path):
+    """ファイル中のブロックの要素（コメントを除く）が始まる行の集合"""
+    code, root_node = lagoon.parse_file(file_path)
+    lines = set()
+    for block_node in root_node.searchall('block'):
+        for node in block_node:
+            if node.expr_name != 'comm':
+                lines.add(interpreter.location(file_path, code, node.start).line)
+    return lines
+
+
+def format_ranges(statements, missing):
+    """実行されなかった行を、連続する文ごとにまとめた文字列"""
+    ranges = []
+    current = None
+    for lineno in statements:
+        if lineno in missing:
+            if current is None:
+                current = [lineno, lineno]
+                ranges.append(current)
+            else:
+                current[1] = lineno
+        else:
+            current = None
+    return ', '.join(str(first) if first == last else '{}-{}'.format(first, last)
+                     for first, last in ranges)
+
+
+class Coverage(object):
+
+    """
+    実行された行の記録
+    start()からstop()までの間に実行されたLagoonファイルの行を集める
+    """
+
+    def __init__(self):
+        # {ファイルのパス: 実行された行の集合}
+        self.executed = collections.defaultdict(set)
+        self.previous_hook = None
+
+    def hook(self, event, location, arg):
+        if event == 'line':
+            self.executed[location.file].add(location.line)
+
+    def start(self):
+        self.previous_hook = interpreter.gettrace()
+        interpreter.settrace(self.hook)
+
+    def stop(self):
+        interpreter.settrace(self.previous_hook)
+
+    def analysis(self, file_path):
+        """(文の行の列, 実行されなかった行の列)"""
+        statements = sorted(statement_lines(file_path))
+        executed = self.executed.get(file_path, set())
+        return statements, [lineno for lineno in statements if lineno not in executed]
+
+    def report(self, file=None):
+        """ファイルごとの文の数・実行されなかった数・割合・実行されなかった行を表示する"""
+        file = file or sys.stdout
+        paths = sorted(path for path in self.executed if path and os.path.isfile(path))
+        rows = []
+        total_statements = total_missing = 0
+        for path in paths:
+            statements, missing = self.analysis(path)
+            total_statements += len(statements)
+            total_missing += len(missing)
+            rows.append((os.path.relpath(path), len(statements), len(missing),
+                         format_ranges(statements, set(missing))))
+        rows.append(('TOTAL', total_statements, total_missing, ''))
+
+        width = max(len(name) for name, _, _, _ in rows + [('Name', 0, 0, '')])
+        line_format = '{:<' + str(width) + '}  {:>6}  {:>6}  {:>6}  {}'
+        print(line_format.format('Name', 'Stmts', 'Miss', 'Cover', 'Missing'), file=file)
+        for name, statements, missing, ranges in rows:
+            cover = 100.0 * (statements - missing) / statements if statements else 100.0
+            print(line_format.format(name, statements, missing,
+                                     '{:.0f}%'.format(cover), ranges).rstrip(), file=file)
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+# 演算子の構文解析
+# 演算子の段（_ope3から_ope12）を文法の順序付き選択で書くと、各段の選択肢が
+# それぞれ左辺を解析し直すため、深く入れ子になった式の解析が遅くなる
+# ここでは被演算子（_ope2a）を一度だけ解析し、演算子の優先順位に従って
+# 左から一度の走査で木を組み立てる（演算子順位法）
+# 組み立てるノードの名前・範囲・子は、元の文法で解析したものと同じになる
+
+import re
+
+from parsimonious.expressions import Expression
+from parsimonious.grammar import LazyReference
+from parsimonious.nodes import Node
+
+# 被演算子の段
+OPERAND_LEVEL = 2
+# 式全体の段
+TOP_LEVEL = 12
+
+# 前置演算子 (段, ノード名, 演算子の正規表現)
+# 被演算子は同じ段の式
+PREFIX = tuple((level, name, re.compile(pattern)) for level, name, pattern in (
+    (9, 'not_', r'not\s+'),
+    (4, 'pos', r'\+\s*'),
+    (4, 'neg', r'-\s*'),
+))
+
+# 中置演算子 (段, ((ノード名, 演算子の正規表現の組), ...))
+# 段の低い順に並べ、同じ段の演算子は文法の順序付き選択と同じ順に試す
+# 演算子の正規表現の後にはそれぞれ同じ段の式が続く（右結合）
+# 正規表現が二つのものは三項演算子である
+INFIX = tuple((level, tuple((name, tuple(re.compile(p) for p in patterns))
+                            for name, *patterns in operators)) for level, operators in (
+    (3, (('pow', r'\s*pow\s*'),)),
+    (5, (('mul', r'\s*\*\s*'),
+         ('truediv', r'\s*/\s*'),
+         ('mod', r'\s*mod\s*'))),
+    (6, (('add', r'\s*\+\s*'),
+         ('sub', r'\s*-\s*'))),
+    (7, (('lt', r'\s*<\s*'),
+         ('le', r'\s*<=\s*'),
+         ('eq', r'\s*==\s*'),
+         ('ne', r'\s*!=\s*'),
+         ('ge', r'\s*>=\s*'),
+         ('gt', r'\s*>\s*'))),
+    (8, (('is_', r'\s+is\s+'),
+         ('contains', r'\s+in\s+'),
+         ('isa', r'\s+isa\s+'))),
+    (10, (('and_', r'\s+and\s+'),
+          ('or_', r'\s+or\s+'))),
+    (11, (('one_if', r'\s+if\s+', r'\s+else\s+'),)),
+    (12, (('one_try', r'\s+except\s+', r'\s+then\s+'),)),
+))
+
+
+class OperatorExpression(Expression):
+    """
+    演算子を含む式（_ope）を解析する規則
+    被演算子はoperandの規則（文法中で解決される）で解析する
+    """
+
+    def __init__(self, name='', operand='_ope2a'):
+        super().__init__(name)
+        # 文法の構築時に規則の参照が解決される
+        self.members = [LazyReference(operand)]
+
+    def _uncached_match(self, text, pos, cache, error):
+        return self.match_level(text, pos, TOP_LEVEL, cache, error)
+
+    def match_level(self, text, pos, level, cache, error):
+        """posから始まる段levelの式のノードを返す（無ければNone）"""
+        # 段ごとの結果もパーサのキャッシュに記録する
+        key = (id(self), pos, level)
+        if key in cache:
+            return cache[key]
+        node = cache[key] = self._match_level(text, pos, level, cache, error)
+        return node
+
+    def _match_level(self, text, pos, level, cache, error):
+        left = None
+        for prefix_level, name, pattern in PREFIX:
+            if prefix_level <= level:
+                match = pattern.match(text, pos)
+                if match:
+                    operand = self.match_level(text, match.end(), prefix_level, cache, error)
+                    if operand is not None:
+                        left = Node(name, text, pos, operand.end, [operand])
+                        left_level = prefix_level
+                        break
+        if left is None:
+            left = self.members[0].match_core(text, pos, cache, error)
+            if left is None:
+                return None
+            left_level = OPERAND_LEVEL
+
+        # 左辺より高い段の演算子を、段の低い順に一度ずつ試す
+        for infix_level, operators in INFIX:
+            if infix_level <= left_level:
+                continue
+            if infix_level > level:
+                break
+            for name, patterns in operators:
+                node = self.match_infix(text, left, infix_level, name, patterns, cache, error)
+                if node is not None:
+                    left = node
+                    break
+        return left
+
+    def match_infix(self, text, left, level, name, patterns, cache, error):
+        """leftを左辺とする中置演算子のノードを返す（無ければNone）"""
+        children = [left]
+        end = left.end
+        for pattern in patterns:
+            match = pattern.match(text, end)
+            if match is None:
+                return None
+            operand = self.match_level(text, match.end(), level, cache, error)
+            if operand is None:
+                return None
+            children.append(operand)
+            end = operand.end
+        return Node(name, text, left.start, end, children)
+
+    def _as_rhs(self):
+        return '{{operators of {}}}'.format(self.members[0].name)
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+
+# 定数の畳み込み
+# 数値・文字列のリテラルだけを被演算子とする演算、要素がすべて定数のタプル（t[...]）・frozenset（f[...]）を
+# 実行前に計算し、値を持つConstantノードに置き換える
+# 計算に失敗する式（0での除算など）は置き換えず、実行時に同じ位置でエラーを送出させる
+# リスト・テーブルなど変更できる値のリテラルは、評価のたびに新しい値を作るので置き換えない
+# （その中の要素は畳み込む）。名前の参照を含む式は、名前が再代入されうるので畳み込まない
+
+import interpreter
+import syntaxtree
+
+import operator
+import os
+
+# 環境変数LAGOON_NO_OPTIMIZEがあれば畳み込まない（構文木をそのまま実行する）
+enabled = os.environ.get('LAGOON_NO_OPTIMIZE', '') == ''
+
+# 畳み込んだ結果の大きさの上限（大きな値を生成するコードがあっても構文木や.pycを膨らませない）
+MAX_LENGTH = 4096
+MAX_INT_BITS = 4096
+
+UNARY = {
+    syntaxtree.Pos: operator.pos,
+    syntaxtree.Neg: operator.neg,
+    syntaxtree.Not: operator.not_,
+}
+
+BINARY = {
+    syntaxtree.Pow: operator.pow,
+    syntaxtree.Mul: operator.mul,
+    syntaxtree.TrueDiv: operator.truediv,
+    syntaxtree.Mod: operator.mod,
+    syntaxtree.Add: operator.add,
+    syntaxtree.Sub: operator.sub,
+    syntaxtree.Lt: operator.lt,
+    syntaxtree.Le: operator.le,
+    syntaxtree.Eq: operator.eq,
+    syntaxtree.Ne: operator.ne,
+    syntaxtree.Ge: operator.ge,
+    syntaxtree.Gt: operator.gt,
+    syntaxtree.Contains: lambda left, right: left in right,
+}
+
+SEQUENCES = {
+    syntaxtree.Tuple: tuple,
+    syntaxtree.FrozenSet: frozenset,
+}
+
+# 畳み込みの結果として持つ値の型（Pythonモードでもast.Constantで表せるもの）
+CONSTANT_TYPES = (int, float, str, bytes, tuple, frozenset)
+
+
+class NotConstant(Exception):
+    """式が定数でないか、畳み込まない"""
+
+
+def optimize(program):
+    """
+    Program, Expressionの構文木の定数を畳み込む
+    enabledでなければ何もしない
+    """
+    if enabled:
+        fold_fields(program)
+    return program
+
+
+def fold(node):
+    """nodeの子を畳み込み、node自身が定数ならばConstantに置き換えたノードを返す"""
+    fold_fields(node)
+    if isinstance(node, syntaxtree.Exp) and not isinstance(node, (syntaxtree.Number,
+                                                                 syntaxtree.String,
+                                                                 syntaxtree.Constant)):
+        try:
+            value, last = evaluate(node)
+        except NotConstant:
+            return node
+        return syntaxtree.Constant(node.src, node.pos, value,
+                                   syntaxtree.Node(last.src, last.pos))
+    return node
+
+
+def fold_fields(node):
+    for field in node.fields:
+        value = getattr(node, field)
+        # recordにノード自身を持つ場合がある
+        if value is not node:
+            setattr(node, field, fold_value(value))
+
+
+def fold_value(value):
+    if isinstance(value, syntaxtree.Node):
+        return fold(value)
+    elif isinstance(value, tuple):
+        return tuple(fold_value(item) for item in value)
+    return value
+
+
+def evaluate(node):
+    """
+    定数の式の (値, 最後に評価されるノード)
+    最後に評価されるノードは、実行時にlast_nodeへ記録されるはずの位置として保つ
+    """
+    cls = type(node)
+    if cls is syntaxtree.Constant:
+        return node.value, node.last
+    elif cls is syntaxtree.Number:
+        return node.value, node
+    elif cls is syntaxtree.String:
+        if 'i' in node.macros or '~' in node.macros:
+            raise NotConstant
+        return compute(lambda: interpreter.apply_macros(interpreter.string_body(node),
+                                                          node.macros)), node
+    elif cls is syntaxtree.Chain:
+        # 括弧で囲んだ式
+        if node.ops or isinstance(node.head, str):
+            raise NotConstant
+        return evaluate(node.head)
+    elif cls in UNARY:
+        operand, last = evaluate(node.operand)
+        return compute(lambda: UNARY[cls](operand)), last
+    elif cls in BINARY:
+        left, _ = evaluate(node.left)
+        right, last = evaluate(node.right)
+        check_size(cls, left, right)
+        return compute(lambda: BINARY[cls](left, right)), last
+    elif cls is syntaxtree.And or cls is syntaxtree.Or:
+        left, left_last = evaluate(node.left)
+        right, right_last = evaluate(node.right)
+        if bool(left) == (cls is syntaxtree.And):
+            return right, right_last
+        return left, left_last
+    elif cls in SEQUENCES:
+        items = node.items
+        if isinstance(items, syntaxtree.Empty):
+            return SEQUENCES[cls](), items
+        elif not isinstance(items, syntaxtree.SequenceItems):
+            raise NotConstant
+        values = []
+        last = items
+        for value_node in items.values:
+            value, last = evaluate(value_node)
+            values.append(value)
+        return compute(lambda: SEQUENCES[cls](values)), last
+    raise NotConstant
+
+
+def compute(func):
+    """funcの値（失敗したり、大きすぎたりすれば畳み込まない）"""
+    try:
+        value = func()
+    except Exception:
+        raise NotConstant
+    if not isinstance(value, CONSTANT_TYPES):
+        raise NotConstant
+    if isinstance(value, int):
+        if value.bit_length() > MAX_INT_BITS:
+            raise NotConstant
+    elif isinstance(value, (str, bytes, tuple, frozenset)) and len(value) > MAX_LENGTH:
+        raise NotConstant
+    return value
+
+
+def check_size(cls, left, right):
+    """計算の前に、結果が大きくなりすぎる乗算・べき乗を除く"""
+    if cls is syntaxtree.Pow:
+        if type(left) is int and type(right) is int and right > 0 and \
+                left.bit_length() * right > MAX_INT_BITS:
+            raise NotConstant
+    elif cls is syntaxtree.Mul:
+        for sequence, count in ((left, right), (right, left)):
+            if isinstance(sequence, (str, bytes, tuple)) and isinstance(count, int) and \
+                    len(sequence) * count > MAX_LENGTH:
+                raise NotConstant
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+# プロセスプールによる並列実行
+# pmapの関数と、parallel for文の本体をProcessPoolExecutorのワーカーで実行する
+# 要素はチャンクに分けて送り、結果はチャンクの順（要素の順）に受け取る
+# 関数・テーブルは値として複製して送る。関数は本体の構文木（Pythonモードではコードオブジェクト）、
+# 捕捉したローカル変数と、参照する大域の名前の値を持っていく
+# ワーカーの中では、ファイルごとに作り直したインタプリタが、同じファイルの関数の大域の名前空間になる
+# ワーカーで代入した値は呼び出し元へ戻らない（戻るのは返り値と、標準出力へ書いた文字列だけ）
+# ワーカーとの間の値はTaskPicklerでバイト列にしてから送る（Pythonのモジュールは名前で送る）
+# threadpool_mapは関数をスレッドプールで呼び出す（値を複製せず、同じ名前空間・テーブルを共有する）
+
+import exceptions
+import interpreter
+
+import concurrent.futures
+import contextlib
+import copyreg
+import importlib
+import io
+import os
+import pickle
+import sys
+import threading
+import types
+
+# 環境変数LAGOON_WORKERSがあればワーカーの数とする（無ければCPUの数）
+workers = int(os.environ.get('LAGOON_WORKERS', '0')) or os.cpu_count() or 1
+
+# 環境変数LAGOON_THREADSがあればスレッドプールのスレッドの数とする（無ければThreadPoolExecutorの既定）
+threads = int(os.environ.get('LAGOON_THREADS', '0')) or None
+
+# ワーカーの数ごとのチャンクの数（チャンクの大きさを指定しなければ、要素をこの数×ワーカーの数に分ける）
+CHUNKS_PER_WORKER = 4
+
+executor = None
+thread_executor = None
+# プールを作るときのロック（threadpool_mapの関数から並列実行してもプールを一つだけ作る）
+executor_lock = threading.Lock()
+# ワーカーのプロセスの中か（ワーカーの中ではpmap, parallel forを逐次実行する）
+in_worker = False
+# スレッドごとの、スレッドプールのスレッドの中か（中ではthreadpool_mapを逐次実行する）
+thread_state = threading.local()
+# ワーカーの中で作り直した (ファイルのパス, モード) ごとのインタプリタ
+roots = {}
+
+
+def get_executor():
+    """プロセスプール（最初の並列実行で作り、プロセスの終了まで使い回す）"""
+    global executor
+    with executor_lock:
+        if executor is None:
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+                                                              initializer=initialize)
+    return executor
+
+
+def get_thread_executor():
+    """スレッドプール（最初のthreadpool_mapで作り、プロセスの終了まで使い回す）"""
+    global thread_executor
+    with executor_lock:
+        if thread_executor is None:
+            thread_executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads,
+                                                                    initializer=initialize_thread)
+    return thread_executor
+
+
+def initialize():
+    global in_worker
+    in_worker = True
+
+
+def initialize_thread():
+    thread_state.in_pool = True
+
+
+def worker_interpreter(file_path, mode):
+    """別のプロセスから送られた関数を定義したファイルのインタプリタ"""
+    key = (file_path, mode)
+    root = roots.get(key)
+    if root is None:
+        root = roots[key] = interpreter.LagoonFileInterpreter(file_path, mode=mode)
+    return root
+
+
+def load_module(file_path, mode):
+    """別のプロセスから送られたLagoonModule"""
+    import lagoon
+    return lagoon.load(file_path, mode)
+
+
+def reduce_module(module):
+    # Pythonのモジュールは名前で送り、送られた先でimportする
+    return importlib.import_module, (module.__name__,)
+
+
+class TaskPickler(pickle.Pickler):
+
+    """
+    ワーカーとの間で送る値のPickler
+    モジュールの複製の方法はこのPicklerだけに登録し、プロセス全体のpickleの動作を変えない
+    """
+
+    dispatch_table = copyreg.dispatch_table.copy()
+    dispatch_table[types.ModuleType] = reduce_module
+
+
+def dumps(obj):
+    buffer = io.BytesIO()
+    TaskPickler(buffer, pickle.HIGHEST_PROTOCOL).dump(obj)
+    return buffer.getvalue()
+
+
+def run_chunk(task):
+    """
+    ワーカーでチャンクの要素ごとにfunctionを呼び出し、結果と標準出力へ書いた文字列を返す
+    taskは (function, チャンク) をdumpsしたもので、結果もdumpsして返す
+    """
+    function, chunk = pickle.loads(task)
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        results = [function(*args) for args in chunk]
+    return dumps(results), output.getvalue()
+
+
+def run(function, items, chunksize=None):
+    """
+    itemsの要素（引数の組）ごとにfunctionをワーカーで呼び出し、結果を要素の順に返す
+    ワーカーの標準出力はチャンクの順に書き出し、最初に失敗したチャンクのエラーを送出する
+    """
+    if chunksize is None:
+        chunksize = -(-len(items) // (workers * CHUNKS_PER_WORKER))
+    elif not isinstance(chunksize, int) or chunksize < 1:
+        raise exceptions.LagoonTypeError('Chunk size must be positive int')
+    if in_worker or len(items) <= 1:
+        return [function(*args) for args in items]
+    pool = get_executor()
+    futures = [pool.submit(run_chunk, dumps((function, items[start:start + chunksize])))
+               for start in range(0, len(items), chunksize)]
+    results = []
+    try:
+        for future in futures:
+            chunk_results, output = future.result()
+            sys.stdout.write(output)
+            results.extend(pickle.loads(chunk_results))
+    finally:
+        for future in futures:
+            future.cancel()
+    return results
+
+
+def pmap(function, *iterables, chunksize=None):
+    """組み込みのmapのように、iterablesの要素を引数にfunctionを並列に呼び出した結果のリスト"""
+    return run(function, list(zip(*iterables)), chunksize)
+
+
+def run_loop(loop, container):
+    """parallel for文の本体（interpreter.ParallelLoopなど）を、反復する値ごとに並列に実行する"""
+    run(loop, [(item,) for item in container])
+
+
+def threadpool_map(function, *iterables):
+    """
+    組み込みのmapのように、iterablesの要素を引数にfunctionをスレッドプールで呼び出した結果のリスト
+    入出力を待つ関数に向く（CPUを使う関数はGILのため速くならないので、pmapを使う）
+    """
+    items = list(zip(*iterables))
+    if getattr(thread_state, 'in_pool', False) or len(items) <= 1:
+        return [function(*args) for args in items]
+    pool = get_thread_executor()
+    futures = [pool.submit(function, *args) for args in items]
+    try:
+        return [future.result() for future in futures]
+    finally:
+        for future in futures:
+            future.cancel()
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+# 構文解析結果のキャッシュ
+# ふるいにかけた後のノードの木を、ソースと文法のハッシュをキーとして
+# ソースと同じディレクトリの__lgncache__に保存する
+# 構築した文法もこのモジュールと同じディレクトリの__lgncache__に保存する
+
+import hashlib
+import marshal
+import os
+import sys
+import threading
+
+# キャッシュの形式を変えたときは上げる
+FORMAT_VERSION = 1
+CACHE_DIRECTORY = '__lgncache__'
+
+# キャッシュを用いるか
+enabled = os.environ.get('LAGOON_NO_CACHE', '') == ''
+# ディレクトリごとのキャッシュの合計サイズの上限（バイト）
+max_size = 16 * 1024 * 1024
+
+
+def cache_key(code, grammar_hash):
+    """ソースと文法のハッシュ"""
+    digest = hashlib.sha1()
+    digest.update('{}\n{}\n'.format(FORMAT_VERSION, grammar_hash).encode('utf8'))
+    digest.update(code.encode('utf8'))
+    return digest.hexdigest()
+
+
+def cache_path(file_path, key):
+    directory, name = os.path.split(file_path)
+    return os.path.join(directory, CACHE_DIRECTORY, '{}.{}.tree'.format(name, key[:20]))
+
+
+def dump_node(node):
+    """ノードの木を (名前, 開始位置, 終了位置, 子の組) の入れ子にする"""
+    return (node.expr_name, node.start, node.end,
+            tuple(dump_node(child) for child in node.children))
+
+
+def load_node(data, code):
+    """dump_nodeの逆変換"""
+    from parsimonious.nodes import Node
+
+    def load(data):
+        expr_name, start, end, children = data
+        return Node(expr_name, code, start, end, [load(child) for child in children])
+    return load(data)
+
+
+def load(file_path, code, grammar_hash):
+    """キャッシュされたノードの木を返す（無ければNone）"""
+    if not enabled:
+        return None
+    key = cache_key(code, grammar_hash)
+    path = cache_path(file_path, key)
+    try:
+        with open(path, 'rb') as f:
+            stored_key, data = marshal.load(f)
+        if stored_key != key:
+            return None
+        # 最近使ったものを残すため、更新時刻を使用時刻とする
+        os.utime(path)
+    except (OSError, ValueError, EOFError, TypeError):
+        return None
+    return load_node(data, code)
+
+
+def store(file_path, code, grammar_hash, root_node):
+    """ノードの木をキャッシュに保存する"""
+    if not enabled:
+        return
+    key = cache_key(code, grammar_hash)
+    path = cache_path(file_path, key)
+    # 書き込み途中のファイルを他のプロセス（スレッド）が読まないよう、置き換えで保存する
+    temp_path = '{}.{}.{}'.format(path, os.getpid(), threading.get_ident())
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(temp_path, 'wb') as f:
+            marshal.dump((key, dump_node(root_node)), f)
+        os.replace(temp_path, path)
+        evict(os.path.dirname(path))
+    except (OSError, ValueError):
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+
+def evict(directory):
+    """合計サイズがmax_sizeを超えたら、古いものから削除する"""
+    entries = []
+    for name in os.listdir(directory):
+        if name.endswith('.tree'):
+            stat = os.stat(os.path.join(directory, name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= max_size:
+            break
+        os.remove(os.path.join(directory, name))
+        total -= size
+
+
+def parsimonious_stamp():
+    """
+    インストールされたparsimoniousの版の代わりに、モジュールのファイルの大きさと更新時刻
+    （importlib.metadataでの版の取得は起動を遅くするので用いない）
+    """
+    import importlib.util
+    spec = importlib.util.find_spec('parsimonious')
+    if spec is None or spec.origin is None:
+        return ''
+    directory = os.path.dirname(spec.origin)
+    stamps = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.py'):
+            stat = os.stat(os.path.join(directory, name))
+            stamps.append('{}:{}:{}'.format(name, stat.st_size, stat.st_mtime_ns))
+    return ' '.join(stamps)
+
+
+def load_grammar(rule, code, build):
+    """
+    保存した文法を読み込む
+    無ければbuild(code)で構築して保存し、同じruleの他の保存した文法を削除する
+    文法にはopeparserとparsimoniousのオブジェクトが含まれるので、それらもキーに含める
+    """
+    import pickle
+    if not enabled:
+        return build(code)
+    directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), CACHE_DIRECTORY)
+    digest = hashlib.sha1()
+    digest.update('{}\n{}\n{}\n'.format(FORMAT_VERSION, sys.version,
+                                         parsimonious_stamp()).encode('utf8'))
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'opeparser.py'), 'rb') as f:
+        digest.update(f.read())
+    digest.update(code.encode('utf8'))
+    prefix = 'grammar-{}.'.format(rule)
+    name = '{}{}.pickle'.format(prefix, digest.hexdigest()[:20])
+    path = os.path.join(directory, name)
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except Exception:
+        pass
+    grammar = build(code)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        # 書き込み途中のファイルを他のプロセスが読まないよう、置き換えで保存する
+        temp_path = '{}.{}'.format(path, os.getpid())
+        with open(temp_path, 'wb') as f:
+            pickle.dump(grammar, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+        for other in os.listdir(directory):
+            if other.startswith(prefix) and other.endswith('.pickle') and other != name:
+                os.remove(os.path.join(directory, other))
+    except (OSError, pickle.PicklingError, RuntimeError):
+        pass
+    return grammar
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+
+# 文法の規則ごとの構文解析のプロファイル
+# 計測の間だけparsimoniousのExpression.match_coreを置き換え、規則ごとに
+# 試行（パーサのキャッシュにあったものを含む）・成功・失敗の回数と、実行時間（子の規則を含む・含まない）を数える
+# 成功したが最終的な構文木に残らなかったノードの文字数を、後戻りで読み直した文字数として数える
+# （先読みの!R などのノードも構文木に残らないので、ここに含まれる）
+# 文法の規則（名前のある式）だけを報告し、名前の無い部分式の時間は規則の子を含まない時間に含める
+
+import lagoon
+
+import os
+import sys
+import time
+
+from parsimonious.expressions import Expression, Literal, Regex
+
+# 終端の式（読み直した文字数を、入れ子の規則で重複させずに数える）
+TERMINALS = (Literal, Regex)
+
+
+class RuleStats(object):
+
+    """一つの文法の規則の計測値"""
+
+    __slots__ = ('name', 'attempts', 'hits', 'successes', 'failures',
+                 'time', 'self_time', 'rescanned', 'active')
+
+    def __init__(self, name):
+        self.name = name
+        self.attempts = 0
+        # パーサのキャッシュにあった試行の数
+        self.hits = 0
+        self.successes = 0
+        self.failures = 0
+        self.time = 0.0
+        self.self_time = 0.0
+        self.rescanned = 0
+        # 実行中の試行の数（再帰した規則の時間を重複して数えない）
+        self.active = 0
+
+
+# 報告の並べ替えのキー
+SORT_KEYS = {
+    'time': lambda stats: stats.time,
+    'self': lambda stats: stats.self_time,
+    'attempts': lambda stats: stats.attempts,
+    'failures': lambda stats: stats.failures,
+    'rescanned': lambda stats: stats.rescanned,
+}
+
+
+class ParseProfile(object):
+
+    """
+    文法の規則ごとの構文解析の計測
+    parse(code)で構文解析し、report()で規則ごとの計測値を表示する
+    """
+
+    def __init__(self):
+        # {規則の名前: RuleStats}
+        self.rules = {}
+        # 実行中の規則の試行ごとの、子の規則の試行の時間の合計
+        self.children = []
+        # 成功した試行の (RuleStats（名前の無い式はNone）, ノード, 終端の式か) の列
+        self.matched = []
+        self.length = 0
+        self.elapsed = 0.0
+        self.terminal_chars = 0
+        self.terminal_rescanned = 0
+
+    def stats(self, name):
+        stats = self.rules.get(name)
+        if stats is None:
+            stats = self.rules[name] = RuleStats(name)
+        return stats
+
+    def parse(self, code):
+        """codeを構文解析して計測し、parsimoniousのノードの木を返す"""
+        grammar = lagoon.load_grammar()
+        original = Expression.match_core
+        profile = self
+
+        def match_core(self, text, pos, cache, error):
+            cached = (id(self), pos) in cache
+            if not self.name:
+                # 名前の無い部分式は、終端の式の読んだ文字数だけを記録する
+                node = original(self, text, pos, cache, error)
+                if not cached and node is not None and isinstance(self, TERMINALS):
+                    profile.matched.append((None, node, True))
+                return node
+            stats = profile.stats(self.name)
+            stats.attempts += 1
+            if cached:
+                stats.hits += 1
+                return original(self, text, pos, cache, error)
+            profile.children.append(0.0)
+            stats.active += 1
+            start = time.perf_counter()
+            try:
+                node = original(self, text, pos, cache, error)
+            finally:
+                elapsed = time.perf_counter() - start
+                stats.active -= 1
+                children = profile.children.pop()
+                if profile.children:
+                    profile.children[-1] += elapsed
+                if not stats.active:
+                    stats.time += elapsed
+                stats.self_time += elapsed - children
+            if node is None:
+                stats.failures += 1
+            else:
+                stats.successes += 1
+                profile.matched.append((stats, node, isinstance(self, TERMINALS)))
+            return node
+
+        self.length += len(code)
+        Expression.match_core = match_core
+        start = time.perf_counter()
+        try:
+            root_node = grammar.parse(code)
+        finally:
+            self.elapsed += time.perf_counter() - start
+            Expression.match_core = original
+        self.count_rescanned(root_node)
+        return root_node
+
+    def count_rescanned(self, root_node):
+        """最終的な構文木に残らなかったノードの文字数を数える"""
+        kept = set()
+        stack = [root_node]
+        while stack:
+            node = stack.pop()
+            kept.add(id(node))
+            stack.extend(node.children)
+        for stats, node, terminal in self.matched:
+            length = node.end - node.start
+            if terminal:
+                self.terminal_chars += length
+            if id(node) not in kept:
+                if stats is not None:
+                    stats.rescanned += length
+                if terminal:
+                    self.terminal_rescanned += length
+        # 計測中はノードを保持して、idが再利用されないようにしている
+        self.matched = []
+
+    def report(self, sort='time', file=None):
+        """規則ごとの計測値を、sortのキーの大きい順に表示する"""
+        file = file or sys.stdout
+        rules = sorted(self.rules.values(), key=SORT_KEYS[sort], reverse=True)
+        print('{} chars parsed in {:.1f} ms (profiled); terminals matched {} chars ({:.2f}x input), '
+              '{} of them discarded by backtracking'.format(
+                  self.length, self.elapsed * 1000, self.terminal_chars,
+                  self.terminal_chars / self.length if self.length else 0.0,
+                  self.terminal_rescanned), file=file)
+        width = max([len(stats.name) for stats in rules] + [4])
+        line_format = '{:<' + str(width) + '}  {:>9}  {:>9}  {:>9}  {:>9}  {:>9}  {:>9}  {:>9}'
+        print(line_format.format('Rule', 'Attempts', 'Cached', 'Success', 'Fail',
+                                 'Time(ms)', 'Self(ms)', 'Rescan'), file=file)
+        for stats in rules:
+            print(line_format.format(stats.name, stats.attempts, stats.hits, stats.successes,
+                                     stats.failures, '{:.2f}'.format(stats.time * 1000),
+                                     '{:.2f}'.format(stats.self_time * 1000), stats.rescanned),
+                  file=file)
+
+
+def profile_file(file_path, sort='time'):
+    """Lagoonファイルを（キャッシュを用いずに）構文解析して計測し、報告を標準エラー出力に表示する"""
+    with open(file_path, 'r', encoding='utf8') as f:
+        code = f.read()
+    profile = ParseProfile()
+    profile.parse(code)
+    print(os.path.relpath(file_path), file=sys.stderr)
+    profile.report(sort, file=sys.stderr)
+    return profile
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+# 対話環境（REPL）
+# 一つのインタプリタを保ったまま、入力された文またはブロックだけを構文解析して実行する
+# これまでの入力を解析し直さないので、一行あたりの応答時間はセッションの長さによらない
+
+import os
+import sys
+
+import lagoon
+
+PROMPT = '>>> '
+CONTINUATION_PROMPT = '... '
+
+
+def is_incomplete(code):
+    """
+    codeが入力の途中か
+    構文解析が入力の末尾まで進んで失敗したならば、続きの入力を待つ
+    """
+    from parsimonious.exceptions import ParseError
+    grammar = lagoon.load_grammar()
+    error = ParseError(code)
+    node = grammar.default_rule.match_core(code, 0, {}, error)
+    if node is not None and node.end == len(code):
+        return False
+    return error.pos >= len(code.rstrip())
+
+
+class LagoonRepl:
+
+    """
+    Lagoonの対話環境
+    式の評価結果はNoneでなければ表示する
+    """
+
+    def __init__(self, mode='tree', stdin=None, stdout=None, stderr=None):
+        from interpreter import LagoonFileInterpreter
+        self.stdin = stdin or sys.stdin
+        self.stdout = stdout or sys.stdout
+        self.stderr = stderr or sys.stderr
+        # loadなどの相対パスはカレントディレクトリから解決する
+        self.interpreter = LagoonFileInterpreter(os.path.join(os.getcwd(), '<stdin>'), mode=mode)
+        self.lines = []
+
+    def feed(self, line):
+        """
+        一行を入力する
+        文またはブロックが完成すれば実行し、続きの入力を待つならばTrueを返す
+        """
+        self.lines.append(line)
+        code = '\n'.join(self.lines)
+        if not code.strip():
+            self.lines = []
+            return False
+        # 空行が二つ続いたら、入力の途中でも打ち切ってエラーを表示する
+        forced = len(self.lines) >= 3 and not self.lines[-1].strip() and not self.lines[-2].strip()
+        if not forced and is_incomplete(code):
+            return True
+        self.lines = []
+        self.execute(code)
+        return False
+
+    def execute(self, code):
+        """codeを構文解析して、ブロックの要素ごとに実行する"""
+        import optimizer
+        import resolver
+        import syntaxtree
+        try:
+            program = resolver.resolve(optimizer.optimize(syntaxtree.lower(lagoon.parse(code))))
+            for node in program.body.stats if program.body else ():
+                result = self.interpreter.run(node)
+                if isinstance(node, syntaxtree.Exp) and result is not None:
+                    print(repr(result), file=self.stdout)
+        except Exception as error:
+            print('{}: {}'.format(type(error).__name__, error), file=self.stderr)
+
+    def cancel(self):
+        """入力途中の行を破棄する"""
+        self.lines = []
+
+    def run(self):
+        """入力が終わるまで対話を続ける"""
+        try:
+            import readline  # noqa
+        except ImportError:
+            pass
+        print('Lagoon (mode: {})'.format(self.interpreter.mode), file=self.stdout)
+        interactive = self.stdin.isatty()
+        prompt = PROMPT
+        while True:
+            try:
+                if interactive:
+                    line = input(prompt)
+                else:
+                    line = self.stdin.readline()
+                    if not line:
+                        raise EOFError
+                    line = line.rstrip('\n')
+            except EOFError:
+                if self.lines:
+                    code = '\n'.join(self.lines)
+                    self.lines = []
+                    self.execute(code)
+                print(file=self.stdout)
+                return
+            except KeyboardInterrupt:
+                print('\nKeyboardInterrupt', file=self.stdout)
+                self.cancel()
+                prompt = PROMPT
+                continue
+            prompt = CONTINUATION_PROMPT if self.feed(line) else PROMPT
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+
+# 名前の静的な解決
+# 関数ごとに、引数・args・current・本体で代入される名前へローカル変数の番号（スロット）を割り当て、
+# 名前の参照を (深さ, スロット) の候補へ解決する（深さは参照する関数から外側へ数えた関数の数）
+# 代入される前のローカル変数の参照は外側の名前を参照するので、候補は内側から順に試し、
+# 必ず値のある引数に至らなければ最後に大域・ビルトインの名前空間を参照する
+# exec, loadall, importallは大域の名前空間へ名前を加えるので、大域の名前は常に名前で参照する
+# 式展開やevalの式は実行時に構文解析されるので解決せず、名前で参照する（動的な参照）
+# 内包表記は代入先の名前だけを持つスコープを作り、反復する値の式の他は内包表記のスコープで解決する
+# （代入先の名前は内包表記の外へ漏れない）
+# parallel for文の本体も代入先と本体で代入される名前を持つスコープで実行する（本体はワーカーで実行される）
+
+import exceptions
+import syntaxtree
+
+import functools
+
+# 大域の名前空間へ名前を加えうるビルトイン（参照があれば未定義の名前をエラーとしない）
+DYNAMIC_NAMES = frozenset(['exec', 'loadall', 'importall', '__interpreter__'])
+# 実行時に名前で参照しうるビルトイン
+EVALUATING_NAMES = DYNAMIC_NAMES | {'eval'}
+
+
+class Scope(object):
+
+    """
+    関数・内包表記のローカル変数
+    namesはスロットの順の名前（引数、reserved（関数ではargs、current）、本体で代入される名前の順）
+    boundは呼び出しのたびに値が束縛される先頭のスロットの数
+    """
+
+    __slots__ = ('names', 'slots', 'arity', 'bound')
+
+    def __init__(self, arg_names, assigned_names, reserved=('args', 'current')):
+        names = []
+        for name in list(arg_names) + list(reserved):
+            if name not in names:
+                names.append(name)
+        self.bound = len(names)
+        for name in assigned_names:
+            if name not in names:
+                names.append(name)
+        self.names = tuple(names)
+        self.slots = {name: slot for slot, name in enumerate(names)}
+        self.arity = len(arg_names)
+
+    @property
+    def plain(self):
+        """引数の直後にargs, currentのスロットが続くか"""
+        return self.bound == self.arity + 2
+
+    def __repr__(self):
+        return 'Scope({!r}, bound={})'.format(self.names, self.bound)
+
+
+class Binding(object):
+
+    """
+    名前の参照の解決
+    candidatesは (深さ, スロット) の候補の組、globallyは候補のスロットに値が無ければ
+    大域・ビルトインの名前空間を参照するか
+    """
+
+    __slots__ = ('candidates', 'globally')
+
+    def __init__(self, candidates, globally):
+        self.candidates = candidates
+        self.globally = globally
+
+    def __repr__(self):
+        return 'Binding({!r}, globally={})'.format(self.candidates, self.globally)
+
+
+def scope_nodes(node):
+    """nodeとその子孫のうち、nodeと同じスコープで実行されるノード（内側の関数の本体を除く）"""
+    yield node
+    if isinstance(node, syntaxtree.Callable):
+        # デフォルト値は関数を定義する側で評価される
+        for param in node.params:
+            yield from scope_nodes(param)
+        return
+    if isinstance(node, (syntaxtree.SequenceGen, syntaxtree.MappingGen, syntaxtree.ParallelFor)):
+        # 反復する値は内包表記・parallel for文の外で評価される
+        yield from scope_nodes(node.iter)
+        return
+    for child in syntaxtree.children(node):
+        yield from scope_nodes(child)
+
+
+def assigned_names(node):
+    """nodeのスコープで代入される名前"""
+    for child in scope_nodes(node):
+        if isinstance(child, syntaxtree.NameTarget):
+            yield child.name
+        elif isinstance(child, syntaxtree.Handler) and child.name is not None:
+            yield child.name.name
+
+
+def exits(node):
+    """nodeのスコープにブロックを抜ける文（continue, break, return）があるか"""
+    return any(isinstance(child, (syntaxtree.Continue, syntaxtree.Break, syntaxtree.Return))
+               for child in scope_nodes(node))
+
+
+@functools.lru_cache(maxsize=1024)
+def referenced_names(node):
+    """
+    nodeとその子孫（内側の関数を含む）が名前で参照しうる名前の集合
+    式展開やevalなど、実行時に名前で参照しうるものを含めばNone
+    """
+    names = set()
+    pending = [node]
+    while pending:
+        child = pending.pop()
+        if isinstance(child, syntaxtree.Ref):
+            names.add(child.name)
+        elif isinstance(child, syntaxtree.Chain) and isinstance(child.head, str):
+            names.add(child.head)
+        elif isinstance(child, syntaxtree.String) and 'i' in child.macros:
+            return None
+        pending.extend(syntaxtree.children(child))
+    return None if names & EVALUATING_NAMES else frozenset(names)
+
+
+class Resolver(object):
+
+    def __init__(self, builtin_names):
+        self.builtin_names = builtin_names
+        # 内側ほど後ろにある関数のスコープ
+        self.scopes = []
+        self.global_names = set()
+        self.referenced = set()
+        # 大域・ビルトインだけを参照する (名前, ノード)
+        self.global_refs = []
+
+    def resolve(self, node):
+        method = getattr(self, 'resolve_{}'.format(type(node).__name__.lower()), None)
+        if method is None:
+            for child in syntaxtree.children(node):
+                self.resolve(child)
+        else:
+            method(node)
+
+    def bind(self, name, node):
+        """名前の参照を解決する"""
+        self.referenced.add(name)
+        candidates = []
+        for depth, scope in enumerate(reversed(self.scopes)):
+            slot = scope.slots.get(name)
+            if slot is not None:
+                candidates.append((depth, slot))
+                if slot < scope.bound:
+                    return Binding(tuple(candidates), False)
+        if not candidates:
+            self.global_refs.append((name, node))
+        return Binding(tuple(candidates), True)
+
+    def slot(self, name):
+        """代入する名前のスロット（大域ならばNone）"""
+        return self.scopes[-1].slots[name] if self.scopes else None
+
+    def resolve_program(self, node):
+        if node.body is not None:
+            self.global_names.update(assigned_names(node.body))
+            self.resolve(node.body)
+
+    def resolve_ref(self, node):
+        node.binding = self.bind(node.name, node)
+
+    def resolve_chain(self, node):
+        if isinstance(node.head, str):
+            node.binding = self.bind(node.head, node)
+        for child in syntaxtree.children(node):
+            self.resolve(child)
+
+    def resolve_nametarget(self, node):
+        node.slot = self.slot(node.name)
+
+    def resolve_handler(self, node):
+        if node.name is not None:
+            node.slot = self.slot(node.name.name)
+        for child in syntaxtree.children(node):
+            self.resolve(child)
+
+    def resolve_callable(self, node):
+        for param in node.params:
+            self.resolve(param)
+        node.scope = Scope([param.name for param in node.params], assigned_names(node.body))
+        self.scopes.append(node.scope)
+        try:
+            self.resolve(node.body)
+        finally:
+            self.scopes.pop()
+
+    resolve_asynccallable = resolve_callable
+
+    def resolve_sequencegen(self, node):
+        self.resolve(node.iter)
+        targets = node.targets.targets
+        names = [target.name for target in targets if isinstance(target, syntaxtree.NameTarget)]
+        if len(names) == len(targets):
+            # 名前だけに代入するならば、要素と条件の評価の前に必ず値がある
+            node.scope = Scope(names, (), reserved=())
+        else:
+            # 属性・インデックスの代入先はループの前に評価されるので、値の無いスロットを参照しうる
+            node.scope = Scope((), names, reserved=())
+        self.scopes.append(node.scope)
+        try:
+            for child in syntaxtree.children(node):
+                if child is not node.iter:
+                    self.resolve(child)
+        finally:
+            self.scopes.pop()
+
+    resolve_mappinggen = resolve_sequencegen
+
+    def resolve_parallelfor(self, node):
+        self.resolve(node.iter)
+        targets = node.targets.targets
+        names = [target.name for target in targets if isinstance(target, syntaxtree.NameTarget)]
+        if len(names) == len(targets):
+            node.scope = Scope(names, assigned_names(node.body), reserved=())
+        else:
+            node.scope = Scope((), names + list(assigned_names(node.body)), reserved=())
+        self.scopes.append(node.scope)
+        try:
+            self.resolve(node.targets)
+            self.resolve(node.body)
+        finally:
+            self.scopes.pop()
+
+    def check(self):
+        """どこでも定義されない名前の参照をエラーとする"""
+        if self.builtin_names is None or self.referenced & DYNAMIC_NAMES:
+            return
+        for name, node in self.global_refs:
+            if name not in self.global_names and name not in self.builtin_names:
+                line = node.src.count('\n', 0, node.pos) + 1
+                column = node.pos - (node.src.rfind('\n', 0, node.pos) + 1)
+                raise exceptions.LagoonNameError(
+                    '{} is not defined at line {}, column {}'.format(name, line, column))
+
+
+def resolve(program, builtin_names=None):
+    """
+    Programの構文木の名前を解決する
+    builtin_namesが与えられれば、どこでも定義されない名前の参照をLagoonNameErrorとする
+    （対話環境やexecのように、大域の名前が既にあるかもしれないときは与えない）
+    """
+    resolver = Resolver(builtin_names)
+    resolver.resolve(program)
+    resolver.check()
+    return program
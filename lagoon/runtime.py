@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+# Pythonのプログラムへの埋め込み
+# LagoonRuntime.compileでソースコードを一度だけ構文解析・変換し（Pythonモードではコードオブジェクトまで）、
+# 返したLagoonProgramをLagoonRuntime.runで何度でも実行する
+# 実行には使い終わったファイルのインタプリタをプールして使い回し、ビルトインの名前空間を作り直さない
+# 実行ごとに新しい大域の名前空間へ与えられた値を入れて実行し、トップレベルのreturn文の値を結果として返す
+# 関数やジェネレータを作ったインタプリタは（関数が大域の名前空間を参照し続けるので）プールへ戻さない
+
+import exceptions
+import interpreter
+import optimizer
+import resolver
+import syntaxtree
+
+import os
+
+
+class LagoonProgram(object):
+
+    """
+    LagoonRuntime.compileしたプログラム
+    bodyはProgramの構文木（Pythonモードではコードオブジェクト）で、クロージャなどへのコンパイル結果も持ち続ける
+    """
+
+    __slots__ = ('code', 'name', 'mode', 'body')
+
+    def __init__(self, code, name, mode, body):
+        self.code = code
+        self.name = name
+        self.mode = mode
+        self.body = body
+
+    def __repr__(self):
+        return 'LagoonProgram({!r}, mode={!r})'.format(self.name, self.mode)
+
+
+class LagoonRuntime(object):
+
+    """
+    埋め込んだLagoonの実行環境
+    file_pathはloadの相対パスの基準や__lagoonfile__になるパス、pool_sizeはプールするインタプリタの数の上限
+    複数のスレッドから同時にrunしてよい（インタプリタは実行ごとに一つのスレッドが占有する）
+    """
+
+    def __init__(self, mode='tree', file_path=None, pool_size=8):
+        self.mode = mode
+        self.file_path = os.path.abspath('<lagoon>') if file_path is None else file_path
+        self.pool_size = pool_size
+        self.pool = []
+
+    def compile(self, code, name='<lagoon>', names=None):
+        """
+        Lagoonソースコードを実行できるLagoonProgramにする
+        namesにrunで与える大域の名前を渡せば、どこでも定義されない名前の参照をLagoonNameErrorとする
+        """
+        import lagoon
+        program = optimizer.optimize(syntaxtree.lower(lagoon.parse(code)))
+        builtin_names = None if names is None else interpreter.builtin_names() | frozenset(names)
+        resolver.resolve(program, builtin_names)
+        if self.mode == 'python':
+            import transpiler
+            body = compile(transpiler.transpile(code, program), name, 'exec')
+        else:
+            body = program
+        return LagoonProgram(code, name, self.mode, body)
+
+    def acquire(self):
+        """プールのインタプリタ（無ければ作る）"""
+        it = None
+        if self.pool:
+            try:
+                it = self.pool.pop()
+            except IndexError:
+                pass
+        if it is None:
+            it = interpreter.LagoonFileInterpreter(self.file_path, mode=self.mode)
+        return it
+
+    def release(self, it):
+        """インタプリタをプールへ戻す（関数などに捕捉されたものは戻さない）"""
+        if not it.captured and len(self.pool) < self.pool_size:
+            it.reset({})
+            self.pool.append(it)
+
+    def execute(self, program, variables=None):
+        """
+        programを新しい大域の名前空間で実行し、(結果, 実行後の大域の名前空間の辞書) を返す
+        variablesは実行前に大域の名前空間へ入れる値の辞書
+        """
+        if program.mode != self.mode:
+            raise exceptions.LagoonOtherError('Program compiled for {} mode cannot run in {} mode'.format(
+                program.mode, self.mode))
+        namespace = {} if variables is None else dict(variables)
+        it = self.acquire()
+        try:
+            it.reset(namespace)
+            if self.mode == 'python':
+                import transpiler
+                result = transpiler.run(program.body, it)
+            else:
+                it.run(program.body)
+                result = it.exit_value()
+        finally:
+            self.release(it)
+        return result, namespace
+
+    def run(self, program, variables=None):
+        """programを実行した結果（トップレベルのreturn文の値、無ければNone）"""
+        return self.execute(program, variables)[0]
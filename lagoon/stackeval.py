@@ -0,0 +1,834 @@
+# -*- coding: utf-8 -*-
+
+# 明示的なスタックによる評価（スタックモード）
+# Lagoonの関数の呼び出しを含みうるノードは、クロージャの代わりにステップ（フレームを引数に取る
+# ジェネレータ関数）にコンパイルする。ステップはLagoonの関数の呼び出しを自ら行わず、
+# 呼び出しの要求 (関数, 位置引数, キーワード引数, current, 末尾呼び出しか) をyieldして結果を受け取る
+# driveは呼び出し元のステップをPythonの再帰ではなくリストに積むので、Lagoonの再帰の深さは
+# メモリだけで制限される。return文の末尾の呼び出しは、呼び出し元のフレームを置き換える（末尾呼び出しの除去）
+# 呼び出しを含まないノードや、内包表記・文字列の式展開など実行時にPythonから評価されるノードは
+# クロージャモードと同じクロージャにコンパイルし、そこでの呼び出しは新しいスタックで評価する
+# await式は待つ値の要求 (AWAIT, 待つ値, ...) をyieldする。非同期関数の本体は実行モードによらず
+# ステップにし、drive_asyncがコルーチンの中で実行して、要求の値をそのコルーチンで待つ
+
+import compiler
+import coroutines
+import exceptions
+import interpreter
+import syntaxtree
+
+import inspect
+import operator
+
+
+def step(node):
+    """
+    ノードに対応するステップを返す（呼び出しを含まなければNone）
+    コンパイル結果はProgram, Expression, Blockのノードに保存する
+    """
+    try:
+        return node.step
+    except AttributeError:
+        step_ = StackCompiler().step(node)
+        try:
+            node.step = step_
+        except AttributeError:
+            pass
+        return step_
+
+
+def traced_step(node):
+    """トレースのフックがある間に用いるstep"""
+    try:
+        return node.traced_step
+    except AttributeError:
+        step_ = TracingStackCompiler().step(node)
+        try:
+            node.traced_step = step_
+        except AttributeError:
+            pass
+        return step_
+
+
+def evaluate(node, it):
+    """スタックモードでのノードの実行"""
+    step_ = step(node)
+    if step_ is None:
+        return compiler.closure(node)(it)
+    return drive(step_(it))
+
+
+# キーワード引数の無い呼び出しの要求に用いる（書き込まれない）
+no_kwargs = {}
+
+# await式の要求の先頭（呼び出しの要求の関数の位置に置き、二番目に待つ値を置く）
+AWAIT = object()
+
+
+def call_request(func, args, kwargs, tail):
+    """funcがLagoonの関数（またはそのメソッド）ならば呼び出しの要求を、それ以外ならばNoneを返す"""
+    LagoonFunction = interpreter.LagoonFunction
+    LagoonMethod = interpreter.LagoonMethod
+    if type(func) is LagoonFunction:
+        return func, args, kwargs, None, tail
+    if type(func) is LagoonMethod and type(func.function) is LagoonFunction:
+        return func.function, args, kwargs, func.current, tail
+    return None
+
+
+def drive(gen, stack=None, value=None, error=None, suspend=False):
+    """
+    ステップのジェネレータgenを最後まで実行して結果を返す
+    stackの要素は、実行中の関数の (呼び出し元のジェネレータ, 関数, フレーム) である
+    await式の要求は、suspendならばSuspensionを返して止まり（drive_asyncが待って再開する）、
+    そうでなければcoroutines.await_で待つ（非同期関数の本体のスレッドの中でなければエラーになる）
+    """
+    EXIT = interpreter.EXIT
+    if stack is None:
+        stack = []
+    while True:
+        try:
+            if error is None:
+                request = gen.send(value)
+            else:
+                thrown, error = error, None
+                request = gen.throw(thrown)
+        except StopIteration as stop:
+            if not stack:
+                return stop.value
+            gen, function, frame = stack.pop()
+            value = stop.value
+            if value is EXIT:
+                value = frame.exit_value()
+            if interpreter.trace_hook is not None:
+                interpreter.trace('return', function.location(), value)
+            function.release(frame)
+            continue
+        except BaseException as e:
+            # コルーチンのキャンセル（CancelledError）なども呼び出し元へ伝え、フレームを戻す
+            if not stack:
+                raise
+            gen, function, frame = stack.pop()
+            function.release(frame)
+            error = e
+            continue
+
+        function, args, kwargs, current, tail = request
+        if function is AWAIT:
+            if not suspend:
+                try:
+                    value = coroutines.await_(args)
+                except Exception as e:
+                    error = e
+            elif inspect.isawaitable(args):
+                return Suspension(gen, stack, args)
+            else:
+                error = exceptions.LagoonTypeError('Value to await must be awaitable')
+            continue
+        traced = interpreter.trace_hook is not None
+        try:
+            frame = function.acquire(args, kwargs, current)
+        except Exception as e:
+            error = e
+            continue
+        if traced:
+            interpreter.trace('call', function.location(), function)
+        body = step(function.block_node)
+
+        if body is None:
+            # 呼び出しを含まない本体はその場で実行する（スタックは伸びない）
+            try:
+                result = compiler.closure(function.block_node)(frame)
+            except Exception as e:
+                function.release(frame)
+                error = e
+                continue
+            value = frame.exit_value() if result is EXIT else result
+            if traced:
+                interpreter.trace('return', function.location(), value)
+            function.release(frame)
+        elif tail and stack and not traced:
+            # 末尾呼び出し：実行中の関数のジェネレータを閉じ、フレームを置き換える
+            gen.close()
+            caller, previous, previous_frame = stack[-1]
+            previous.release(previous_frame)
+            stack[-1] = (caller, function, frame)
+            gen = body(frame)
+            value = None
+        else:
+            stack.append((gen, function, frame))
+            gen = body(frame)
+            value = None
+
+
+class Suspension(object):
+
+    """await式で止まったdriveの、待つ値と再開するジェネレータ・スタック"""
+
+    __slots__ = ('gen', 'stack', 'awaitable')
+
+    def __init__(self, gen, stack, awaitable):
+        self.gen = gen
+        self.stack = stack
+        self.awaitable = awaitable
+
+    def resume(self, value=None, error=None):
+        """待った結果value（またはエラーerror）で再開する"""
+        return drive(self.gen, self.stack, value, error, suspend=True)
+
+    def close(self):
+        """再開せずにジェネレータを閉じ、実行中の関数のフレームを戻す"""
+        self.gen.close()
+        for gen, function, frame in reversed(self.stack):
+            gen.close()
+            function.release(frame)
+
+
+async def drive_async(gen):
+    """
+    ステップのジェネレータgenを最後まで実行して結果を返すコルーチン
+    await式で止まるたびに、待つ値をこのコルーチンで待った結果（またはエラー）で再開する
+    """
+    result = drive(gen, suspend=True)
+    while type(result) is Suspension:
+        try:
+            value = await result.awaitable
+        except GeneratorExit:
+            # コルーチンが閉じられた
+            result.close()
+            raise
+        except BaseException as error:
+            result = result.resume(error=error)
+        else:
+            result = result.resume(value)
+    return result
+
+
+def async_body(node):
+    """
+    非同期関数の本体nodeの (ステップ（呼び出しもawait式も無ければNone）, スレッドで実行するか)
+    ステップにならない位置のawait式（リテラルや内包表記、式展開の中など）は本体を止められないので、
+    それを含む本体はcoroutines.run_bodyのスレッドで実行する
+    """
+    try:
+        return node.async_body
+    except AttributeError:
+        body = compile_async_body(StackCompiler(), node)
+        try:
+            node.async_body = body
+        except AttributeError:
+            pass
+        return body
+
+
+def traced_async_body(node):
+    """トレースのフックがある間に用いるasync_body"""
+    try:
+        return node.traced_async_body
+    except AttributeError:
+        body = compile_async_body(TracingStackCompiler(), node)
+        try:
+            node.traced_async_body = body
+        except AttributeError:
+            pass
+        return body
+
+
+def compile_async_body(compiler_, node):
+    step_ = compiler_.step(node)
+    threaded = any(await_node not in compiler_.stepped_awaits for await_node in body_awaits(node))
+    return step_, threaded
+
+
+def body_awaits(node):
+    """
+    関数の本体nodeの中のawait式（内側の関数の本体は辿らない）
+    文字列の式展開は実行時に構文解析するので、awaitを含みうるi文字列をawait式とみなす
+    """
+    if isinstance(node, syntaxtree.Await):
+        yield node
+    elif isinstance(node, syntaxtree.String):
+        if 'i' in node.macros and 'await' in node.contents:
+            yield node
+    elif isinstance(node, syntaxtree.Callable):
+        return
+    for child in syntaxtree.children(node):
+        yield from body_awaits(child)
+
+
+class StackCompiler(compiler.LagoonCompiler):
+
+    """
+    構文木をステップの木へ変換するコンパイラ
+    呼び出しを含みうるノードだけをステップにし、それ以外は親クラスのクロージャにする
+    子のノードは (ステップ, クロージャ) の組として持ち、どちらか一方だけがNoneでない
+    """
+
+    def __init__(self):
+        # 結果が関数の返り値となる（末尾呼び出しの）ノード
+        self.tails = set()
+        # try文の本体などの、末尾呼び出しを除去できない位置の深さ
+        self.guarded = 0
+        self.suspending = {}
+        # ステップにしたawait式のノード
+        self.stepped_awaits = set()
+
+    def step(self, node):
+        """ノードのステップ（呼び出しを含まなければNone）"""
+        if not self.suspends(node):
+            return None
+        return getattr(self, 'step_{}'.format(node.kind))(node)
+
+    def part(self, node):
+        """子のノードの (ステップ, クロージャ) の組"""
+        step_ = self.step(node)
+        if step_ is None:
+            return None, self.compile(node)
+        return step_, None
+
+    def suspends(self, node):
+        """
+        ノードの評価が呼び出しの要求をyieldしうるか
+        ステップを持たないノード（内包表記など）の内側は辿らない
+        """
+        try:
+            return self.suspending[node]
+        except KeyError:
+            pass
+        if not (hasattr(self, 'step_{}'.format(node.kind)) or isinstance(node, syntaxtree.Handler)):
+            result = False
+        elif isinstance(node, syntaxtree.Await):
+            result = True
+        elif isinstance(node, syntaxtree.Chain) and any(
+                isinstance(op, syntaxtree.Call) for op in node.ops):
+            result = True
+        else:
+            result = any([self.suspends(child) for child in syntaxtree.children(node)])
+        self.suspending[node] = result
+        return result
+
+    # general:
+
+    def step_program(self, node):
+        unwrapped = (exceptions.LagoonInterpreterError, exceptions.LagoonLoadError)
+        block = self.step(node.body)
+
+        def program(it):
+            try:
+                yield from block(it)
+            except unwrapped:
+                raise
+            except Exception:
+                raise it.located_error()
+        return program
+
+    def step_expression(self, node):
+        return self.step(node.body)
+
+    def step_block(self, node):
+        EXIT = interpreter.EXIT
+        children = tuple(self.part(child) for child in node.stats)
+        if len(children) == 1:
+            # 関数の本体が一つの文だけの場合など（ブロックの結果は文の結果そのもの）
+            return children[0][0]
+
+        def block(it):
+            for child_step, child in children:
+                result = (yield from child_step(it)) if child_step else child(it)
+                if result is EXIT:
+                    return EXIT
+            return result
+        return block
+
+    # operator:
+
+    def step_await(self, node):
+        self.stepped_awaits.add(node)
+        value_step, value = self.part(node.value)
+
+        def await_(it):
+            awaitable = (yield from value_step(it)) if value_step else value(it)
+            return (yield AWAIT, awaitable, None, None, False)
+        return await_
+
+    def step_range(self, node):
+        start_step, start = self.part(node.start) if node.start is not None else (None, None)
+        stop_step, stop = self.part(node.stop)
+        offset = 1 if node.closed else 0
+
+        def range_(it):
+            if start_step:
+                start_value = yield from start_step(it)
+            else:
+                start_value = start(it) if start else 0
+            stop_value = (yield from stop_step(it)) if stop_step else stop(it)
+            return range(start_value, stop_value + offset)
+        return range_
+
+    def call_parts(self, arg_nodes):
+        """呼び出しの引数を (引数のノード, キーワード, 値のステップ, 値のクロージャ) の組にする"""
+        return tuple((arg_node, arg_node.name) + self.part(arg_node.value)
+                     for arg_node in arg_nodes)
+
+    def step_chain(self, node):
+        tail = node in self.tails
+        keys = tuple(self.part(key) for key in node.keys)
+        record_node = node.record
+        if isinstance(node.head, str):
+            head_step = None
+            head = self.head(node.head, None if keys else record_node, node.binding)
+        else:
+            head_step, head = self.part(node.head)
+
+        ops = []
+        for op in node.ops:
+            if isinstance(op, syntaxtree.Call):
+                ops.append(('call', self.call_parts(op.args)))
+            elif isinstance(op, syntaxtree.Attr):
+                ops.append(('attr', op.name))
+            elif isinstance(op, syntaxtree.Index):
+                ops.append(('key', op.slot))
+            elif isinstance(op, syntaxtree.ConstIndex):
+                ops.append(('index', op.value))
+            else:
+                assert False
+        ops = tuple(ops)
+
+        if (head_step is None and not keys and len(ops) == 1 and ops[0][0] == 'call'
+                and all(name is None and value_step is None
+                        for _, name, value_step, _ in ops[0][1])):
+            return self.call_chain(head, tuple(value for _, _, _, value in ops[0][1]), tail)
+
+        LagoonCallable = interpreter.LagoonCallable
+        LagoonFunction = interpreter.LagoonFunction
+        LagoonMethod = interpreter.LagoonMethod
+        UNBOUND = interpreter.UNBOUND
+        # 末尾呼び出しとなる最後の呼び出しの位置
+        last = len(ops) - 1 if tail and ops[-1][0] == 'call' else None
+
+        def chain(it):
+            if keys:
+                key_values = []
+                for key_step, key in keys:
+                    key_values.append((yield from key_step(it)) if key_step else key(it))
+                if record_node is not None:
+                    it.last_node = record_node
+            result = (yield from head_step(it)) if head_step else head(it)
+            # 属性として参照したLagoonCallableのテーブル（次が呼び出しならLagoonMethodを作らない）
+            owner = UNBOUND
+            for position, (kind, value) in enumerate(ops):
+                if owner is not UNBOUND and (kind != 'call' or type(result) is not LagoonFunction):
+                    result = LagoonMethod(result, owner)
+                    owner = UNBOUND
+                if kind == 'call':
+                    args = []
+                    kwargs = {}
+                    for arg_node, name, value_step, value_ in value:
+                        arg_value = (yield from value_step(it)) if value_step else value_(it)
+                        if name is None:
+                            args.append(arg_value)
+                        else:
+                            it.last_node = arg_node
+                            kwargs[name] = arg_value
+                    if owner is not UNBOUND:
+                        request = result, tuple(args), kwargs, owner, position == last
+                        owner = UNBOUND
+                    else:
+                        request = call_request(result, tuple(args), kwargs, position == last)
+                    if request is None:
+                        result = result(*args, **kwargs)
+                    else:
+                        result = yield request
+                elif kind == 'attr':
+                    new_result = getattr(result, value)
+                    if isinstance(new_result, LagoonCallable):
+                        owner = result
+                    result = new_result
+                elif kind == 'index':
+                    result = result[value]
+                elif kind == 'key':
+                    result = result[key_values[value]]
+                else:
+                    assert False
+            if owner is not UNBOUND:
+                result = LagoonMethod(result, owner)
+            return result
+        return chain
+
+    def call_chain(self, head, values, tail):
+        """名前を位置引数だけで呼び出すチェーン（f(x, y)など）のステップ"""
+        LagoonFunction = interpreter.LagoonFunction
+
+        def call_chain(it):
+            func = head(it)
+            args = tuple([value(it) for value in values])
+            if type(func) is LagoonFunction:
+                return (yield func, args, no_kwargs, None, tail)
+            request = call_request(func, args, no_kwargs, tail)
+            if request is None:
+                return func(*args)
+            return (yield request)
+        return call_chain
+
+    def binary_step(self, node, func):
+        left_step, left = self.part(node.left)
+        right_step, right = self.part(node.right)
+
+        def binary(it):
+            left_value = (yield from left_step(it)) if left_step else left(it)
+            right_value = (yield from right_step(it)) if right_step else right(it)
+            return func(left_value, right_value)
+        return binary
+
+    def unary_step(self, node, func):
+        operand_step = self.step(node.operand)
+
+        def unary(it):
+            return func((yield from operand_step(it)))
+        return unary
+
+    def step_pow(self, node):
+        return self.binary_step(node, operator.pow)
+
+    def step_pos(self, node):
+        return self.unary_step(node, operator.pos)
+
+    def step_neg(self, node):
+        return self.unary_step(node, operator.neg)
+
+    def step_mul(self, node):
+        return self.binary_step(node, operator.mul)
+
+    def step_truediv(self, node):
+        return self.binary_step(node, operator.truediv)
+
+    def step_mod(self, node):
+        return self.binary_step(node, operator.mod)
+
+    def step_add(self, node):
+        return self.binary_step(node, operator.add)
+
+    def step_sub(self, node):
+        return self.binary_step(node, operator.sub)
+
+    def step_lt(self, node):
+        return self.binary_step(node, operator.lt)
+
+    def step_le(self, node):
+        return self.binary_step(node, operator.le)
+
+    def step_eq(self, node):
+        return self.binary_step(node, operator.eq)
+
+    def step_ne(self, node):
+        return self.binary_step(node, operator.ne)
+
+    def step_ge(self, node):
+        return self.binary_step(node, operator.ge)
+
+    def step_gt(self, node):
+        return self.binary_step(node, operator.gt)
+
+    def step_is_(self, node):
+        return self.binary_step(node, operator.is_)
+
+    def step_contains(self, node):
+        return self.binary_step(node, lambda left, right: left in right)
+
+    def step_not_(self, node):
+        return self.unary_step(node, operator.not_)
+
+    def step_and_(self, node):
+        left_step, left = self.part(node.left)
+        right_step, right = self.part(node.right)
+
+        def and_(it):
+            left_value = (yield from left_step(it)) if left_step else left(it)
+            if not left_value:
+                return left_value
+            return (yield from right_step(it)) if right_step else right(it)
+        return and_
+
+    def step_or_(self, node):
+        left_step, left = self.part(node.left)
+        right_step, right = self.part(node.right)
+
+        def or_(it):
+            left_value = (yield from left_step(it)) if left_step else left(it)
+            if left_value:
+                return left_value
+            return (yield from right_step(it)) if right_step else right(it)
+        return or_
+
+    def step_isa(self, node):
+        return self.binary_step(node, isinstance)
+
+    def step_one_if(self, node):
+        if node in self.tails:
+            self.tails.update((node.body, node.orelse))
+        true_step, true = self.part(node.body)
+        condition_step, condition = self.part(node.test)
+        false_step, false = self.part(node.orelse)
+
+        def one_if(it):
+            if (yield from condition_step(it)) if condition_step else condition(it):
+                return (yield from true_step(it)) if true_step else true(it)
+            return (yield from false_step(it)) if false_step else false(it)
+        return one_if
+
+    def step_one_try(self, node):
+        self.guarded += 1
+        try:
+            body_step, body = self.part(node.body)
+        finally:
+            self.guarded -= 1
+        exception_step, exception = self.part(node.exception)
+        alternative_step, alternative = self.part(node.alternative)
+
+        def one_try(it):
+            try:
+                return (yield from body_step(it)) if body_step else body(it)
+            except Exception as error:
+                exception_value = (yield from exception_step(it)) if exception_step else exception(it)
+                if not isinstance(error, exception_value):
+                    raise
+            return (yield from alternative_step(it)) if alternative_step else alternative(it)
+        return one_try
+
+    # statement:
+
+    def step_assign(self, node):
+        right_step, right = self.part(node.value)
+
+        if node.op is None and self.assign_name(node.targets):
+            name = self.assign_name(node.targets)
+            slot = node.targets.targets[0].slot
+            if slot is not None:
+                def assign_slot(it):
+                    it.slots[slot] = (yield from right_step(it)) if right_step else right(it)
+                return assign_slot
+
+            def assign_name(it):
+                value = (yield from right_step(it)) if right_step else right(it)
+                it.namespaces[-1][name] = value
+            return assign_name
+
+        left = self.compile(node.targets)
+        if node.op is None:
+            def assign(it):
+                assignment = left(it)
+                value = (yield from right_step(it)) if right_step else right(it)
+                return it.assign(assignment=assignment, value=value)
+            return assign
+
+        left_value_step, left_value = self.part(node.current)
+        combine = {
+            'add': operator.iadd,
+            'sub': operator.isub,
+            'mul': operator.imul,
+            'div': operator.itruediv,
+        }[node.op]
+        LagoonOtherError = exceptions.LagoonOtherError
+
+        def combined_assign(it):
+            assignment = left(it)
+            value = (yield from right_step(it)) if right_step else right(it)
+            if isinstance(assignment, list):
+                raise LagoonOtherError(
+                    'combined assign operator cannot used for multiple assignment')
+            current = (yield from left_value_step(it)) if left_value_step else left_value(it)
+            return it.assign(assignment=assignment, value=combine(value, current))
+        return combined_assign
+
+    def step_assign_right(self, node):
+        AssignTuple = interpreter.AssignTuple
+        values = tuple(self.part(n) for n in node.values)
+
+        def assign_right(it):
+            results = []
+            for value_step, value in values:
+                results.append((yield from value_step(it)) if value_step else value(it))
+            return AssignTuple(results)
+        return assign_right
+
+    def step_if(self, node):
+        pairs = tuple((self.part(condition_node) if condition_node else (None, None),
+                       self.part(block_node))
+                      for condition_node, block_node in node.branches)
+
+        def if_(it):
+            for (condition_step, condition), (block_step, block) in pairs:
+                if condition_step:
+                    satisfied = yield from condition_step(it)
+                else:
+                    satisfied = condition is None or condition(it)
+                if satisfied:
+                    return (yield from block_step(it)) if block_step else block(it)
+        return if_
+
+    def step_while(self, node):
+        EXIT = interpreter.EXIT
+        condition_step, condition = self.part(node.condition)
+        block_step, block = self.part(node.body)
+
+        def while_(it):
+            while (yield from condition_step(it)) if condition_step else condition(it):
+                result = (yield from block_step(it)) if block_step else block(it)
+                if result is EXIT and it.exiting:
+                    return it.exit_loop()
+        return while_
+
+    def step_for(self, node):
+        EXIT = interpreter.EXIT
+        container_step, container = self.part(node.iter)
+        block_step, block = self.part(node.body)
+        name = self.assign_name(node.targets)
+        slot = node.targets.targets[0].slot if name else None
+        assign = self.compile(node.targets)
+
+        def for_(it):
+            values = (yield from container_step(it)) if container_step else container(it)
+            for value in values:
+                if slot is not None:
+                    it.slots[slot] = value
+                elif name:
+                    it.namespaces[-1][name] = value
+                else:
+                    it.assign(assign(it), value=value)
+                result = (yield from block_step(it)) if block_step else block(it)
+                if result is EXIT and it.exiting:
+                    return it.exit_loop()
+        return for_
+
+    def step_times(self, node):
+        EXIT = interpreter.EXIT
+        LagoonTypeError = exceptions.LagoonTypeError
+        count_step, count_ = self.part(node.count)
+        block_step, block = self.part(node.body)
+
+        def times(it):
+            count = (yield from count_step(it)) if count_step else count_(it)
+            if not isinstance(count, int):
+                raise LagoonTypeError('Number of times to repeat must be int')
+            for _ in range(count):
+                result = (yield from block_step(it)) if block_step else block(it)
+                if result is EXIT and it.exiting:
+                    return it.exit_loop()
+        return times
+
+    def step_break(self, node):
+        EXIT = interpreter.EXIT
+        LagoonTypeError = exceptions.LagoonTypeError
+        depth_step = self.step(node.depth)
+
+        def break_depth(it):
+            depth = yield from depth_step(it)
+            if not isinstance(depth, int):
+                raise LagoonTypeError('Depth must be int')
+            if depth < 1:
+                return None
+            it.exiting = depth
+            return EXIT
+        return break_depth
+
+    def step_return(self, node):
+        EXIT = interpreter.EXIT
+        RETURN_DEPTH = interpreter.RETURN_DEPTH
+        if not self.guarded:
+            self.tails.add(node.value)
+        result_step = self.step(node.value)
+
+        def return_(it):
+            it.returned = yield from result_step(it)
+            it.exiting = RETURN_DEPTH
+            return EXIT
+        return return_
+
+    def step_try(self, node):
+        self.guarded += 1
+        try:
+            block_step, block = self.part(node.body)
+        finally:
+            self.guarded -= 1
+        handlers = tuple(((self.part(handler.exception) if handler.exception else (None, None)),
+                          handler.name, handler.slot, self.part(handler.body))
+                         for handler in node.handlers)
+
+        def try_(it):
+            try:
+                return (yield from block_step(it)) if block_step else block(it)
+            except Exception as e:
+                # ハンドラは引数の無いraise文で再送出できるよう、exceptの中で実行する
+                for (exception_step, exception_), name_node, slot, (handler_step, handler) in handlers:
+                    if exception_step:
+                        exception = yield from exception_step(it)
+                    else:
+                        exception = exception_(it) if exception_ else None
+                    if name_node:
+                        it.last_node = name_node
+                    if not exception or (exception and isinstance(e, exception)):
+                        if slot is not None:
+                            it.slots[slot] = e
+                        elif name_node:
+                            it.valid_namespace[name_node.name] = e
+                        return (yield from handler_step(it)) if handler_step else handler(it)
+                else:
+                    raise e
+        return try_
+
+    def step_raise(self, node):
+        result_step = self.step(node.value)
+
+        def raise_(it):
+            raise (yield from result_step(it))
+        return raise_
+
+    def step_assert(self, node):
+        result_step = self.step(node.value)
+
+        def assert_(it):
+            if not (yield from result_step(it)):
+                raise AssertionError
+        return assert_
+
+    # expression:
+
+    def step_table(self, node):
+        LagoonTable = interpreter.LagoonTable
+        items = tuple((name,) + self.part(value) for name, value in node.items)
+
+        def table(it):
+            values = {}
+            for name, value_step, value in items:
+                values[name] = (yield from value_step(it)) if value_step else value(it)
+            return LagoonTable(**values)
+        return table
+
+
+class TracingStackCompiler(StackCompiler, compiler.TracingCompiler):
+
+    """
+    トレースのフックがある間に用いるコンパイラ
+    ブロックの要素ごとにline, exceptionイベントを発生させる
+    """
+
+    def step_block(self, node):
+        EXIT = interpreter.EXIT
+        trace = interpreter.trace
+        children = tuple((not isinstance(child_node, syntaxtree.Comment), child_node)
+                         + self.part(child_node)
+                         for child_node in node.stats)
+
+        def block(it):
+            for traced, child_node, child_step, child in children:
+                if traced:
+                    trace('line', it.node_location(child_node), None)
+                try:
+                    result = (yield from child_step(it)) if child_step else child(it)
+                except Exception as error:
+                    trace('exception', it.node_location(child_node), error)
+                    raise
+                if result is EXIT:
+                    return EXIT
+            return result
+        return block
@@ -0,0 +1,825 @@
+# -*- coding: utf-8 -*-
+
+# 実行時の構文木
+# 構文解析したparsimoniousのノードの木を、__slots__を持つノードの木へ変換（低水準化）する
+# ラッパーのノード（stat, exp, assign_opeなど）は取り除き、子はfindで探さずに名前のある
+# フィールドで持つ。各ノードはソースの文字列への参照とその中の開始位置（整数）だけを持ち、
+# ノードごとの部分文字列や子のリストは持たない
+# インタプリタ・クロージャへのコンパイラ・トランスパイラはいずれもこの木を辿る
+
+import exceptions
+
+import itertools
+
+# 記号エイリアス
+SYMBOLS = {'$': 'globalvars', '@': 'current', '^': 'parent', '%': 'args'}
+
+
+class Node(object):
+
+    """
+    構文木のノード
+    srcはソースの文字列（ファイル、exec、式展開ごとに一つを共有する）、posはその中の開始位置
+    fieldsは子などを持つフィールドの名前の組（省略したフィールドはNone）、
+    kindはvisit_などのメソッド名に用いる名前
+    エラー位置の記録にだけ用いる位置はこのクラスのインスタンスで表す
+    """
+
+    __slots__ = ('src', 'pos')
+    fields = ()
+    kind = 'node'
+
+    def __init__(self, src, pos, *values):
+        self.src = src
+        self.pos = pos
+        for field, value in itertools.zip_longest(self.fields, values):
+            setattr(self, field, value)
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join(
+            '{}={!r}'.format(field, getattr(self, field)) for field in self.fields))
+
+    def __getstate__(self):
+        """複製（pickle）は位置とフィールドだけを持つ（コンパイルしたクロージャなどは持たない）"""
+        return (self.src, self.pos) + tuple(getattr(self, field) for field in self.fields)
+
+    def __setstate__(self, state):
+        Node.__init__(self, *state)
+
+
+class Stat(Node):
+    """文"""
+    __slots__ = ()
+
+
+class Exp(Node):
+    """式"""
+    __slots__ = ()
+
+
+# general:
+
+class Program(Node):
+    __slots__ = ('body', 'closure', 'traced_closure', 'step', 'traced_step')
+    fields = ('body',)
+    kind = 'program'
+
+
+class Expression(Node):
+    """evalで評価する式、呼び出しごとに評価するデフォルト値"""
+    __slots__ = ('body', 'closure', 'traced_closure', 'step', 'traced_step')
+    fields = ('body',)
+    kind = 'expression'
+
+
+class Block(Node):
+    __slots__ = ('stats', 'closure', 'traced_closure', 'step', 'traced_step',
+                 'async_body', 'traced_async_body')
+    fields = ('stats',)
+    kind = 'block'
+
+
+class Comment(Node):
+    __slots__ = ()
+    kind = 'comm'
+
+
+# statement:
+
+class Assign(Stat):
+    """
+    代入（opは複合代入の演算の名前、currentは複合代入で右辺に作用させる代入先の値）
+    """
+    __slots__ = fields = ('targets', 'op', 'value', 'current')
+    kind = 'assign'
+
+
+class Targets(Node):
+    """代入先の列"""
+    __slots__ = fields = ('targets',)
+    kind = 'assign_left'
+
+
+class NameTarget(Node):
+    """slotは関数のローカル変数のスロット（resolverが設定する、それ以外ではNone）"""
+    __slots__ = fields = ('name', 'slot')
+
+
+class AttrTarget(Node):
+    """objは代入先の属性を持つオブジェクトのチェーン（キーはすべてobjが持つ）"""
+    __slots__ = fields = ('obj', 'name')
+
+
+class IndexTarget(Node):
+    """indexはobjのチェーンの最後のIndexまたはConstIndex"""
+    __slots__ = fields = ('obj', 'index')
+
+
+class Values(Node):
+    """代入時のカンマ区切りの値"""
+    __slots__ = fields = ('values',)
+    kind = 'assign_right'
+
+
+class If(Stat):
+    """branchesは (条件（elseならばNone）, ブロック) の組"""
+    __slots__ = fields = ('branches',)
+    kind = 'if'
+
+
+class While(Stat):
+    __slots__ = fields = ('condition', 'body')
+    kind = 'while'
+
+
+class For(Stat):
+    __slots__ = fields = ('targets', 'iter', 'body')
+    kind = 'for'
+
+
+class ParallelFor(Stat):
+    """
+    本体をプロセスプールのワーカーで実行するfor文
+    scopeは代入先と本体で代入される名前のスロット（resolverが設定する、それ以外ではNone）
+    """
+    __slots__ = fields = ('targets', 'iter', 'body', 'scope')
+    kind = 'parallel_for'
+
+
+class Times(Stat):
+    __slots__ = fields = ('count', 'body')
+    kind = 'times'
+
+
+class Continue(Stat):
+    __slots__ = ()
+    kind = 'continue'
+
+
+class Break(Stat):
+    __slots__ = fields = ('depth',)
+    kind = 'break'
+
+
+class Return(Stat):
+    __slots__ = fields = ('value',)
+    kind = 'return'
+
+
+class Try(Stat):
+    __slots__ = fields = ('body', 'handlers')
+    kind = 'try'
+
+
+class Handler(Node):
+    """slotはnameのスロット（NameTargetを参照）"""
+    __slots__ = fields = ('exception', 'name', 'body', 'slot')
+
+
+class Raise(Stat):
+    __slots__ = fields = ('value',)
+    kind = 'raise'
+
+
+class Assert(Stat):
+    __slots__ = fields = ('value',)
+    kind = 'assert'
+
+
+# operator:
+
+class Range(Exp):
+    __slots__ = fields = ('start', 'stop', 'closed')
+    kind = 'range'
+
+
+class Chain(Exp):
+
+    """
+    属性・呼び出し・インデックスのチェーン
+    headは先頭の名前（文字列）または式、opsは後に続く操作の組
+    ツリーモードではインデックスのキーをチェーンに先立って評価するので、キーの式はkeysに持ち、
+    Indexはその番号を指す。recordはキーの評価の後に記録する位置（無ければNone）
+    bindingは先頭の名前の解決（resolverが設定する、それ以外ではNone）
+    """
+
+    __slots__ = fields = ('head', 'ops', 'keys', 'record', 'binding')
+    kind = 'chain'
+
+
+class Call(Node):
+    __slots__ = fields = ('args',)
+
+
+class Arg(Node):
+    """呼び出しの引数（nameはキーワード、無ければNone）"""
+    __slots__ = fields = ('name', 'value')
+
+
+class Attr(Node):
+    __slots__ = fields = ('name',)
+
+
+class Index(Node):
+    """slotはチェーンのkeysの番号"""
+    __slots__ = fields = ('slot',)
+
+
+class ConstIndex(Node):
+    """%0などの定数のインデックス"""
+    __slots__ = fields = ('value',)
+
+
+class Await(Exp):
+    """await式（valueを待つ間、実行中の非同期関数を止める）"""
+    __slots__ = fields = ('value',)
+    kind = 'await'
+
+
+class Unary(Exp):
+    __slots__ = fields = ('operand',)
+
+
+class Binary(Exp):
+    __slots__ = fields = ('left', 'right')
+
+
+class Pow(Binary):
+    __slots__ = ()
+    kind = 'pow'
+
+
+class Pos(Unary):
+    __slots__ = ()
+    kind = 'pos'
+
+
+class Neg(Unary):
+    __slots__ = ()
+    kind = 'neg'
+
+
+class Mul(Binary):
+    __slots__ = ()
+    kind = 'mul'
+
+
+class TrueDiv(Binary):
+    __slots__ = ()
+    kind = 'truediv'
+
+
+class Mod(Binary):
+    __slots__ = ()
+    kind = 'mod'
+
+
+class Add(Binary):
+    __slots__ = ()
+    kind = 'add'
+
+
+class Sub(Binary):
+    __slots__ = ()
+    kind = 'sub'
+
+
+class Lt(Binary):
+    __slots__ = ()
+    kind = 'lt'
+
+
+class Le(Binary):
+    __slots__ = ()
+    kind = 'le'
+
+
+class Eq(Binary):
+    __slots__ = ()
+    kind = 'eq'
+
+
+class Ne(Binary):
+    __slots__ = ()
+    kind = 'ne'
+
+
+class Ge(Binary):
+    __slots__ = ()
+    kind = 'ge'
+
+
+class Gt(Binary):
+    __slots__ = ()
+    kind = 'gt'
+
+
+class Is(Binary):
+    __slots__ = ()
+    kind = 'is_'
+
+
+class Contains(Binary):
+    __slots__ = ()
+    kind = 'contains'
+
+
+class Isa(Binary):
+    __slots__ = ()
+    kind = 'isa'
+
+
+class Not(Unary):
+    __slots__ = ()
+    kind = 'not_'
+
+
+class And(Binary):
+    __slots__ = ()
+    kind = 'and_'
+
+
+class Or(Binary):
+    __slots__ = ()
+    kind = 'or_'
+
+
+class OneIf(Exp):
+    __slots__ = fields = ('body', 'test', 'orelse')
+    kind = 'one_if'
+
+
+class OneTry(Exp):
+    __slots__ = fields = ('body', 'exception', 'alternative')
+    kind = 'one_try'
+
+
+# expression:
+
+class Number(Exp):
+    __slots__ = fields = ('value',)
+    kind = 'number'
+
+
+class String(Exp):
+    """
+    文字列リテラル
+    styleは本体の種類（'sq_string'など）、bodyは本体の位置
+    templateはツリーモードで最初に評価したときに保存するinterpreter.StringTemplate
+    """
+    __slots__ = ('macros', 'style', 'contents', 'body', 'template')
+    fields = ('macros', 'style', 'contents', 'body')
+    kind = 'string'
+
+
+class Constant(Exp):
+    """
+    畳み込んだ定数（optimizerが作る）
+    lastは評価の後に記録する位置（畳み込む前の式で最後に評価されるノードの位置）
+    """
+    __slots__ = fields = ('value', 'last')
+    kind = 'constant'
+
+
+class Container(Exp):
+    """itemsはEmpty, SequenceItems, MappingItems, SequenceGen, MappingGenのいずれか"""
+    __slots__ = fields = ('items',)
+
+
+class List(Container):
+    __slots__ = ()
+    kind = 'list'
+
+
+class Tuple(Container):
+    __slots__ = ()
+    kind = 'tuple'
+
+
+class Set(Container):
+    __slots__ = ()
+    kind = 'set'
+
+
+class FrozenSet(Container):
+    __slots__ = ()
+    kind = 'frozenset'
+
+
+class Generator(Container):
+    __slots__ = ()
+    kind = 'generator'
+
+
+class Dict(Container):
+    __slots__ = ()
+    kind = 'dict'
+
+
+class OrderedDict(Container):
+    __slots__ = ()
+    kind = 'ordereddict'
+
+
+class Empty(Node):
+    __slots__ = ()
+    kind = 'empty'
+
+
+class SequenceItems(Node):
+    __slots__ = fields = ('values',)
+    kind = 'sequence_items'
+
+
+class MappingItems(Node):
+    """itemsは (キー, 値) の組"""
+    __slots__ = fields = ('items',)
+    kind = 'mapping_items'
+
+
+class SequenceGen(Node):
+    """
+    内包表記（elementが無ければ要素そのものを生成する）
+    scopeは代入先の名前のスロット（resolverが設定する、それ以外ではNone）
+    """
+    __slots__ = fields = ('element', 'targets', 'iter', 'condition', 'scope')
+    kind = 'sequence_gen'
+
+
+class MappingGen(Node):
+    """keyが無ければ要素そのものを生成する"""
+    __slots__ = fields = ('key', 'value', 'targets', 'iter', 'condition', 'scope')
+    kind = 'mapping_gen'
+
+
+class Table(Exp):
+    """itemsは (名前, 値) の組"""
+    __slots__ = fields = ('items',)
+    kind = 'table'
+
+
+class Callable(Exp):
+    """
+    recordはデフォルト値の評価の後に記録する位置（無ければNone）
+    scopeはローカル変数のスロット（resolverが設定する、それ以外ではNone）
+    """
+    __slots__ = fields = ('params', 'body', 'record', 'scope')
+    kind = 'callable'
+    # 呼び出すとコルーチンを返す非同期関数か
+    coroutine = False
+
+
+class AsyncCallable(Callable):
+    """非同期関数（async {...}）"""
+    __slots__ = ()
+    coroutine = True
+
+
+class Param(Node):
+    """
+    引数（defaultはデフォルト値、無ければNone）
+    dynamicならばdefaultは呼び出しごとに評価するExpressionである
+    """
+    __slots__ = fields = ('name', 'default', 'dynamic')
+
+
+# characters:
+
+class Ref(Exp):
+    """bindingは名前の解決（resolverが設定する、それ以外ではNone）"""
+    __slots__ = fields = ('name', 'binding')
+    kind = 'ref_name'
+
+
+class Name(Node):
+    __slots__ = fields = ('name',)
+    kind = 'name'
+
+
+def node_classes(cls=Node):
+    for subclass in cls.__subclasses__():
+        yield subclass
+        yield from node_classes(subclass)
+
+
+# インタプリタのvisitメソッドの名前
+for cls in (Node,) + tuple(node_classes()):
+    cls.visitor = 'visit_{}'.format(cls.kind)
+
+
+OPERATORS = {cls.kind: cls for cls in node_classes()
+             if issubclass(cls, (Unary, Binary, OneIf, OneTry)) and cls.kind != 'node'}
+
+CONTAINERS = {cls.kind: cls for cls in node_classes(Container)}
+
+
+def walk(node):
+    """nodeとその子孫のノードを行きがけ順に返す"""
+    yield node
+    for child in children(node):
+        yield from walk(child)
+
+
+def children(node):
+    """nodeのフィールドにある子のノード"""
+    for field in node.fields:
+        value = getattr(node, field)
+        # recordにノード自身を持つ場合がある
+        if value is not node:
+            yield from field_nodes(value)
+
+
+def field_nodes(value):
+    if isinstance(value, Node):
+        yield value
+    elif isinstance(value, tuple):
+        for item in value:
+            yield from field_nodes(item)
+
+
+def lower(root_node):
+    """ふるいにかけたprogramまたはexpのノードの木を構文木に変換する"""
+    lowering = Lowering(root_node.full_text)
+    if root_node.expr_name == 'program':
+        return lowering.lower(root_node)
+    return lowering.expression(root_node)
+
+
+class Lowering(object):
+
+    """
+    parsimoniousのノードを構文木のノードに変換する
+    ノードの位置はparsimoniousのノードの開始位置をそのまま用いる
+    """
+
+    def __init__(self, text):
+        self.text = text
+
+    def make(self, cls, node, *values):
+        return cls(self.text, node.start, *values)
+
+    def marker(self, node):
+        """エラー位置の記録にだけ用いる位置"""
+        return Node(self.text, node.start)
+
+    def lower(self, node):
+        name = node.expr_name
+        if name in OPERATORS:
+            return self.make(OPERATORS[name], node, *[self.lower(child) for child in node])
+        if name in CONTAINERS:
+            return self.make(CONTAINERS[name], node, self.items(node[0]))
+        return getattr(self, 'lower_{}'.format(name))(node)
+
+    def optional(self, node):
+        return self.lower(node) if node else None
+
+    def expression(self, node):
+        return self.make(Expression, node, self.lower(node))
+
+    # general:
+
+    def lower_program(self, node):
+        return self.make(Program, node, self.optional(node.find('block')))
+
+    def lower_block(self, node):
+        return self.make(Block, node, tuple(self.lower(child) for child in node))
+
+    def lower_comm(self, node):
+        return self.make(Comment, node)
+
+    def lower_stat(self, node):
+        return self.lower(node[0])
+
+    def lower_exp(self, node):
+        return self.lower(node[0])
+
+    # statement:
+
+    def lower_assign(self, node):
+        left_node = node.find('assign_left')
+        op = {
+            'assign_ope_': None,
+            'assign_ope_add': 'add',
+            'assign_ope_sub': 'sub',
+            'assign_ope_mul': 'mul',
+            'assign_ope_div': 'div',
+        }[node.find('assign_ope')[0].expr_name]
+        right_node = node.find('assign_right')
+        values = tuple(self.lower(n) for n in right_node.findall('exp'))
+        value = values[0] if len(values) < 2 else self.make(Values, right_node, values)
+        current = self.lower(left_node[0]) if op else None
+        return self.make(Assign, node, self.lower(left_node), op, value, current)
+
+    def lower_assign_left(self, node):
+        return self.make(Targets, node, tuple(self.target(n) for n in node.findall('chain')))
+
+    def target(self, node):
+        head, ops, keys, record = self.chain_parts(node)
+        if not ops:
+            if isinstance(head, str):
+                return self.make(NameTarget, node, head)
+        else:
+            obj = self.make(Chain, node, head, ops[:-1], keys, record)
+            tail = ops[-1]
+            if isinstance(tail, Attr):
+                return self.make(AttrTarget, node, obj, tail.name)
+            elif isinstance(tail, (Index, ConstIndex)):
+                return self.make(IndexTarget, node, obj, tail)
+        line = self.text.count('\n', 0, node.start) + 1
+        column = node.start - (self.text.rfind('\n', 0, node.start) + 1)
+        raise exceptions.LagoonOtherError(
+            'Cannot assign to {!r} at line {}, column {}'.format(node.text, line, column))
+
+    def lower_if(self, node):
+        return self.make(If, node, tuple(
+            (self.optional(n.find('exp')), self.lower(n.find('block')))
+            for n in node.findall({'if_if', 'if_elseif', 'if_else'})))
+
+    def lower_while(self, node):
+        return self.make(While, node, self.lower(node.find('exp')), self.lower(node.find('block')))
+
+    def lower_for(self, node):
+        return self.make(For, node, self.lower(node.find('assign_left')),
+                         self.lower(node.find('exp')), self.lower(node.find('block')))
+
+    def lower_parallel(self, node):
+        loop = node.find('for')
+        return self.make(ParallelFor, node, self.lower(loop.find('assign_left')),
+                         self.lower(loop.find('exp')), self.lower(loop.find('block')))
+
+    def lower_times(self, node):
+        return self.make(Times, node, self.lower(node.find('exp')), self.lower(node.find('block')))
+
+    def lower_continue(self, node):
+        return self.make(Continue, node)
+
+    def lower_break(self, node):
+        return self.make(Break, node, self.optional(node.find('exp')))
+
+    def lower_return(self, node):
+        return self.make(Return, node, self.optional(node.find('exp')))
+
+    def lower_try(self, node):
+        handlers = []
+        for except_node in node.findall('try_except'):
+            name_node = except_node.find('name')
+            handlers.append(self.make(
+                Handler, except_node, self.optional(except_node.find('exp')),
+                self.make(Name, name_node, name_node.text) if name_node else None,
+                self.lower(except_node.find('block'))))
+        return self.make(Try, node, self.lower(node.find('try_try').find('block')),
+                         tuple(handlers))
+
+    def lower_raise(self, node):
+        return self.make(Raise, node, self.optional(node.find('exp')))
+
+    def lower_assert(self, node):
+        return self.make(Assert, node, self.optional(node.find('exp')))
+
+    # operator:
+
+    def lower_await(self, node):
+        return self.make(Await, node, self.lower(node[0]))
+
+    def lower_range(self, node):
+        start_node = node.find('range_start')
+        return self.make(Range, node,
+                         self.lower(start_node[0]) if start_node else None,
+                         self.lower(node.find('range_stop')[0]),
+                         node.find('range_ope')[0].expr_name == 'range_ope_closed')
+
+    def chain_parts(self, node):
+        """
+        チェーンの (先頭, 操作の組, キーの組, 記録する位置)
+        記録する位置は、ツリーモードでキーとともに先行して評価する属性名などのうち最後のもの
+        """
+        children = node.children
+        head_node = children[0]
+        ops = []
+        keys = []
+        record = None
+        if head_node.expr_name == 'symbolattr_name':
+            symbol_nodes = head_node.children
+            head = SYMBOLS[symbol_nodes[0].text]
+            ops.extend(self.make(Attr, head_node, SYMBOLS.get(n.text, n.text))
+                       for n in symbol_nodes[1:])
+            record = self.marker(symbol_nodes[-1])
+        elif head_node.expr_name == 'symbolindex_name':
+            symbol_node, number_node = head_node.children
+            head = SYMBOLS[symbol_node.text]
+            ops.append(self.make(ConstIndex, head_node, int(number_node.text)))
+            record = self.marker(number_node)
+        elif head_node.expr_name == 'ref_name':
+            head = head_node.text
+        else:
+            head = self.lower(head_node)
+
+        for child in children[1:]:
+            if child.expr_name == 'call_paren':
+                ops.append(self.make(Call, child, tuple(
+                    self.make(Arg, n, n.find('name').text if n.find('name') else None,
+                              self.lower(n.find('exp')))
+                    for n in child.findall('call_paren_arg'))))
+            elif child.expr_name == 'attr_dot':
+                ops.append(self.make(Attr, child, child[0].text))
+                record = self.marker(child[0])
+            elif child.expr_name == 'index_ope':
+                ops.append(self.make(Index, child, len(keys)))
+                keys.append(self.lower(child[0]))
+                record = None
+            else:
+                assert False
+        return head, tuple(ops), tuple(keys), record
+
+    def lower_chain(self, node):
+        head, ops, keys, record = self.chain_parts(node)
+        # 操作の無いチェーンは先頭の名前や式にする（括弧で囲んだ式は位置を保つため残す）
+        if not ops and isinstance(head, str):
+            return self.make(Ref, node, head)
+        elif not ops and node[0].expr_name != 'exp':
+            return head
+        chain = self.make(Chain, node, head, ops, keys, record)
+        if record is None and not keys:
+            chain.record = chain
+        return chain
+
+    # expression:
+
+    def lower_number(self, node):
+        return self.make(Number, node, float(node.text) if '.' in node.text else int(node.text))
+
+    def lower_string(self, node):
+        body_node = node.find('string_body')[0]
+        style = body_node.expr_name
+        return self.make(String, node, node.find('string_macros').text, style,
+                         body_node.find('{}_contents'.format(style)).text,
+                         self.marker(body_node))
+
+    def items(self, node):
+        """sequence, mappingの中身"""
+        if not len(node):
+            return self.make(Empty, node)
+        return self.lower(node[0])
+
+    def lower_sequence_items(self, node):
+        return self.make(SequenceItems, node, tuple(self.lower(n) for n in node.findall('exp')))
+
+    def lower_mapping_items(self, node):
+        return self.make(MappingItems, node, tuple(
+            (self.lower(n.find('exp', 0)), self.lower(n.find('exp', 1)))
+            for n in node.findall('mapping_item')))
+
+    def lower_sequence_gen(self, node):
+        for_node = node.find('sequence_gen_for')
+        in_node = node.find('sequence_gen_in')
+        if_node = node.find('sequence_gen_if')
+        return self.make(SequenceGen, node,
+                         self.lower(for_node.find('exp')) if for_node else None,
+                         self.lower(in_node.find('assign_left')),
+                         self.lower(in_node.find('exp')),
+                         self.lower(if_node.find('exp')) if if_node else None)
+
+    def lower_mapping_gen(self, node):
+        for_node = node.find('mapping_gen_for')
+        in_node = node.find('mapping_gen_in')
+        if_node = node.find('mapping_gen_if')
+        return self.make(MappingGen, node,
+                         self.lower(for_node.find('exp', 0)) if for_node else None,
+                         self.lower(for_node.find('exp', 1)) if for_node else None,
+                         self.lower(in_node.find('assign_left')),
+                         self.lower(in_node.find('exp')),
+                         self.lower(if_node.find('exp')) if if_node else None)
+
+    def lower_table(self, node):
+        return self.make(Table, node, tuple(
+            (n.find('name').text, self.lower(n.find('exp')))
+            for n in node.findall('table_item')))
+
+    def lower_callable(self, node, cls=Callable):
+        params = []
+        for n in node.findall('callable_arg'):
+            name = n.find('name').text
+            arg_ope_node = n.find('callable_arg_ope')
+            if not arg_ope_node:
+                params.append(self.make(Param, n, name, None, False))
+            elif arg_ope_node[0].expr_name == 'callable_arg_ope_static':
+                params.append(self.make(Param, n, name, self.lower(n.find('exp')), False))
+            elif arg_ope_node[0].expr_name == 'callable_arg_ope_dynamic':
+                params.append(self.make(Param, n, name, self.expression(n.find('exp')), True))
+            else:
+                assert False
+        callable_ = self.make(cls, node, tuple(params), self.lower(node.find('block')), None)
+        # ツリーモードでは引数名と静的なデフォルト値を順に評価し、最後のものが記録される
+        if not params:
+            callable_.record = callable_
+        elif params[-1].default is None or params[-1].dynamic:
+            callable_.record = params[-1]
+        return callable_
+
+    def lower_async_callable(self, node):
+        return self.lower_callable(node[0], AsyncCallable)
+
+    # characters:
+
+    def lower_ref_name(self, node):
+        return self.make(Ref, node, node.text)
@@ -0,0 +1,1270 @@
+# -*- coding: utf-8 -*-
+
+import coroutines
+import exceptions
+import interpreter
+import optimizer
+import parallel
+import resolver
+import syntaxtree
+
+import ast
+import bisect
+import collections
+import functools
+import hashlib
+import importlib.util
+import itertools
+import keyword
+import marshal
+import os
+import sys
+import threading
+import types
+
+
+# 生成したコードから参照される実行時の補助
+
+class LagoonScope(collections.ChainMap):
+
+    """
+    生成したコードが用いる名前空間
+    参照に失敗したときはLagoonNameErrorを送出する
+    """
+
+    def __missing__(self, key):
+        raise exceptions.LagoonNameError(
+            '{} is currently not defined'.format(key))
+
+    def __getstate__(self):
+        # ビルトインと大域の名前空間は、送られた先のファイルのインタプリタのものにする
+        return self.maps[-1]['__interpreter__'], self.maps[:-2]
+
+    def __setstate__(self, state):
+        root, local_namespaces = state
+        self.maps = local_namespaces + [root.globals, root.builtins]
+
+
+class BreakLoop(BaseException):
+
+    """
+    複数のループを抜けるbreak
+    Lagoonのtryに捕まらないようBaseExceptionを継承する
+    """
+
+    def __init__(self, depth):
+        super().__init__(depth)
+        self.depth = depth
+
+
+class CompiledFunction(interpreter.LagoonCallable):
+
+    """
+    Pythonの関数にコンパイルされたLagoonの関数
+    LagoonFunctionと同じく定義時の名前空間を保持する
+    """
+
+    def __init__(self, body, arg_names,
+                 static_defaults, dynamic_defaults, namespace, position=None):
+        self.body = body
+        self.signature = interpreter.Signature(arg_names, static_defaults, dynamic_defaults)
+        self.namespace = namespace
+        # 本体の (行, 列)（文字列の式展開の中で定義した関数ではNone）
+        self.position = position
+
+    def __call__(self, *args, **kwargs):
+        arg_namespace = self.signature.bind(args, kwargs, call_default)
+        return self.body(self.namespace.new_child(arg_namespace))
+
+    def call_method(self, current, args, kwargs):
+        arg_namespace = self.signature.bind(args, kwargs, call_default, current)
+        return self.body(self.namespace.new_child(arg_namespace))
+
+    def location(self):
+        """関数の本体の位置（LagoonFunction.locationと同じく、本体のブロックの位置）"""
+        code = self.body.__code__
+        if self.position is None:
+            return interpreter.Location(code.co_filename, code.co_firstlineno, 0)
+        return interpreter.Location(code.co_filename, *self.position)
+
+    def __getstate__(self):
+        """別のプロセスへ送る状態（LagoonFunctionと同じく、参照する大域の値を持つ）"""
+        signature = self.signature
+        names = code_names(self.body.__code__)
+        for default in signature.dynamic_defaults.values():
+            default_names = code_names(default.__code__)
+            names = None if names is None or default_names is None else names | default_names
+        return (portable_function(self.body), signature.arg_names, signature.static_defaults,
+                {name: portable_function(default)
+                 for name, default in signature.dynamic_defaults.items()},
+                self.namespace, self.position,
+                interpreter.capture_globals(self.namespace.maps[-1]['__interpreter__'], names))
+
+    def __setstate__(self, state):
+        (body, arg_names, static_defaults, dynamic_defaults,
+         self.namespace, self.position, captured) = state
+        self.body = restore_function(body)
+        self.signature = interpreter.Signature(
+            arg_names, static_defaults,
+            {name: restore_function(default) for name, default in dynamic_defaults.items()})
+        interpreter.restore_globals(captured)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+class CompiledAsyncFunction(CompiledFunction):
+
+    """Pythonの関数にコンパイルされたLagoonの非同期関数（interpreter.LagoonAsyncFunctionを参照）"""
+
+    def __call__(self, *args, **kwargs):
+        arg_namespace = self.signature.bind(args, kwargs, call_default)
+        return coroutines.run_body(self.body, self.namespace.new_child(arg_namespace))
+
+    def call_method(self, current, args, kwargs):
+        arg_namespace = self.signature.bind(args, kwargs, call_default, current)
+        return coroutines.run_body(self.body, self.namespace.new_child(arg_namespace))
+
+
+class CompiledLoop(object):
+
+    """Pythonの関数にコンパイルされたparallel for文の本体（interpreter.ParallelLoopを参照）"""
+
+    def __init__(self, body, namespace):
+        self.body = body
+        self.namespace = namespace
+
+    def __call__(self, item):
+        try:
+            self.body(self.namespace.new_child(), item)
+        except BreakLoop:
+            raise exceptions.LagoonOtherError('Cannot break or return from parallel for')
+
+    def __getstate__(self):
+        return (portable_function(self.body), self.namespace,
+                interpreter.capture_globals(self.namespace.maps[-1]['__interpreter__'],
+                                            code_names(self.body.__code__)))
+
+    def __setstate__(self, state):
+        body, self.namespace, captured = state
+        self.body = restore_function(body)
+        interpreter.restore_globals(captured)
+
+
+def portable_function(function):
+    """生成したコードの関数を別のプロセスへ送る値（コードオブジェクトと自由変数の値）"""
+    return (marshal.dumps(function.__code__),
+            tuple(cell.cell_contents for cell in function.__closure__ or ()))
+
+
+def restore_function(state):
+    code, closure = state
+    return types.FunctionType(marshal.loads(code), runtime_globals(), None, None,
+                              tuple(types.CellType(value) for value in closure) or None)
+
+
+def code_names(code):
+    """
+    生成したコードが名前空間で参照しうる名前（文字列の定数）の集合
+    実行時に名前で参照しうるもの（実行時に求める文字列や、evalなど）を含めばNone
+    """
+    names = set()
+    pending = [code]
+    while pending:
+        code = pending.pop()
+        if '_rt_string' in code.co_names:
+            return None
+        for value in code.co_consts:
+            if isinstance(value, str):
+                names.add(value)
+            elif isinstance(value, types.CodeType):
+                pending.append(value)
+    return None if names & resolver.EVALUATING_NAMES else frozenset(names)
+
+
+AssignTuple = interpreter.AssignTuple
+LagoonTable = interpreter.LagoonTable
+OrderedDict = collections.OrderedDict
+LagoonOtherError = exceptions.LagoonOtherError
+apply_macros = interpreter.apply_macros
+await_ = coroutines.await_
+
+
+RUNTIME_NAMES = (
+    'AssignTuple', 'BreakLoop', 'CompiledAsyncFunction', 'CompiledFunction',
+    'LagoonOtherError', 'LagoonTable', 'OrderedDict', 'apply_macros', 'attr', 'await_',
+    'break_loop', 'matches', 'one_try', 'parallel_for', 'string', 'times', 'unpack')
+
+
+# スレッドごとの、最後に評価した大域で定義した関数のデフォルト値
+# (評価したときの関数の本体の外のフレーム, その実行位置, デフォルト値のコード)
+defaults = threading.local()
+
+
+def call_default(default):
+    """
+    ~=のデフォルト値（引数を取らない関数にコンパイルされている）の評価
+    ツリーモードでは大域で定義した関数のデフォルト値の評価は大域の実行位置を書き換えるので、
+    関数の本体の外の実行位置が進むまでのエラーは、その位置で報告する（located_errorを参照）
+    """
+    previous = getattr(defaults, 'last', None)
+    value = default()
+    code = default.__code__
+    if code.co_name.startswith('__lagoon'):
+        last = getattr(defaults, 'last', None)
+        if last is not previous and last is not None:
+            # 評価の中で評価した別のデフォルト値の位置が最後の位置になる
+            code = last[2]
+        frame = sys._getframe(1)
+        while frame is not None and not (frame.f_code.co_filename == code.co_filename
+                                         and frame.f_code.co_name.startswith('__lagoon')):
+            frame = frame.f_back
+        defaults.last = None if frame is None else (frame, frame.f_lasti, code)
+    return value
+
+
+def attr(obj, name):
+    """属性の参照（Lagoonの関数はobjをcurrentとして束縛する）"""
+    new_obj = getattr(obj, name)
+    if isinstance(new_obj, interpreter.LagoonCallable):
+        return interpreter.LagoonMethod(new_obj, obj)
+    return new_obj
+
+
+def unpack(value, length):
+    """多重代入する値の検査"""
+    try:
+        is_valid = length == len(value)
+    except TypeError:
+        raise exceptions.LagoonTypeError(
+            'Cannot multiple assign: value must be sequence')
+    if not is_valid:
+        raise exceptions.LagoonTypeError(
+            'Cannot multiple assign: length missmatch')
+    return tuple(value)
+
+
+def times(count):
+    if not isinstance(count, int):
+        raise exceptions.LagoonTypeError('Number of times to repeat must be int')
+    return count
+
+
+def parallel_for(body, namespace, container):
+    parallel.run_loop(CompiledLoop(body, namespace), container)
+
+
+def break_loop(depth):
+    """深さを指定したbreak（深さが0以下ならば何もしない）"""
+    if not isinstance(depth, int):
+        raise exceptions.LagoonTypeError('Depth must be int')
+    if depth > 0:
+        raise BreakLoop(depth)
+
+
+def matches(e, exception):
+    return not exception or isinstance(e, exception)
+
+
+def one_try(body, exception, alternative):
+    try:
+        return body()
+    except exception():
+        return alternative()
+
+
+def string(namespace, contents, kind, macros):
+    """コンパイル時に求められなかった文字列リテラルを実行時に求める"""
+    it = interpreter.LagoonInterpreter(namespace.maps[::-1])
+    if kind in {'dq_heredoc', 'dq_string'}:
+        contents = contents.encode('raw_unicode_escape').decode('unicode_escape')
+    if 'i' in macros:
+        contents = it.interpolation_re.sub(lambda m: str(it.eval_(m.group(1))), contents)
+    return apply_macros(contents, macros)
+
+
+# 生成するASTの部品
+
+def load(id_):
+    return ast.Name(id=id_, ctx=ast.Load())
+
+
+def store(id_):
+    return ast.Name(id=id_, ctx=ast.Store())
+
+
+def const(value):
+    return ast.Constant(value=value)
+
+
+def subscript(value, key, ctx):
+    if sys.version_info < (3, 9):
+        key = ast.Index(value=key)
+    return ast.Subscript(value=value, slice=key, ctx=ctx)
+
+
+def ns(name, ctx=None):
+    """名前空間の要素"""
+    return subscript(load('__ns__'), const(name), ctx or ast.Load())
+
+
+def rt(name):
+    """実行時の補助（モジュールの大域変数として渡す）"""
+    return load('_rt_{}'.format(name))
+
+
+def call(func, *args):
+    return ast.Call(func=func, args=list(args), keywords=[])
+
+
+def function_def(name, arg_name, body):
+    function = ast.parse('def {}({}):\n    pass'.format(name, arg_name)).body[0]
+    function.body = body or [ast.Pass()]
+    return function
+
+
+def lambda_(body):
+    function = ast.parse('lambda: None', mode='eval').body
+    function.body = body
+    return function
+
+
+def assign(target, value):
+    return ast.Assign(targets=[target], value=value)
+
+
+class LagoonTranspiler(object):
+
+    """
+    構文木をPythonのASTへ変換するトランスパイラ
+    Lagoonの名前はすべて名前空間__ns__を介して参照し、
+    Pythonのローカル変数は一時変数と関数の定義にのみ用いる
+    生成するASTにはLagoonのソース上の位置を与える
+    失敗しうる演算には、ツリーモードでその演算の時点のlast_nodeになるノードの位置を与える
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.line_starts = [0] + [i + 1 for i, c in enumerate(source) if c == '\n']
+        self.counter = itertools.count(1)
+        self.hoisted = []
+        self.loops = 0
+        self.raising_break = False
+        # parallel for文の本体の中か（breakとreturnはエラーにする）
+        self.parallel = False
+        # ツリーモードで最後に記録されるノード（変換した順に更新する）
+        self.last = None
+        # 関数の本体の外か（ツリーモードでファイルのインタプリタが評価する部分）
+        self.toplevel = True
+        # 生成する関数ごとのブロックの要素の位置 {関数の名前: {行: 列}}（lineイベントに用いる）
+        self.lines = {}
+        self.function_lines = {}
+
+    def transpile(self, program):
+        """ProgramをPythonのモジュールに変換"""
+        body = self.function_body(program.body, tail=False) if program.body else []
+        self.lines['__lagoon__'] = self.function_lines
+        lines = ast.parse('__lagoon_lines__ = {!r}'.format(self.lines)).body[0]
+        module = ast.Module(body=[lines, function_def('__lagoon__', '__ns__', body)],
+                            type_ignores=[])
+        return ast.fix_missing_locations(module)
+
+    def lines_of(self, name, convert):
+        """関数nameの本体をconvert()で変換し、本体のブロックの要素の位置を記録する"""
+        function_lines, self.function_lines = self.function_lines, {}
+        try:
+            return convert()
+        finally:
+            if self.function_lines:
+                self.lines[name] = self.function_lines
+            self.function_lines = function_lines
+
+    def temp(self, prefix='_t'):
+        return '{}{}'.format(prefix, next(self.counter))
+
+    def local_function(self, prefix):
+        """
+        生成する関数の名前
+        関数の本体の外では、エラーの位置をその関数の中で報告するように__lagoonで始める
+        """
+        return self.temp('__lagoon' + prefix if self.toplevel else prefix)
+
+    def position(self, offset):
+        lineno = bisect.bisect_right(self.line_starts, offset)
+        return lineno, offset - self.line_starts[lineno - 1]
+
+    def locate(self, py_node, node):
+        """
+        Pythonのノードにノードの位置を与える（式展開の中のノードには与えない）
+        構文木は終了位置を持たないので、終了位置は開始位置と同じにする
+        """
+        if node.src is self.source:
+            py_node.lineno, py_node.col_offset = self.position(node.pos)
+            py_node.end_lineno, py_node.end_col_offset = py_node.lineno, py_node.col_offset
+        return py_node
+
+    # general:
+
+    def function_body(self, block_node, tail):
+        """関数本体の変換（外へ抜けるbreakは関数を抜ける）"""
+        loops, raising_break, parallel_ = self.loops, self.raising_break, self.parallel
+        self.loops, self.raising_break, self.parallel = 0, False, False
+        body = self.block(block_node, tail)
+        if self.raising_break:
+            handler = ast.parse(
+                'try:\n    pass\n'
+                'except _rt_BreakLoop:\n'
+                '    return None').body[0]
+            handler.body = body
+            body = [handler]
+        self.loops, self.raising_break, self.parallel = loops, raising_break, parallel_
+        return body
+
+    def block(self, node, tail=False):
+        """
+        ブロックを文の列に変換
+        tailならばブロックの値を返す文を末尾に置く
+        """
+        stats = []
+        children = node.stats
+        for index, child in enumerate(children):
+            is_tail = tail and index == len(children) - 1
+            if not isinstance(child, syntaxtree.Comment) and child.src is self.source:
+                # ツリーモードと同じく要素ごとにlineイベントを発生させる（trace_lineを参照）
+                line, column = self.position(child.pos)
+                self.function_lines.setdefault(line, column)
+                stats.append(self.locate(ast.Pass(), child))
+            hoisted, self.hoisted = self.hoisted, []
+            converted = self.tail_stat(child) if is_tail else self.stat(child)
+            stats.extend(self.hoisted)
+            stats.extend(converted)
+            self.hoisted = hoisted
+        return stats
+
+    def body(self, node, tail=False):
+        return self.block(node, tail) or [ast.Pass()]
+
+    def stat(self, node):
+        if isinstance(node, syntaxtree.Comment):
+            return []
+        elif isinstance(node, syntaxtree.Exp):
+            return [self.locate(ast.Expr(value=self.exp(node)), node)]
+        self.last = node
+        convert = getattr(self, 'stat_{}'.format(node.kind))
+        return convert(node)
+
+    def tail_stat(self, node):
+        if isinstance(node, syntaxtree.Exp):
+            return [self.locate(ast.Return(value=self.exp(node)), node)]
+        elif isinstance(node, (syntaxtree.If, syntaxtree.Try)):
+            return getattr(self, 'stat_{}'.format(node.kind))(node, tail=True)
+        stats = self.stat(node)
+        if not (stats and isinstance(stats[-1], (ast.Return, ast.Raise))):
+            stats.append(ast.Return(value=None))
+        return stats
+
+    # statement:
+
+    def stat_assign(self, node):
+        stats = []
+        targets = self.targets(node.targets, stats)
+        if isinstance(node.value, syntaxtree.Values):
+            value = call(rt('AssignTuple'),
+                         ast.Tuple(elts=[self.exp(n) for n in node.value.values], ctx=ast.Load()))
+        else:
+            value = self.exp(node.value)
+
+        if node.op is not None:
+            if len(targets) > 1:
+                stats.append(self.locate(ast.Expr(value=value), node))
+                stats.append(self.locate(ast.Raise(exc=call(rt('LagoonOtherError'), const(
+                    'combined assign operator cannot used for multiple assignment')), cause=None),
+                    self.last))
+                return stats
+            # ツリーモードと同じく右辺に左辺の値を作用させる
+            combined = self.temp()
+            ope = {
+                'add': ast.Add,
+                'sub': ast.Sub,
+                'mul': ast.Mult,
+                'div': ast.Div,
+            }[node.op]
+            current = node.current
+            stats.append(self.locate(assign(store(combined), value), node))
+            if isinstance(current, syntaxtree.Chain):
+                self.last = current
+                current_value = self.chain(current)
+            else:
+                current_value = self.exp(current)
+            stats.append(self.locate(ast.AugAssign(target=store(combined), op=ope(),
+                                                   value=current_value), self.last))
+            value = load(combined)
+
+        stats.extend(self.assign_targets(targets, value))
+        return stats
+
+    def targets(self, targets_node, stats):
+        """
+        代入先を (種類, オブジェクト, 名前またはキー) の組の列にする
+        オブジェクトとキーは一時変数に入れ、その代入をstatsに加える
+        """
+        targets = []
+        self.last = targets_node
+        for target in targets_node.targets:
+            if isinstance(target, syntaxtree.NameTarget):
+                targets.append(('name', None, target.name))
+                continue
+            keys = self.chain_keys(target.obj)
+            init = self.chain(target.obj, keys)
+            if isinstance(target, syntaxtree.AttrTarget):
+                kind, key = 'attr', target.name
+            elif isinstance(target.index, syntaxtree.Index):
+                kind, key = 'index', keys[target.index.slot]
+            else:
+                kind, key = 'index', const(target.index.value)
+            obj = self.temp()
+            stats.append(self.locate(assign(store(obj), init), targets_node))
+            if kind == 'index':
+                index = self.temp()
+                stats.append(self.locate(assign(store(index), key), targets_node))
+                key = load(index)
+            targets.append((kind, load(obj), key))
+        return targets
+
+    def target(self, target):
+        kind, obj, key = target
+        if kind == 'name':
+            return ns(key, ast.Store())
+        elif kind == 'attr':
+            if keyword.iskeyword(key):
+                return None
+            return ast.Attribute(value=obj, attr=key, ctx=ast.Store())
+        elif kind == 'index':
+            return subscript(obj, key, ast.Store())
+        else:
+            assert False
+
+    def assign_targets(self, targets, value):
+        """代入先への代入文（最後に変換した値の位置を与える）"""
+        last = self.last
+        if len(targets) > 1:
+            values = self.temp()
+            stats = [self.locate(assign(store(values), call(rt('unpack'), value, const(len(targets)))),
+                                 last)]
+            for index, target in enumerate(targets):
+                stats.extend(self.assign_targets(
+                    [target], subscript(load(values), const(index), ast.Load())))
+            return stats
+        target, = targets
+        py_target = self.target(target)
+        if py_target is None:
+            _, obj, key = target
+            return [self.locate(ast.Expr(value=call(load('setattr'), obj, const(key), value)), last)]
+        return [self.locate(assign(self.locate(py_target, last), value), last)]
+
+    def stat_if(self, node, tail=False):
+        orelse = [ast.Return(value=None)] if tail else []
+        for condition_node, block_node in reversed(node.branches):
+            body = self.body(block_node, tail)
+            if condition_node is None:
+                orelse = body
+            else:
+                orelse = [self.locate(ast.If(test=self.exp(condition_node),
+                                             body=body, orelse=orelse), condition_node)]
+        return orelse
+
+    def loop(self, make_loop):
+        """ループの変換（内側から複数のループを抜けるbreakがあれば例外で受ける）"""
+        raising_break, self.raising_break = self.raising_break, False
+        self.loops += 1
+        loop = make_loop()
+        self.loops -= 1
+        if self.raising_break:
+            handler = ast.parse(
+                'try:\n    pass\n'
+                'except _rt_BreakLoop as _b:\n'
+                '    _b.depth -= 1\n'
+                '    if _b.depth > 0:\n'
+                '        raise').body[0]
+            handler.body = [loop]
+            loop = handler
+        self.raising_break = self.raising_break or raising_break
+        return [loop]
+
+    def stat_while(self, node):
+        return self.loop(lambda: self.locate(ast.While(
+            test=self.exp(node.condition), body=self.body(node.body), orelse=[]), node))
+
+    def stat_for(self, node):
+        def make_loop():
+            container = self.exp(node.iter)
+            stats = []
+            targets = self.targets(node.targets, stats)
+            if len(targets) == 1 and targets[0][0] == 'name':
+                target = self.target(targets[0])
+            else:
+                value = self.temp()
+                target = store(value)
+                stats.extend(self.assign_targets(targets, load(value)))
+            body = stats + self.body(node.body)
+            return self.locate(ast.For(target=target, iter=container,
+                                       body=body, orelse=[]), node)
+        return self.loop(make_loop)
+
+    def stat_parallel_for(self, node):
+        """本体を、子の名前空間を作って代入する関数にし、反復する値ごとにワーカーで呼び出す"""
+        container = self.exp(node.iter)
+        name = self.temp('_p')
+        item = self.temp()
+        stats = []
+        targets = self.targets(node.targets, stats)
+        stats.extend(self.assign_targets(targets, load(item)))
+        loops, raising_break, parallel_ = self.loops, self.raising_break, self.parallel
+        self.loops, self.raising_break, self.parallel = 0, False, True
+        body = stats + self.lines_of(name, lambda: self.block(node.body))
+        self.loops, self.raising_break, self.parallel = loops, raising_break, parallel_
+        self.hoisted.append(self.locate(function_def(name, '__ns__, {}'.format(item), body), node))
+        return [self.locate(ast.Expr(value=call(rt('parallel_for'), load(name), load('__ns__'),
+                                                container)), node)]
+
+    def parallel_exit(self, node):
+        """parallel for文の本体を抜けるbreak, return"""
+        return [self.locate(ast.Raise(exc=call(rt('LagoonOtherError'), const(
+            'Cannot break or return from parallel for')), cause=None), node)]
+
+    def stat_times(self, node):
+        def make_loop():
+            count = self.exp(node.count)
+            count = self.locate(call(rt('times'), count), self.last)
+            return self.locate(ast.For(target=store('_'), iter=call(load('range'), count),
+                                       body=self.body(node.body), orelse=[]), node)
+        return self.loop(make_loop)
+
+    def stat_continue(self, node):
+        if self.loops:
+            return [self.locate(ast.Continue(), node)]
+        # ループの外ではツリーモードと同じく関数を抜ける（返り値はNone）
+        return [self.locate(ast.Return(value=None), node)]
+
+    def stat_break(self, node):
+        if node.depth is None:
+            if self.loops:
+                return [self.locate(ast.Break(), node)]
+            elif self.parallel:
+                return self.parallel_exit(node)
+            return [self.locate(ast.Return(value=None), node)]
+        self.raising_break = True
+        depth = self.exp(node.depth)
+        return [self.locate(ast.Expr(value=self.locate(call(rt('break_loop'), depth), self.last)),
+                            node)]
+
+    def stat_return(self, node):
+        if self.parallel:
+            return self.parallel_exit(node)
+        value = self.exp(node.value) if node.value else None
+        return [self.locate(ast.Return(value=value), node)]
+
+    def stat_try(self, node, tail=False):
+        body = self.body(node.body, tail)
+        error = self.temp('_e')
+        # 例外の型は前から順に評価するので、先に変換して再送出の位置を求める
+        exceptions_ = []
+        for handler_node in node.handlers:
+            exceptions_.append(self.exp(handler_node.exception) if handler_node.exception else None)
+            if handler_node.name:
+                self.last = handler_node.name
+        orelse = [self.locate(ast.Raise(exc=load(error), cause=None), self.last)]
+        for handler_node, exception in reversed(list(zip(node.handlers, exceptions_))):
+            handler = self.body(handler_node.body, tail)
+            if handler_node.name:
+                handler.insert(0, assign(ns(handler_node.name.name, ast.Store()), load(error)))
+            if exception is None:
+                orelse = handler
+            else:
+                orelse = [self.locate(ast.If(
+                    test=call(rt('matches'), load(error), exception),
+                    body=handler, orelse=orelse), handler_node)]
+        handler = ast.ExceptHandler(type=load('Exception'), name=error, body=orelse)
+        return [self.locate(ast.Try(body=body, handlers=[handler],
+                                    orelse=[], finalbody=[]), node)]
+
+    def stat_raise(self, node):
+        exc = self.exp(node.value) if node.value else None
+        return [self.locate(ast.Raise(exc=exc, cause=None), self.last)]
+
+    def stat_assert(self, node):
+        error = ast.Raise(exc=load('AssertionError'), cause=None)
+        if not node.value:
+            return [self.locate(error, node)]
+        test = ast.UnaryOp(op=ast.Not(), operand=self.exp(node.value))
+        self.locate(error, self.last)
+        return [self.locate(ast.If(test=test, body=[error], orelse=[]), node)]
+
+    # expression:
+
+    def exp(self, node):
+        """式の変換（子を変換した後に最後に記録されたノードの位置を与える）"""
+        self.last = node
+        convert = getattr(self, 'exp_{}'.format(node.kind))
+        py_node = convert(node)
+        return self.locate(py_node, self.last)
+
+    def exp_await(self, node):
+        return call(rt('await_'), self.exp(node.value))
+
+    def exp_range(self, node):
+        start = self.exp(node.start) if node.start else const(0)
+        stop = self.exp(node.stop)
+        if node.closed:
+            stop = ast.BinOp(left=stop, op=ast.Add(), right=const(1))
+        return call(load('range'), start, stop)
+
+    def exp_chain(self, node):
+        return self.chain(node)
+
+    def chain_keys(self, node):
+        """インデックスのキーを変換し、ツリーモードでキーの後に記録されるノードを記録する"""
+        keys = [self.exp(key) for key in node.keys]
+        if node.record is not None:
+            self.last = node.record
+        return keys
+
+    def chain(self, node, keys=None):
+        """
+        チェーンの変換（Pythonではインデックスのキーも左から順に評価する）
+        位置はツリーモードと同じく、キーを先に評価したものとして与える
+        """
+        if keys is None:
+            keys = self.chain_keys(node)
+        if isinstance(node.head, str):
+            result = self.locate(ns(node.head), self.last)
+        else:
+            result = self.exp(node.head)
+        for op in node.ops:
+            if isinstance(op, syntaxtree.Call):
+                result = self.call(result, op.args)
+            elif isinstance(op, syntaxtree.Attr):
+                result = call(rt('attr'), result, const(op.name))
+            elif isinstance(op, syntaxtree.Index):
+                result = subscript(result, keys[op.slot], ast.Load())
+            elif isinstance(op, syntaxtree.ConstIndex):
+                result = subscript(result, const(op.value), ast.Load())
+            else:
+                assert False
+            self.locate(result, self.last)
+        return result
+
+    def call(self, func, arg_nodes):
+        args = []
+        keywords = []
+        for arg_node in arg_nodes:
+            value = self.exp(arg_node.value)
+            if arg_node.name is not None:
+                self.last = arg_node
+                keywords.append((arg_node.name, value))
+            else:
+                args.append(value)
+        names = [name for name, _ in keywords]
+        if len(set(names)) < len(names) or any(map(keyword.iskeyword, names)):
+            # Pythonのキーワード引数にできない場合は辞書で渡す
+            mapping = ast.Dict(keys=[const(name) for name in names],
+                               values=[value for _, value in keywords])
+            keywords = [ast.keyword(arg=None, value=mapping)]
+        else:
+            keywords = [ast.keyword(arg=name, value=value) for name, value in keywords]
+        return ast.Call(func=func, args=args, keywords=keywords)
+
+    def binary(self, node, op):
+        return ast.BinOp(left=self.exp(node.left), op=op(), right=self.exp(node.right))
+
+    def compare(self, node, op):
+        return ast.Compare(left=self.exp(node.left), ops=[op()],
+                           comparators=[self.exp(node.right)])
+
+    def exp_pow(self, node):
+        return self.binary(node, ast.Pow)
+
+    def exp_pos(self, node):
+        return ast.UnaryOp(op=ast.UAdd(), operand=self.exp(node.operand))
+
+    def exp_neg(self, node):
+        return ast.UnaryOp(op=ast.USub(), operand=self.exp(node.operand))
+
+    def exp_mul(self, node):
+        return self.binary(node, ast.Mult)
+
+    def exp_truediv(self, node):
+        return self.binary(node, ast.Div)
+
+    def exp_mod(self, node):
+        return self.binary(node, ast.Mod)
+
+    def exp_add(self, node):
+        return self.binary(node, ast.Add)
+
+    def exp_sub(self, node):
+        return self.binary(node, ast.Sub)
+
+    def exp_lt(self, node):
+        return self.compare(node, ast.Lt)
+
+    def exp_le(self, node):
+        return self.compare(node, ast.LtE)
+
+    def exp_eq(self, node):
+        return self.compare(node, ast.Eq)
+
+    def exp_ne(self, node):
+        return self.compare(node, ast.NotEq)
+
+    def exp_ge(self, node):
+        return self.compare(node, ast.GtE)
+
+    def exp_gt(self, node):
+        return self.compare(node, ast.Gt)
+
+    def exp_is_(self, node):
+        return self.compare(node, ast.Is)
+
+    def exp_contains(self, node):
+        return self.compare(node, ast.In)
+
+    def exp_not_(self, node):
+        return ast.UnaryOp(op=ast.Not(), operand=self.exp(node.operand))
+
+    def exp_and_(self, node):
+        return ast.BoolOp(op=ast.And(), values=[self.exp(node.left), self.exp(node.right)])
+
+    def exp_or_(self, node):
+        return ast.BoolOp(op=ast.Or(), values=[self.exp(node.left), self.exp(node.right)])
+
+    def exp_isa(self, node):
+        return call(load('isinstance'), self.exp(node.left), self.exp(node.right))
+
+    def exp_one_if(self, node):
+        return ast.IfExp(test=self.exp(node.test), body=self.exp(node.body),
+                         orelse=self.exp(node.orelse))
+
+    def exp_one_try(self, node):
+        return call(rt('one_try'), *[lambda_(self.exp(n))
+                                     for n in (node.body, node.exception, node.alternative)])
+
+    def exp_number(self, node):
+        return const(node.value)
+
+    def exp_constant(self, node):
+        self.last = node.last
+        return const(node.value)
+
+    def exp_string(self, node):
+        macros = node.macros
+        try:
+            self.last = node.body
+            string = interpreter.string_body(node)
+            self.last = node
+            value = self.interpolation(string) if 'i' in macros else const(string)
+            # 式展開の中のノードはソース上の位置を持たないので、文字列の位置にする
+            self.last = node
+        except Exception:
+            # 式展開の構文エラーなどはツリーモードと同じく実行時に送出させる
+            return call(rt('string'), load('__ns__'),
+                        const(node.contents), const(node.style), const(macros))
+
+        rest = macros.replace('i', '')
+        if not rest:
+            return value
+        if '~' not in rest and isinstance(value, ast.Constant):
+            try:
+                return const(apply_macros(value.value, rest))
+            except Exception:
+                pass
+        return call(rt('apply_macros'), value, const(rest))
+
+    def interpolation(self, string):
+        """式展開をf文字列に変換"""
+        import lagoon
+        values = []
+        pattern = interpreter.LagoonInterpreter.interpolation_re
+        last = 0
+        for match in pattern.finditer(string):
+            if match.start() > last:
+                values.append(const(string[last:match.start()]))
+            expression = lagoon.lower_expression(match.group(1))
+            values.append(ast.FormattedValue(value=self.exp(expression.body),
+                                             conversion=ord('s'), format_spec=None))
+            last = match.end()
+        if last < len(string):
+            values.append(const(string[last:]))
+        return ast.JoinedStr(values=values)
+
+    def sequence(self, node, struct):
+        """
+        要素の列をstructの値に変換
+        内包表記はリストを返す関数にする（リストならばそのまま値とする）
+        """
+        items = node.items
+        if isinstance(items, syntaxtree.Empty):
+            return call(struct, call(load('iter'), ast.Tuple(elts=[], ctx=ast.Load())))
+        elif isinstance(items, syntaxtree.SequenceItems):
+            return call(struct, ast.List(elts=[self.exp(n) for n in items.values],
+                                         ctx=ast.Load()))
+        elif isinstance(items, syntaxtree.MappingItems):
+            return call(struct, ast.List(elts=[
+                ast.Tuple(elts=[self.exp(key), self.exp(value)], ctx=ast.Load())
+                for key, value in items.items], ctx=ast.Load()))
+        values = self.generator(items, collect=True)
+        return values if struct.id == 'list' else call(struct, values)
+
+    def generator(self, node, collect=False):
+        """
+        内包表記を、子の名前空間を作って代入するジェネレータ関数の呼び出しにする
+        collectならば要素のリストを返す関数にする
+        """
+        container = self.exp(node.iter)
+
+        name = self.local_function('_g')
+        item = self.temp()
+        stats = []
+        targets = self.targets(node.targets, stats)
+        stats.extend(self.assign_targets(targets, load(item)))
+        if isinstance(node, syntaxtree.SequenceGen):
+            elem = self.exp(node.element) if node.element else load(item)
+        elif node.key:
+            elem = ast.Tuple(elts=[self.exp(node.key), self.exp(node.value)], ctx=ast.Load())
+        else:
+            elem = load(item)
+        if collect:
+            add = ast.Expr(value=call(ast.Attribute(value=load('_values'), attr='append',
+                                                    ctx=ast.Load()), elem))
+        else:
+            add = ast.Expr(value=ast.Yield(value=elem))
+        if node.condition:
+            add = ast.If(test=self.exp(node.condition), body=[add], orelse=[])
+        body = [ast.For(target=store(item), iter=load('_items'),
+                        body=stats + [add], orelse=[])]
+        if collect:
+            body.insert(0, assign(store('_values'), ast.List(elts=[], ctx=ast.Load())))
+            body.append(ast.Return(value=load('_values')))
+        self.hoisted.append(self.locate(function_def(name, '__ns__, _items', body), node))
+        new_child = call(ast.Attribute(value=load('__ns__'), attr='new_child', ctx=ast.Load()))
+        return call(load(name), new_child, container)
+
+    def exp_list(self, node):
+        return self.sequence(node, load('list'))
+
+    def exp_tuple(self, node):
+        return self.sequence(node, load('tuple'))
+
+    def exp_set(self, node):
+        return self.sequence(node, load('set'))
+
+    def exp_frozenset(self, node):
+        return self.sequence(node, load('frozenset'))
+
+    def exp_generator(self, node):
+        # 単独のsequenceはジェネレータとして振る舞う
+        items = node.items
+        if isinstance(items, syntaxtree.Empty):
+            return call(load('iter'), ast.Tuple(elts=[], ctx=ast.Load()))
+        elif isinstance(items, syntaxtree.SequenceItems):
+            return ast.GeneratorExp(
+                elt=call(load('_f')),
+                generators=[ast.comprehension(
+                    target=store('_f'),
+                    iter=ast.Tuple(elts=[lambda_(self.exp(n)) for n in items.values],
+                                   ctx=ast.Load()),
+                    ifs=[], is_async=0)])
+        return self.generator(items)
+
+    def exp_dict(self, node):
+        return self.sequence(node, load('dict'))
+
+    def exp_ordereddict(self, node):
+        return self.sequence(node, rt('OrderedDict'))
+
+    def exp_table(self, node):
+        mapping = ast.Dict(keys=[], values=[])
+        for name, value in node.items:
+            mapping.keys.append(const(name))
+            mapping.values.append(self.exp(value))
+        return ast.Call(func=rt('LagoonTable'), args=[],
+                        keywords=[ast.keyword(arg=None, value=mapping)])
+
+    def exp_ref_name(self, node):
+        return ns(node.name)
+
+    def exp_callable(self, node):
+        arg_names = []
+        static_defaults = ast.Dict(keys=[], values=[])
+        dynamic_defaults = ast.Dict(keys=[], values=[])
+        for param in node.params:
+            arg_names.append(const(param.name))
+            if param.default is None:
+                pass
+            elif param.dynamic:
+                # 呼び出すときに評価するので、記録されるノードを変えない
+                last = self.last
+                default = self.local_function('_d')
+                value = self.exp(param.default.body)
+                # return文は評価の最後に記録されるノードの位置にする（located_errorを参照）
+                self.hoisted.append(self.locate(function_def(default, '', [
+                    self.locate(ast.Return(value=value), self.last)]), param.default))
+                dynamic_defaults.keys.append(const(param.name))
+                dynamic_defaults.values.append(load(default))
+                self.last = last
+            else:
+                static_defaults.keys.append(const(param.name))
+                static_defaults.values.append(self.exp(param.default))
+        if node.record is not None:
+            self.last = node.record
+        last, toplevel = self.last, self.toplevel
+        name = self.temp('_f')
+        self.toplevel = False
+        body = self.lines_of(name, lambda: self.function_body(node.body, tail=True))
+        self.last, self.toplevel = last, toplevel
+        self.hoisted.append(self.locate(function_def(name, '__ns__', body), node))
+        function_class = 'CompiledAsyncFunction' if node.coroutine else 'CompiledFunction'
+        # call, returnイベントの位置は他のモードと同じく本体のブロックの位置にする
+        position = self.position(node.body.pos) if node.body.src is self.source else None
+        return call(rt(function_class), load(name),
+                    ast.Tuple(elts=arg_names, ctx=ast.Load()),
+                    static_defaults, dynamic_defaults, load('__ns__'), const(position))
+
+
+# コンパイルとキャッシュ
+
+def transpile(code, program):
+    """構文木に変換したLagoonのソースコードを変換したPythonのモジュールのASTを返す"""
+    return LagoonTranspiler(code).transpile(program)
+
+
+def cache_paths(file_path):
+    """生成する.pyと.pycのパス"""
+    directory, name = os.path.split(file_path)
+    cache_directory = os.path.join(directory, '__pycache__')
+    return (os.path.join(cache_directory, '{}.py'.format(name)),
+            os.path.join(cache_directory, '{}.{}.pyc'.format(
+                name, sys.implementation.cache_tag)))
+
+
+# 文法とビルトインの名前のハッシュ（最初に.pycを読み書きするときに求める）
+toolchain_digest = None
+
+
+def toolchain_key():
+    """
+    文法（演算子の解析を含む）とビルトインの名前のハッシュ
+    これらが変わると同じソースでも変換結果が変わるので、.pycのヘッダに記録する
+    """
+    global toolchain_digest
+    if toolchain_digest is None:
+        import lagoon
+        digest = hashlib.sha1(lagoon.grammar_hash.encode('utf8'))
+        digest.update('\n'.join(sorted(interpreter.builtin_names())).encode('utf8'))
+        toolchain_digest = digest.digest()
+    return toolchain_digest
+
+
+def pyc_header(file_path):
+    """ソースの更新時刻と大きさ、文法とビルトインの名前のハッシュを記録した.pycのヘッダ"""
+    stat = os.stat(file_path)
+    header = bytearray(importlib.util.MAGIC_NUMBER)
+    if sys.version_info >= (3, 7):
+        header.extend((0).to_bytes(4, 'little'))
+    header.extend((int(stat.st_mtime) & 0xFFFFFFFF).to_bytes(4, 'little'))
+    header.extend((stat.st_size & 0xFFFFFFFF).to_bytes(4, 'little'))
+    header.extend(toolchain_key())
+    return bytes(header)
+
+
+def compile_file(file_path, write=True):
+    """
+    Lagoonファイルをコードオブジェクトにコンパイルする
+    writeならば変換したPythonのソースと.pycを__pycache__に書き出す
+    """
+    import lagoon
+    code, root_node = lagoon.parse_file(file_path)
+    with lagoon.timing('compile {}'.format(os.path.basename(file_path))):
+        program = optimizer.optimize(syntaxtree.lower(root_node))
+        # 生成するコードは名前で参照するが、未定義の名前の検査は他のモードと揃える
+        resolver.resolve(program, interpreter.builtin_names())
+        module = transpile(code, program)
+        code_object = compile(module, file_path, 'exec')
+    if write:
+        py_path, pyc_path = cache_paths(file_path)
+        # 書き込み途中の.pycを他のプロセス（スレッド）が読まないよう、置き換えで保存する
+        temp_path = '{}.{}.{}'.format(pyc_path, os.getpid(), threading.get_ident())
+        try:
+            os.makedirs(os.path.dirname(pyc_path), exist_ok=True)
+            if hasattr(ast, 'unparse'):
+                with open(py_path, 'w', encoding='utf8') as f:
+                    f.write(ast.unparse(module))
+            with open(temp_path, 'wb') as f:
+                f.write(pyc_header(file_path) + marshal.dumps(code_object))
+            os.replace(temp_path, pyc_path)
+        except OSError:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+    return code_object
+
+
+def load_file(file_path):
+    """
+    Lagoonファイルのコードオブジェクトを返す
+    ソースとトランスパイラ（構文木への変換、定数の畳み込みと名前の解決を含む）より新しく、
+    文法とビルトインの名前が変わっていない.pycがあればそれを読む
+    畳み込みを無効にしている間は.pycを読み書きしない
+    """
+    if not optimizer.enabled:
+        return compile_file(file_path, write=False)
+    _, pyc_path = cache_paths(file_path)
+    try:
+        if os.path.getmtime(pyc_path) >= max(os.path.getmtime(__file__),
+                                             os.path.getmtime(syntaxtree.__file__),
+                                             os.path.getmtime(optimizer.__file__),
+                                             os.path.getmtime(resolver.__file__)):
+            with open(pyc_path, 'rb') as f:
+                data = f.read()
+            header = pyc_header(file_path)
+            if data[:len(header)] == header:
+                return marshal.loads(data[len(header):])
+    except (OSError, ValueError, EOFError, TypeError):
+        pass
+    return compile_file(file_path)
+
+
+def runtime_globals():
+    """生成したコードの大域変数（実行時の補助）"""
+    module = sys.modules[__name__]
+    return {'_rt_{}'.format(name): getattr(module, name) for name in RUNTIME_NAMES}
+
+
+def run(code_object, it):
+    """コードオブジェクトをインタプリタの名前空間で実行する（トップレベルのreturn文の値を返す）"""
+    globals_ = runtime_globals()
+    exec(code_object, globals_)
+    try:
+        return globals_['__lagoon__'](LagoonScope(*reversed(it.namespaces)))
+    except (exceptions.LagoonInterpreterError, exceptions.LagoonLoadError):
+        raise
+    except:
+        raise located_error(code_object.co_filename, sys.exc_info()[2])
+    finally:
+        # 実行を終えたフレームを保持しない
+        defaults.last = None
+
+
+def located_error(file_path, tb):
+    """
+    関数の本体の外で最後に実行していた位置を示すエラーを生成
+    （ツリーモードと同じく、関数の中のエラーは呼び出した位置で、
+    関数の本体の外の内包表記と~=のデフォルト値の中のエラーはその位置で報告する）
+    その位置から関数を呼び出して大域で定義した関数のデフォルト値を評価していれば、デフォルト値の
+    評価の最後の位置で報告する（call_defaultを参照、内包表記の中ではツリーモードと同じく内包表記の位置）
+    """
+    location_ = None
+    # 同じフレームで再送出した例外は、フレームの最初の項目が最後の位置になる
+    frames = set()
+    while tb is not None:
+        code = tb.tb_frame.f_code
+        if (code.co_filename == file_path and code.co_name.startswith('__lagoon')
+                and tb.tb_frame not in frames):
+            frames.add(tb.tb_frame)
+            location_ = tb
+        tb = tb.tb_next
+    last = getattr(defaults, 'last', None)
+    if (last is not None and location_ is not None and last[0] is location_.tb_frame
+            and last[1] == location_.tb_lasti
+            and not location_.tb_frame.f_code.co_name.startswith('__lagoon_g')):
+        line, column = code_end(last[2])
+        return exceptions.LagoonInterpreterError(
+            'error at line {0}, column {1}'.format(line, column))
+    if location_ is None:
+        return exceptions.LagoonInterpreterError('error in {}'.format(file_path))
+    columns = code_columns(location_.tb_frame.f_code)
+    index = location_.tb_lasti // 2
+    column = columns[index] if index < len(columns) else 0
+    return exceptions.LagoonInterpreterError(
+        'error at line {0}, column {1}'.format(location_.tb_lineno, column))
+
+
+# トレース:
+
+def traced_run(run):
+    """
+    生成したコードの実行をsys.settraceで監視するrunを返す
+    実行中に始まるスレッド（非同期関数の本体やスレッドプール）もthreading.settraceで監視する
+    """
+    def run_(code_object, it):
+        previous = sys.gettrace()
+        previous_threading = threading.gettrace() if hasattr(threading, 'gettrace') else None
+        sys.settrace(trace_frame)
+        threading.settrace(trace_frame)
+        try:
+            return run(code_object, it)
+        finally:
+            sys.settrace(previous)
+            threading.settrace(previous_threading)
+    return run_
+
+
+def trace_frame(frame, event, arg):
+    """生成したコードのフレームだけを監視する"""
+    if '__lagoon__' in frame.f_globals:
+        return trace_line
+    return None
+
+
+def trace_line(frame, event, arg):
+    """
+    生成したコードの行をline, exceptionイベントとして報告する
+    lineイベントは、他のモードと同じくブロックの要素の始まる行だけを、その要素の位置で報告する
+    （要素の途中で行が変わったときや、内包表記の中などでは報告しない）
+    """
+    if event == 'line':
+        code = frame.f_code
+        column = frame.f_globals['__lagoon_lines__'].get(code.co_name, {}).get(frame.f_lineno)
+        if column is not None:
+            interpreter.trace('line', interpreter.Location(code.co_filename, frame.f_lineno, column),
+                              None)
+    elif event == 'exception':
+        interpreter.trace('exception', frame_location(frame), arg[1])
+    return trace_line
+
+
+@functools.lru_cache(maxsize=256)
+def code_columns(code):
+    """命令ごとの列（Python 3.11以上、それより前は全て0とする）"""
+    if not hasattr(code, 'co_positions'):
+        return ()
+    return tuple(position[2] or 0 for position in code.co_positions())
+
+
+def code_end(code):
+    """コードの最後の命令（return文）の (行, 列)（Python 3.11より前は列を0とする）"""
+    line, column = code.co_firstlineno, 0
+    if not hasattr(code, 'co_positions'):
+        return line, column
+    for start_line, _, start_column, _ in code.co_positions():
+        if start_line is not None:
+            line, column = start_line, start_column or 0
+    return line, column
+
+
+def frame_location(frame):
+    """フレームが実行している位置"""
+    columns = code_columns(frame.f_code)
+    index = frame.f_lasti // 2
+    column = columns[index] if index < len(columns) else 0
+    return interpreter.Location(frame.f_code.co_filename, frame.f_lineno, column)
+
+
+interpreter.register_traced(CompiledFunction, '__call__', interpreter.traced_call(CompiledFunction.__call__))
+interpreter.register_traced(CompiledFunction, 'call_method',
+                            interpreter.traced_call(CompiledFunction.call_method))
+interpreter.register_traced(sys.modules[__name__], 'run', traced_run(run))
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+# 実行モードの比較
+# sample/*.lgn（または引数で与えたファイル）をツリーモードと他の実行モードで新しいプロセスで実行し、
+# 標準出力と、エラーで終わった場合の報告された位置（error at line ..., column ...）を比較する
+# 関数やジェネレータなどのオブジェクトの表現は実行モードごとに異なるので比較しない
+# 異なる結果があれば終了コード1で終わる
+
+import argparse
+import glob
+import os
+import re
+import subprocess
+import sys
+
+SAMPLE_DIR = os.path.dirname(os.path.abspath(__file__))
+LAGOON_DIR = os.path.normpath(os.path.join(SAMPLE_DIR, '..', 'lagoon'))
+
+OBJECT_RE = re.compile(r'<[\w.]+ object(?: \S+)? at 0x[0-9a-fA-F]+>')
+LOCATION_RE = re.compile(r'error at line \d+, column \d+')
+
+
+def run(file_path, mode, timeout):
+    """(標準出力, 報告されたエラーの位置（無ければNone）) を返す"""
+    try:
+        process = subprocess.run(
+            [sys.executable, '-W', 'ignore', LAGOON_DIR, file_path, '--mode', mode],
+            cwd=os.path.dirname(file_path), stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return None, 'timeout'
+    stdout = OBJECT_RE.sub('<object>', process.stdout.decode('utf8', 'replace'))
+    locations = LOCATION_RE.findall(process.stderr.decode('utf8', 'replace'))
+    return stdout, locations[-1] if locations else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Lagoonの実行モードごとの実行結果を比較する')
+    parser.add_argument('files', nargs='*', help='比較するLagoonファイル（省略すればsample/*.lgn）')
+    parser.add_argument('--modes', nargs='+', default=['closure', 'stack', 'python'],
+                        help='ツリーモードと比較する実行モード')
+    parser.add_argument('--timeout', type=float, default=60, help='一回の実行の制限時間（秒）')
+    args = parser.parse_args()
+
+    files = args.files or sorted(glob.glob(os.path.join(SAMPLE_DIR, '*.lgn')))
+    differences = 0
+    for file_path in files:
+        file_path = os.path.abspath(file_path)
+        expected = run(file_path, 'tree', args.timeout)
+        results = []
+        for mode in args.modes:
+            result = run(file_path, mode, args.timeout)
+            if result == expected:
+                results.append('{} ok'.format(mode))
+                continue
+            differences += 1
+            if result[0] != expected[0]:
+                results.append('{} output differs'.format(mode))
+            else:
+                results.append('{} {} (tree {})'.format(mode, result[1], expected[1]))
+        print('{:<24}{}'.format(os.path.basename(file_path), ', '.join(results)))
+
+    if differences:
+        print('{} difference(s)'.format(differences))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()